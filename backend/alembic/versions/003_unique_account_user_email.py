@@ -0,0 +1,50 @@
+"""Add unique (account_id, email) constraint on users for sync upserts
+
+Revision ID: 003_unique_account_user_email
+Revises: 002_add_advanced_features
+Create Date: 2024-01-02 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003_unique_account_user_email'
+down_revision = '002_add_advanced_features'
+branch_labels = None
+depends_on = None
+
+
+# Tables holding a users.id foreign key
+USER_REFERENCES = ('recipient_assignments', 'sending_batches')
+
+
+def upgrade() -> None:
+    # Point rows that reference a duplicate user at the oldest row for that
+    # (account_id, email), which is the one kept below
+    for table in USER_REFERENCES:
+        op.execute(f"""
+            UPDATE {table} t
+            SET user_id = d.keep_id
+            FROM (
+                SELECT id, min(id) OVER (PARTITION BY account_id, email) AS keep_id
+                FROM users
+            ) d
+            WHERE t.user_id = d.id
+              AND d.id <> d.keep_id
+        """)
+    
+    # Drop duplicate users left behind by the old delete+insert sync, keeping the oldest row
+    op.execute("""
+        DELETE FROM users a
+        USING users b
+        WHERE a.account_id = b.account_id
+          AND a.email = b.email
+          AND a.id > b.id
+    """)
+    op.create_unique_constraint('uq_users_account_id_email', 'users', ['account_id', 'email'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_users_account_id_email', 'users', type_='unique')
@@ -0,0 +1,51 @@
+"""Add denormalized recipient counters to campaigns
+
+Revision ID: 004_campaign_counters
+Revises: 003_unique_account_user_email
+Create Date: 2024-01-03 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004_campaign_counters'
+down_revision = '003_unique_account_user_email'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('campaigns', sa.Column('recipient_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('campaigns', sa.Column('sent_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('campaigns', sa.Column('failed_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('campaigns', sa.Column('sending_count', sa.Integer(), nullable=False, server_default='0'))
+    
+    # Backfill counters for existing campaigns. status is compared as text:
+    # 'SENDING' was added to the enum by 002 in this same transaction, and
+    # PostgreSQL rejects an uncommitted enum value used as an enum literal
+    op.execute("""
+        UPDATE campaigns c SET
+            recipient_count = s.total,
+            sent_count = s.sent,
+            failed_count = s.failed,
+            sending_count = s.sending
+        FROM (
+            SELECT campaign_id,
+                   count(*) AS total,
+                   count(*) FILTER (WHERE status::text = 'SENT') AS sent,
+                   count(*) FILTER (WHERE status::text = 'FAILED') AS failed,
+                   count(*) FILTER (WHERE status::text = 'SENDING') AS sending
+            FROM recipients
+            GROUP BY campaign_id
+        ) s
+        WHERE c.id = s.campaign_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('campaigns', 'sending_count')
+    op.drop_column('campaigns', 'failed_count')
+    op.drop_column('campaigns', 'sent_count')
+    op.drop_column('campaigns', 'recipient_count')
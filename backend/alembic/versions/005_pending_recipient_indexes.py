@@ -0,0 +1,36 @@
+"""Add partial pending-recipient and assignment lookup indexes
+
+Revision ID: 005_pending_recipient_indexes
+Revises: 004_campaign_counters
+Create Date: 2024-01-04 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005_pending_recipient_indexes'
+down_revision = '004_campaign_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_recipients_campaign_pending', 'recipients', ['campaign_id', 'id'],
+            unique=False, postgresql_where=sa.text("status = 'PENDING'"), postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_recipient_assignments_campaign_user_batch', 'recipient_assignments',
+            ['campaign_id', 'user_id', 'batch_number'], unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_recipient_assignments_campaign_user_batch', table_name='recipient_assignments',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_recipients_campaign_pending', table_name='recipients', postgresql_concurrently=True)
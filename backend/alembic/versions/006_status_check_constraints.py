@@ -0,0 +1,59 @@
+"""Store status columns as VARCHAR with CHECK constraints instead of enum types
+
+Revision ID: 006_status_check_constraints
+Revises: 005_pending_recipient_indexes
+Create Date: 2024-01-05 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006_status_check_constraints'
+down_revision = '005_pending_recipient_indexes'
+branch_labels = None
+depends_on = None
+
+# (table, PostgreSQL enum type, stored values)
+STATUS_COLUMNS = (
+    ('users', 'userstatus', ('ACTIVE', 'INACTIVE', 'RATE_LIMITED', 'ERROR')),
+    ('campaigns', 'campaignstatus', ('DRAFT', 'PREPARING', 'READY', 'SENDING', 'PAUSED', 'COMPLETED', 'FAILED')),
+    ('recipients', 'recipientstatus', ('PENDING', 'ASSIGNED', 'SENDING', 'SENT', 'FAILED')),
+)
+
+
+def _in_list(values) -> str:
+    return ', '.join(f"'{value}'" for value in values)
+
+
+def _recreate_pending_index() -> None:
+    op.create_index(
+        'ix_recipients_campaign_pending', 'recipients', ['campaign_id', 'id'],
+        unique=False, postgresql_where=sa.text("status = 'PENDING'")
+    )
+
+
+def upgrade() -> None:
+    # The partial index predicate is typed against the enum; rebuild it after the change
+    op.drop_index('ix_recipients_campaign_pending', table_name='recipients')
+    
+    for table, enum_name, values in STATUS_COLUMNS:
+        op.alter_column(table, 'status', type_=sa.String(16), existing_nullable=True,
+                        postgresql_using='status::text')
+        op.create_check_constraint(f'ck_{table}_status', table, f"status IN ({_in_list(values)})")
+        op.execute(f'DROP TYPE {enum_name}')
+    
+    _recreate_pending_index()
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipients_campaign_pending', table_name='recipients')
+    
+    for table, enum_name, values in STATUS_COLUMNS:
+        op.drop_constraint(f'ck_{table}_status', table, type_='check')
+        op.execute(f'CREATE TYPE {enum_name} AS ENUM ({_in_list(values)})')
+        op.alter_column(table, 'status', type_=sa.Enum(*values, name=enum_name), existing_nullable=True,
+                        postgresql_using=f'status::{enum_name}')
+    
+    _recreate_pending_index()
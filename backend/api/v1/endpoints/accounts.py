@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Response, Query
 from sqlalchemy.orm import Session
-from typing import List
-import json
+from typing import List, Optional
+import orjson
 import asyncio
 
 import crud
 import schemas
 from database import get_db
+from utils.pagination import set_next_cursor
 from utils.gmail_service import validate_gmail_credentials, get_workspace_users
 
 router = APIRouter()
@@ -27,8 +28,8 @@ async def create_account(
         
         # Validate JSON format
         try:
-            json.loads(credentials_json)
-        except json.JSONDecodeError:
+            orjson.loads(credentials_json)
+        except orjson.JSONDecodeError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid JSON file format"
@@ -52,43 +53,47 @@ async def create_account(
         )
 
 
+def _account_with_users(account, users) -> schemas.AccountWithUsers:
+    return schemas.AccountWithUsers(
+        id=account.id,
+        name=account.name,
+        admin_email=account.admin_email,
+        active=account.active,
+        user_count=account.user_count,
+        daily_quota=account.daily_quota,
+        hourly_quota=account.hourly_quota,
+        created_at=account.created_at,
+        last_sync_at=account.last_sync_at,
+        users=[schemas.User(
+            id=u.id,
+            email=u.email,
+            name=u.name,
+            status=u.status,
+            daily_sent_count=u.daily_sent_count,
+            hourly_sent_count=u.hourly_sent_count,
+            last_sent_at=u.last_sent_at,
+            last_error=u.last_error
+        ) for u in users]
+    )
+
+
 @router.get("/accounts", response_model=List[schemas.AccountWithUsers])
 def list_accounts(
-    skip: int = 0,
+    response: Response,
+    after_id: Optional[int] = None,
     limit: int = 100,
     include_users: bool = True,
+    skip: int = Query(0, deprecated=True),
     db: Session = Depends(get_db)
 ):
-    """Get all accounts with users"""
-    accounts = crud.get_accounts(db=db, skip=skip, limit=limit)
+    """Get accounts with users (keyset paginated: pass X-Next-Cursor back as after_id)"""
+    accounts = crud.get_accounts(db=db, after_id=after_id, limit=limit, skip=skip)
+    set_next_cursor(response, accounts, limit)
     
     if include_users:
-        result = []
-        for account in accounts:
-            users = crud.get_account_users(db=db, account_id=account.id)
-            account_with_users = schemas.AccountWithUsers(
-                id=account.id,
-                name=account.name,
-                admin_email=account.admin_email,
-                active=account.active,
-                user_count=account.user_count,
-                daily_quota=account.daily_quota,
-                hourly_quota=account.hourly_quota,
-                created_at=account.created_at,
-                last_sync_at=account.last_sync_at,
-                users=[schemas.User(
-                    id=u.id,
-                    email=u.email,
-                    name=u.name,
-                    status=u.status,
-                    daily_sent_count=u.daily_sent_count,
-                    hourly_sent_count=u.hourly_sent_count,
-                    last_sent_at=u.last_sent_at,
-                    last_error=u.last_error
-                ) for u in users]
-            )
-            result.append(account_with_users)
-        return result
+        # One users query for the page instead of one per account
+        users_by_account = crud.get_users_for_accounts(db=db, account_ids=[account.id for account in accounts])
+        return [_account_with_users(account, users_by_account[account.id]) for account in accounts]
     else:
         return [schemas.Account(
             id=a.id,
@@ -103,6 +108,18 @@ def list_accounts(
         ) for a in accounts]
 
 
+@router.post("/accounts/batch", response_model=List[schemas.AccountWithUsers])
+def get_accounts_batch(
+    batch: schemas.AccountBatchGet,
+    db: Session = Depends(get_db)
+):
+    """Get several accounts with their users in one request; unknown ids are omitted"""
+    account_ids = list(dict.fromkeys(batch.ids))
+    accounts = crud.get_accounts_by_ids(db=db, account_ids=account_ids)
+    users_by_account = crud.get_users_for_accounts(db=db, account_ids=[account.id for account in accounts])
+    return [_account_with_users(account, users_by_account[account.id]) for account in accounts]
+
+
 @router.get("/accounts/{account_id}", response_model=schemas.Account)
 def get_account(
     account_id: int,
@@ -148,6 +165,26 @@ def delete_account(
         )
 
 
+@router.post("/accounts/batch-delete", response_model=schemas.AccountBatchDeleteResult)
+def batch_delete_accounts(
+    batch: schemas.AccountBatchDelete,
+    db: Session = Depends(get_db)
+):
+    """Delete several accounts and their credentials in one request"""
+    try:
+        deleted = crud.delete_accounts(db=db, account_ids=batch.ids)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete accounts: {str(e)}"
+        )
+    deleted_set = set(deleted)
+    return schemas.AccountBatchDeleteResult(
+        deleted=deleted,
+        not_found=[account_id for account_id in dict.fromkeys(batch.ids) if account_id not in deleted_set]
+    )
+
+
 @router.post("/accounts/validate", response_model=schemas.AccountValidationResult)
 def validate_account_credentials(
     validation_data: schemas.AccountValidation,
@@ -162,7 +199,7 @@ def validate_account_credentials(
     if result.get('valid'):
         # Get user count from workspace
         try:
-            credentials_dict = json.loads(validation_data.credentials_json)
+            credentials_dict = orjson.loads(validation_data.credentials_json)
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             try:
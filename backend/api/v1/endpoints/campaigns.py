@@ -1,21 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Response, File, UploadFile, Form, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import asyncio
-import json
+import io
+import orjson
 
 import crud
 import schemas
-from database import get_db
+from database import SessionLocal, get_db
+from utils.pagination import set_next_cursor
 from models import CampaignStatus
-from utils.ultra_fast_sender import UltraFastSender, ThreadedUltraFastSender
+from utils.ultra_fast_sender import UltraFastSender
 from utils.email_sender import email_sender
-from utils.gmail_service import validate_user_sending_capability, distribute_recipients_across_users
+from utils.gmail_service import (validate_user_sending_capability, distribute_recipients_across_users,
+                                 RecipientRef, SenderRef)
 from tasks import send_campaign_task
 
 router = APIRouter()
 
 
+def _campaign_response(db: Session, db_campaign) -> schemas.Campaign:
+    # Get stats for the response
+    stats = crud.get_advanced_campaign_stats(db=db, campaign_id=db_campaign.id)
+    
+    # Convert to response model
+    campaign_response = schemas.Campaign(
+        id=db_campaign.id,
+        name=db_campaign.name,
+        from_name=db_campaign.from_name,
+        from_email=db_campaign.from_email,
+        subject=db_campaign.subject,
+        status=db_campaign.status,
+        custom_headers=db_campaign.custom_headers,
+        test_email=db_campaign.test_email,
+        selected_accounts=db_campaign.selected_accounts,
+        send_rate_per_minute=db_campaign.send_rate_per_minute,
+        preparation_started_at=db_campaign.preparation_started_at,
+        preparation_completed_at=db_campaign.preparation_completed_at,
+        sending_started_at=db_campaign.sending_started_at,
+        sending_completed_at=db_campaign.sending_completed_at,
+        created_at=db_campaign.created_at,
+        stats=stats
+    )
+    return campaign_response
+
+
 @router.post("/campaigns", response_model=schemas.Campaign, status_code=status.HTTP_201_CREATED)
 def create_campaign(
     campaign: schemas.CampaignCreate,
@@ -24,31 +53,48 @@ def create_campaign(
     """Create a new advanced campaign"""
     try:
         db_campaign = crud.create_advanced_campaign(db=db, campaign=campaign)
-        
-        # Get stats for the response
-        stats = crud.get_advanced_campaign_stats(db=db, campaign_id=db_campaign.id)
-        
-        # Convert to response model
-        campaign_response = schemas.Campaign(
-            id=db_campaign.id,
-            name=db_campaign.name,
-            from_name=db_campaign.from_name,
-            from_email=db_campaign.from_email,
-            subject=db_campaign.subject,
-            status=db_campaign.status,
-            custom_headers=db_campaign.custom_headers,
-            test_email=db_campaign.test_email,
-            selected_accounts=db_campaign.selected_accounts,
-            send_rate_per_minute=db_campaign.send_rate_per_minute,
-            preparation_started_at=db_campaign.preparation_started_at,
-            preparation_completed_at=db_campaign.preparation_completed_at,
-            sending_started_at=db_campaign.sending_started_at,
-            sending_completed_at=db_campaign.sending_completed_at,
-            created_at=db_campaign.created_at,
-            stats=stats
+        return _campaign_response(db, db_campaign)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to create campaign: {str(e)}"
         )
-        
-        return campaign_response
+
+
+@router.post("/campaigns/upload", response_model=schemas.Campaign, status_code=status.HTTP_201_CREATED)
+def create_campaign_from_upload(
+    name: str = Form(...),
+    from_name: str = Form(...),
+    from_email: str = Form(...),
+    subject: str = Form(...),
+    html_body: str = Form(...),
+    recipients_csv: UploadFile = File(...),
+    test_email: Optional[str] = Form(None),
+    send_rate_per_minute: Optional[int] = Form(None),
+    custom_headers: Optional[str] = Form(None),
+    selected_accounts: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Create a campaign from a multipart upload; the recipients CSV is parsed line
+    by line from the spooled file, custom_headers and selected_accounts are JSON
+    """
+    try:
+        campaign = schemas.CampaignCreate(
+            name=name,
+            from_name=from_name,
+            from_email=from_email,
+            subject=subject,
+            html_body=html_body,
+            recipients_csv='',
+            test_email=test_email or None,
+            send_rate_per_minute=send_rate_per_minute,
+            custom_headers=orjson.loads(custom_headers) if custom_headers else None,
+            selected_accounts=orjson.loads(selected_accounts) if selected_accounts else None
+        )
+        lines = io.TextIOWrapper(recipients_csv.file, encoding='utf-8-sig', newline='')
+        db_campaign = crud.create_advanced_campaign(db=db, campaign=campaign, recipient_lines=lines)
+        return _campaign_response(db, db_campaign)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -58,12 +104,15 @@ def create_campaign(
 
 @router.get("/campaigns", response_model=List[schemas.Campaign])
 def list_campaigns(
-    skip: int = 0,
+    response: Response,
+    after_id: Optional[int] = None,
     limit: int = 100,
+    skip: int = Query(0, deprecated=True),
     db: Session = Depends(get_db)
 ):
-    """Get all campaigns with advanced stats"""
-    campaigns = crud.get_campaigns(db=db, skip=skip, limit=limit)
+    """Get campaigns with advanced stats (keyset paginated: pass X-Next-Cursor back as after_id)"""
+    campaigns = crud.get_campaigns(db=db, after_id=after_id, limit=limit, skip=skip)
+    set_next_cursor(response, campaigns, limit)
     
     result = []
     for campaign in campaigns:
@@ -212,7 +261,7 @@ async def send_campaign_ultra_fast(
     use_threading: bool = True,
     db: Session = Depends(get_db)
 ):
-    """Send campaign using ultra-fast method"""
+    """Send campaign using ultra-fast method (use_threading is accepted for older clients and ignored)"""
     campaign = crud.get_campaign(db=db, campaign_id=campaign_id)
     if not campaign:
         raise HTTPException(
@@ -226,25 +275,20 @@ async def send_campaign_ultra_fast(
             detail="Campaign must be prepared (READY status) before sending"
         )
     
-    # Choose sending method based on preference
-    if use_threading:
-        # Use threaded sender for maximum performance
-        def send_threaded():
-            sender = ThreadedUltraFastSender(db, campaign_id)
-            result = sender.send_campaign_threaded(max_workers=200)
-            return result
-        
-        background_tasks.add_task(send_threaded)
-    else:
-        # Use async sender
-        async def send_async():
-            sender = UltraFastSender(db, campaign_id)
-            result = await sender.send_campaign_ultra_fast()
-            return result
-        
-        background_tasks.add_task(send_async)
+    # The async sender (pooled HTTP, batch requests) outperforms the removed
+    # 200-thread sender, so it is used regardless of use_threading.
+    # The send outlives the request, so it owns a session instead of borrowing db
+    async def send_async():
+        send_db = SessionLocal()
+        try:
+            sender = UltraFastSender(send_db, campaign_id)
+            return await sender.send_campaign_ultra_fast()
+        finally:
+            send_db.close()
     
-    return {"message": "Ultra-fast sending started", "method": "threaded" if use_threading else "async"}
+    background_tasks.add_task(send_async)
+    
+    return {"message": "Ultra-fast sending started", "method": "async"}
 
 
 @router.post("/campaigns/{campaign_id}/test-email")
@@ -310,9 +354,10 @@ def send_test_email(
 @router.get("/campaigns/{campaign_id}/progress", response_model=schemas.SendingProgress)
 def get_campaign_progress(
     campaign_id: int,
+    recompute: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Get real-time campaign sending progress"""
+    """Get real-time campaign sending progress (recompute=1 reconciles the counters)"""
     campaign = crud.get_campaign(db=db, campaign_id=campaign_id)
     if not campaign:
         raise HTTPException(
@@ -320,7 +365,7 @@ def get_campaign_progress(
             detail="Campaign not found"
         )
     
-    return crud.get_sending_progress(db=db, campaign_id=campaign_id)
+    return crud.get_sending_progress(db=db, campaign_id=campaign_id, recompute=recompute)
 
 
 @router.get("/campaigns/{campaign_id}/assignments")
@@ -343,8 +388,7 @@ def get_campaign_assignments(
     for assignment in assignments:
         user_id = assignment.user_id
         if user_id not in user_assignments:
-            user = crud.get_account_users(db, assignment.user.account_id)
-            user_info = next((u for u in user if u.id == user_id), None)
+            user_info = assignment.user
             if user_info:
                 user_assignments[user_id] = {
                     'user_email': user_info.email,
@@ -403,11 +447,9 @@ async def send_campaign_with_user_delegation(
         )
     
     # Check if there are active users in selected accounts
-    total_users = 0
-    for account in selected_accounts:
-        users = crud.get_account_users(db=db, account_id=account.id)
-        active_users = [u for u in users if u.status == 'Active']
-        total_users += len(active_users)
+    users_by_account = crud.get_users_for_accounts(db=db, account_ids=[account.id for account in selected_accounts])
+    total_users = sum(1 for users in users_by_account.values() for u in users
+                      if u.status == crud.UserStatus.ACTIVE)
     
     if total_users == 0:
         raise HTTPException(
@@ -443,7 +485,7 @@ async def send_campaign_with_proper_delegation(campaign_id: int, selected_accoun
         result = await email_sender.send_campaign_emails(campaign_id, selected_account_ids)
         
         # Update campaign status based on results
-        db = crud.SessionLocal()
+        db = SessionLocal()
         try:
             campaign = db.query(crud.Campaign).filter(crud.Campaign.id == campaign_id).first()
             if campaign:
@@ -464,7 +506,7 @@ async def send_campaign_with_proper_delegation(campaign_id: int, selected_accoun
             
     except Exception as e:
         # Mark campaign as failed
-        db = crud.SessionLocal()
+        db = SessionLocal()
         try:
             campaign = db.query(crud.Campaign).filter(crud.Campaign.id == campaign_id).first()
             if campaign:
@@ -520,8 +562,7 @@ async def test_user_sending_capability(
     
     # Load credentials and test user capability
     try:
-        credentials_data = crud.decrypt_data(account.credentials_path)
-        credentials_dict = json.loads(credentials_data)
+        credentials_dict = crud.get_account_credentials(account)
         
         result = validate_user_sending_capability(credentials_dict, user_email)
         
@@ -567,47 +608,35 @@ def preview_user_distribution(
     
     # Get all users from selected accounts
     all_users = []
+    account_names = {}
     accounts = crud.get_accounts_by_ids(db=db, account_ids=campaign.selected_accounts)
     
     for account in accounts:
         account_users = db.query(crud.User).filter(
             crud.User.account_id == account.id,
-            crud.User.status == 'Active'
+            crud.User.status == crud.UserStatus.ACTIVE
         ).all()
         
+        account_names[account.id] = account.name
         for user in account_users:
-            all_users.append({
-                'email': user.email,
-                'name': user.name,
-                'status': user.status,
-                'account_id': account.id,
-                'account_name': account.name
-            })
+            all_users.append(SenderRef(user.email, user.name, user.status.value, account.id))
     
     # Convert recipients to proper format
-    recipient_list = [
-        {
-            'id': r.id,
-            'email': r.email,
-            'name': r.name,
-            'custom_data': r.custom_data or {}
-        }
-        for r in recipients
-    ]
+    recipient_list = [RecipientRef(r.id, r.email, r.name, r.custom_data or {}) for r in recipients]
     
     # Get distribution preview
     distribution = distribute_recipients_across_users(recipient_list, all_users, campaign_id)
     
     # Format for response
     distribution_summary = {}
-    for user_email, user_recipients in distribution.items():
-        user_info = next((u for u in all_users if u['email'] == user_email), None)
+    for user_email, (start, end) in distribution.items():
+        user_info = next((u for u in all_users if u.email == user_email), None)
         distribution_summary[user_email] = {
-            'user_name': user_info['name'] if user_info else 'Unknown',
-            'account_name': user_info['account_name'] if user_info else 'Unknown',
-            'recipient_count': len(user_recipients),
-            'recipients': [r['email'] for r in user_recipients[:5]],  # First 5 for preview
-            'has_more': len(user_recipients) > 5
+            'user_name': user_info.name if user_info else 'Unknown',
+            'account_name': account_names.get(user_info.account_id, 'Unknown') if user_info else 'Unknown',
+            'recipient_count': end - start,
+            'recipients': [r.email for r in recipient_list[start:min(start + 5, end)]],  # First 5 for preview
+            'has_more': end - start > 5
         }
     
     return {
@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
+from typing import List, Optional
 
 import crud
 import schemas
 from database import get_db
+from utils.pagination import set_next_cursor
 from models import Campaign, Recipient, Account, User
 
 router = APIRouter()
@@ -118,11 +119,13 @@ def get_database_stats(db: Session = Depends(get_db)):
 @router.get("/campaigns/{campaign_id}/recipients", response_model=List[schemas.Recipient])
 def get_campaign_recipients(
     campaign_id: int,
-    skip: int = 0,
+    response: Response,
+    after_id: Optional[int] = None,
     limit: int = 1000,
+    skip: int = Query(0, deprecated=True),
     db: Session = Depends(get_db)
 ):
-    """Get recipients for a specific campaign"""
+    """Get recipients for a specific campaign (keyset paginated: pass X-Next-Cursor back as after_id)"""
     try:
         campaign = crud.get_campaign(db=db, campaign_id=campaign_id)
         if not campaign:
@@ -131,9 +134,10 @@ def get_campaign_recipients(
                 detail="Campaign not found"
             )
         
-        recipients = db.query(Recipient).filter(
-            Recipient.campaign_id == campaign_id
-        ).offset(skip).limit(limit).all()
+        recipients = crud.get_campaign_recipients_page(
+            db=db, campaign_id=campaign_id, after_id=after_id, limit=limit, skip=skip
+        )
+        set_next_cursor(response, recipients, limit)
         
         return recipients
         
@@ -0,0 +1,47 @@
+"""
+One-shot database bootstrap for the init-db service and startup scripts:
+create the tables and stamp alembic at head in one interpreter, so models
+are imported only once
+"""
+import sys
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from database import engine
+from models import Base
+
+# Exit status when the tables exist but alembic could not be stamped
+STAMP_FAILED = 2
+
+
+def main() -> int:
+    try:
+        # One reflection query for the existing table names replaces
+        # create_all's has_table round trip per model table
+        existing = set(inspect(engine).get_table_names())
+        missing = [table for table in Base.metadata.sorted_tables if table.name not in existing]
+        if missing:
+            Base.metadata.create_all(bind=engine, tables=missing, checkfirst=False)
+    except Exception as e:
+        print(f"❌ Error creating tables: {e}")
+        return 1
+    print(f"✅ Database tables created successfully ({len(missing)} new)")
+
+    try:
+        # Stamp over the application engine's pooled connection rather than
+        # a second engine and handshake built by alembic/env.py
+        config = Config("alembic.ini")
+        with engine.begin() as connection:
+            config.attributes["connection"] = connection
+            command.stamp(config, "head")
+    except Exception as e:
+        print(f"Note: Alembic stamp failed, but tables were created ({e})")
+        return STAMP_FAILED
+    print("Database initialized successfully")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,49 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy import case, column, delete, func, insert, lambda_stmt, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Dict, Iterable, List, Optional
+import csv
+import io
 import os
-import json
+import orjson
 import uuid
 import asyncio
-from datetime import datetime
+import tempfile
+import threading
+import time
+import logging
+from datetime import datetime, timedelta, timezone
 
 from models import (Account, Campaign, Recipient, CampaignStatus, RecipientStatus, 
                    User, UserStatus, RecipientAssignment, SendingBatch)
 import schemas
 from utils.encryption import encrypt_data, decrypt_data
-from utils.gmail_service import get_workspace_users
+from utils.gmail_service import build_service, get_service_account_credentials, get_workspace_users
 from core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Decrypted credentials keyed by account id -> ((credentials_path, mtime), cached at, credentials)
+_credentials_cache = {}
+_credentials_cache_lock = threading.Lock()
+CREDENTIALS_CACHE_SIZE = 256
+CREDENTIALS_CACHE_TTL = 3600
+
+# Recipient uploads larger than this are streamed in with COPY instead of INSERT
+COPY_RECIPIENTS_THRESHOLD = 1000
+
 
 # Account CRUD operations
 def create_account(db: Session, account: schemas.AccountCreate) -> Account:
     """Create a new account with encrypted credentials and automatically sync users"""
+    # Validate credentials first so nothing is written for rejected uploads
+    credentials_dict = orjson.loads(account.credentials_json)
+    from utils.gmail_service import validate_gmail_credentials
+    validation_result = validate_gmail_credentials(credentials_dict, account.admin_email)
+    
+    if not validation_result.get('valid'):
+        raise Exception(f"Invalid credentials: {validation_result.get('error')}")
+    
     # Create uploads directory if it doesn't exist
     os.makedirs(settings.upload_dir, exist_ok=True)
     
@@ -25,18 +51,14 @@ def create_account(db: Session, account: schemas.AccountCreate) -> Account:
     credentials_filename = f"account_{uuid.uuid4().hex}.json"
     credentials_path = os.path.join(settings.upload_dir, credentials_filename)
     
-    # Encrypt and save credentials
-    encrypted_credentials = encrypt_data(account.credentials_json)
-    with open(credentials_path, 'w') as f:
+    # Encrypt and atomically publish credentials (temp file + rename); the payload
+    # is small, so write it unbuffered in one call and only fsync when configured
+    encrypted_credentials = encrypt_data(account.credentials_json).encode()
+    with tempfile.NamedTemporaryFile('wb', buffering=0, dir=settings.upload_dir, suffix='.tmp', delete=False) as f:
         f.write(encrypted_credentials)
-    
-    # Validate credentials first
-    credentials_dict = json.loads(account.credentials_json)
-    from utils.gmail_service import validate_gmail_credentials
-    validation_result = validate_gmail_credentials(credentials_dict, account.admin_email)
-    
-    if not validation_result.get('valid'):
-        raise Exception(f"Invalid credentials: {validation_result.get('error')}")
+        if settings.durable_credentials:
+            os.fsync(f.fileno())
+    os.replace(f.name, credentials_path)
     
     db_account = Account(
         name=account.name,
@@ -53,14 +75,14 @@ def create_account(db: Session, account: schemas.AccountCreate) -> Account:
     try:
         sync_result = sync_workspace_users(db, db_account.id, credentials_dict, account.admin_email)
         if sync_result.get('success'):
-            print(f"Successfully synced {sync_result.get('user_count', 0)} users for account {db_account.name}")
+            logger.info(f"Successfully synced {sync_result.get('user_count', 0)} users for account {db_account.name}")
             # Update user count
             db_account.user_count = sync_result.get('user_count', 0)
             db.commit()
         else:
-            print(f"Warning: Failed to sync users for account {db_account.name}: {sync_result.get('error')}")
+            logger.warning(f"Failed to sync users for account {db_account.name}: {sync_result.get('error')}")
     except Exception as e:
-        print(f"Warning: User sync failed for account {db_account.name}: {str(e)}")
+        logger.warning(f"User sync failed for account {db_account.name}: {str(e)}")
     
     return db_account
 
@@ -68,9 +90,6 @@ def create_account(db: Session, account: schemas.AccountCreate) -> Account:
 def sync_workspace_users(db: Session, account_id: int, credentials_dict: dict, admin_email: str):
     """Sync users from Google Workspace using Admin Directory API"""
     try:
-        from google.oauth2.service_account import Credentials
-        from googleapiclient.discovery import build
-        
         # Required scopes for Gmail and Admin Directory
         SCOPES = [
             'https://www.googleapis.com/auth/gmail.send',
@@ -85,12 +104,12 @@ def sync_workspace_users(db: Session, account_id: int, credentials_dict: dict, a
         ]
         
         # Create credentials with admin delegation
-        credentials = Credentials.from_service_account_info(
+        credentials = get_service_account_credentials(
             credentials_dict, scopes=SCOPES
         ).with_subject(admin_email)
         
         # Build Admin Directory service
-        admin_service = build('admin', 'directory_v1', credentials=credentials, cache_discovery=False)
+        admin_service = build_service('admin', 'directory_v1', credentials)
         
         # Get domain from admin email
         domain = admin_email.split('@')[1]
@@ -99,11 +118,11 @@ def sync_workspace_users(db: Session, account_id: int, credentials_dict: dict, a
         users = []
         page_token = None
         
-        print(f"Fetching users from domain: {domain}")
+        logger.info(f"Fetching users from domain: {domain}")
         
         while True:
             try:
-                print(f"Fetching users page with token: {page_token}")
+                logger.debug(f"Fetching users page with token: {page_token}")
                 result = admin_service.users().list(
                     domain=domain,
                     maxResults=500,
@@ -113,15 +132,17 @@ def sync_workspace_users(db: Session, account_id: int, credentials_dict: dict, a
                 ).execute()
                 
                 domain_users = result.get('users', [])
-                print(f"Retrieved {len(domain_users)} users from API page")
+                logger.info(f"Retrieved {len(domain_users)} users from API page")
                 
+                debug_enabled = logger.isEnabledFor(logging.DEBUG)
                 for user in domain_users:
                     user_email = user.get('primaryEmail', '')
                     user_name = user.get('name', {}).get('fullName', user_email)
                     is_suspended = user.get('suspended', False)
                     is_archived = user.get('archived', False)
                     
-                    print(f"Processing user: {user_email}, suspended: {is_suspended}, archived: {is_archived}")
+                    if debug_enabled:
+                        logger.debug(f"Processing user: {user_email}, suspended: {is_suspended}, archived: {is_archived}")
                     
                     # Include ALL non-suspended, non-archived users
                     if not is_suspended and not is_archived and user_email:
@@ -136,67 +157,101 @@ def sync_workspace_users(db: Session, account_id: int, credentials_dict: dict, a
                             'isAdmin': user.get('isAdmin', False),
                             'isDelegatedAdmin': user.get('isDelegatedAdmin', False)
                         })
-                        print(f"Added user: {user_email}")
-                    else:
-                        print(f"Skipped user: {user_email} (suspended: {is_suspended}, archived: {is_archived})")
+                        if debug_enabled:
+                            logger.debug(f"Added user: {user_email}")
+                    elif debug_enabled:
+                        logger.debug(f"Skipped user: {user_email} (suspended: {is_suspended}, archived: {is_archived})")
                 
                 # Check for next page
                 page_token = result.get('nextPageToken')
-                print(f"Next page token: {page_token}")
+                logger.debug(f"Next page token: {page_token}")
                 
                 if not page_token:
-                    print("No more pages, stopping pagination")
+                    logger.debug("No more pages, stopping pagination")
                     break
                     
             except Exception as api_error:
-                print(f"API error during user fetch: {str(api_error)}")
-                import traceback
-                traceback.print_exc()
+                logger.exception(f"API error during user fetch: {str(api_error)}")
                 break
         
-        print(f"Found {len(users)} active users")
-        
-        # Clear existing users for this account
-        deleted_count = db.query(User).filter(User.account_id == account_id).delete()
-        print(f"Deleted {deleted_count} existing users")
-        
-        # Add new users to database
-        for user_data in users:
-            db_user = User(
-                email=user_data['email'],
-                name=user_data['name'],
-                status=UserStatus.ACTIVE,
-                daily_sent_count=0,
-                hourly_sent_count=0,
-                account_id=account_id
-            )
-            db.add(db_user)
-        
-        # Update account with sync info
-        account = db.query(Account).filter(Account.id == account_id).first()
-        if account:
-            account.user_count = len(users)
-            account.last_sync_at = datetime.utcnow()
+        logger.info(f"Found {len(users)} active users")
         
+        # Write the whole sync in one transaction: upsert users, delete users gone
+        # from the workspace and update the account's sync info, then one commit
+        deleted_count = upsert_account_users(db, account_id, users)
+        logger.info(f"Deleted {deleted_count} users no longer in the workspace")
+        db.execute(
+            update(Account)
+            .where(Account.id == account_id)
+            .values(user_count=len(users), last_sync_at=func.now())
+        )
         db.commit()
         
-        print(f"Successfully saved {len(users)} users to database")
+        logger.info(f"Successfully saved {len(users)} users to database")
         return {"success": True, "user_count": len(users), "users": users}
     
     except Exception as e:
         db.rollback()
-        print(f"Error syncing workspace users: {str(e)}")
+        logger.error(f"Error syncing workspace users: {str(e)}")
         return {"success": False, "error": str(e)}
 
 
-def get_account(db: Session, account_id: int) -> Optional[Account]:
-    """Get account by ID"""
-    return db.query(Account).filter(Account.id == account_id).first()
+def upsert_account_users(db: Session, account_id: int, users_data: List[dict]) -> int:
+    """Upsert workspace users for an account and delete users no longer present (no commit)"""
+    # Existing rows keep their ids and sent counters, so assignments survive a resync
+    # Deduplicate by email: ON CONFLICT cannot touch the same row twice
+    user_rows = {
+        user_data['email']: {
+            'email': user_data['email'],
+            'name': user_data['name'],
+            'status': UserStatus.ACTIVE,
+            'daily_sent_count': 0,
+            'hourly_sent_count': 0,
+            'account_id': account_id
+        }
+        for user_data in users_data
+    }
+    
+    if user_rows:
+        stmt = pg_insert(User).values(list(user_rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['account_id', 'email'],
+            set_={'name': stmt.excluded.name, 'status': UserStatus.ACTIVE}
+        )
+        db.execute(stmt)
+    
+    return db.query(User).filter(
+        User.account_id == account_id,
+        User.email.notin_(list(user_rows))
+    ).delete(synchronize_session=False)
 
 
-def get_accounts(db: Session, skip: int = 0, limit: int = 100) -> List[Account]:
-    """Get all accounts"""
-    return db.query(Account).offset(skip).limit(limit).all()
+def get_account(db: Session, account_id: int) -> Optional[Account]:
+    """Get account by ID"""
+    # lambda_stmt caches the compiled SQL; account_id is extracted as a bound parameter
+    stmt = lambda_stmt(lambda: select(Account).where(Account.id == account_id))
+    return db.execute(stmt).scalar_one_or_none()
+
+
+def get_accounts(db: Session, after_id: Optional[int] = None, limit: int = 100, skip: int = 0) -> List[Account]:
+    """
+    Get accounts ordered by id, starting after the after_id keyset cursor;
+    skip is the deprecated OFFSET form, used only when no cursor is given
+    """
+    query = db.query(Account)
+    if after_id is not None:
+        query = query.filter(Account.id > after_id)
+    query = query.order_by(Account.id)
+    if after_id is None and skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+
+def get_accounts_by_ids(db: Session, account_ids: List[int]) -> List[Account]:
+    """Get the accounts with the given ids in one SELECT, ordered by id; unknown ids are skipped"""
+    if not account_ids:
+        return []
+    return list(db.execute(select(Account).where(Account.id.in_(account_ids)).order_by(Account.id)).scalars())
 
 
 def update_account(db: Session, account_id: int, account_update: schemas.AccountUpdate) -> Optional[Account]:
@@ -218,35 +273,89 @@ def delete_account(db: Session, account_id: int) -> bool:
             return False
         
         # Delete credentials file safely
+        invalidate_account_credentials(account_id)
         try:
             if db_account.credentials_path and os.path.exists(db_account.credentials_path):
                 os.remove(db_account.credentials_path)
         except Exception as e:
-            print(f"Warning: Could not delete credentials file: {e}")
-        
-        # Delete all related users first (cascade should handle this, but being explicit)
-        db.query(User).filter(User.account_id == account_id).delete()
-        
-        # Delete the account
-        db.delete(db_account)
+            logger.warning(f"Could not delete credentials file: {e}")
+        
+        # Delete all related users first, then the account: one bulk DELETE each,
+        # without evaluating or loading the matching rows in the session
+        db.execute(delete(User).where(User.account_id == account_id),
+                   execution_options={'synchronize_session': False})
+        db.execute(delete(Account).where(Account.id == account_id),
+                   execution_options={'synchronize_session': False})
         db.commit()
         
-        print(f"Successfully deleted account {account_id}")
+        logger.info(f"Successfully deleted account {account_id}")
         return True
     
     except Exception as e:
         db.rollback()
-        print(f"Error deleting account {account_id}: {e}")
+        logger.error(f"Error deleting account {account_id}: {e}")
         return False
 
 
+def delete_accounts(db: Session, account_ids: List[int]) -> List[int]:
+    """Delete several accounts, their users and credentials files in one transaction; returns deleted ids"""
+    try:
+        accounts = db.query(Account).filter(Account.id.in_(account_ids)).all()
+        if not accounts:
+            return []
+        deleted_ids = [account.id for account in accounts]
+        
+        for account in accounts:
+            invalidate_account_credentials(account.id)
+            try:
+                if account.credentials_path and os.path.exists(account.credentials_path):
+                    os.remove(account.credentials_path)
+            except Exception as e:
+                logger.warning(f"Could not delete credentials file: {e}")
+        
+        # Users first, as in delete_account; one DELETE per table for the whole batch
+        db.execute(delete(User).where(User.account_id.in_(deleted_ids)),
+                   execution_options={'synchronize_session': False})
+        db.execute(delete(Account).where(Account.id.in_(deleted_ids)),
+                   execution_options={'synchronize_session': False})
+        db.commit()
+        
+        logger.info(f"Successfully deleted accounts {deleted_ids}")
+        return deleted_ids
+    
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting accounts {account_ids}: {e}")
+        raise
+
+
 def get_account_credentials(account: Account) -> dict:
-    """Decrypt and return account credentials"""
+    """Decrypt and return account credentials (cached until the file changes or the TTL passes)"""
+    cache_version = (account.credentials_path, os.path.getmtime(account.credentials_path))
+    now = time.monotonic()
+    with _credentials_cache_lock:
+        cached = _credentials_cache.get(account.id)
+    if cached and cached[0] == cache_version and now - cached[1] < CREDENTIALS_CACHE_TTL:
+        return cached[2]
+    
     with open(account.credentials_path, 'r') as f:
         encrypted_data = f.read()
     
     decrypted_json = decrypt_data(encrypted_data)
-    return json.loads(decrypted_json)
+    credentials = orjson.loads(decrypted_json)
+    with _credentials_cache_lock:
+        _credentials_cache.pop(account.id, None)
+        if len(_credentials_cache) >= CREDENTIALS_CACHE_SIZE:
+            # Evict the entry cached longest ago (dicts keep insertion order)
+            del _credentials_cache[next(iter(_credentials_cache))]
+        _credentials_cache[account.id] = (cache_version, now, credentials)
+    return credentials
+
+
+def invalidate_account_credentials(account_id: int):
+    """Drop cached credentials for an account (on delete or credential rotation)"""
+    with _credentials_cache_lock:
+        _credentials_cache.pop(account_id, None)
 
 
 # Campaign CRUD operations
@@ -263,35 +372,79 @@ def create_campaign(db: Session, campaign: schemas.CampaignCreate) -> Campaign:
     db.add(db_campaign)
     db.flush()  # Get the ID without committing
     
-    # Parse and create recipients
-    recipients = []
+    # Parse recipients into rows for a single bulk INSERT
+    recipient_rows = []
     for line in campaign.recipients_csv.strip().split('\n'):
         if line.strip():
             parts = line.strip().split(',', 1)
             if len(parts) == 2:
                 email, name = parts
-                recipient = Recipient(
-                    email=email.strip(),
-                    name=name.strip(),
-                    campaign_id=db_campaign.id,
-                    status=RecipientStatus.PENDING
-                )
-                recipients.append(recipient)
-    
-    db.add_all(recipients)
+                recipient_rows.append({
+                    'email': email.strip(),
+                    'name': name.strip(),
+                    'campaign_id': db_campaign.id,
+                    'status': RecipientStatus.PENDING
+                })
+    
+    bulk_insert_recipients(db, recipient_rows)
+    db_campaign.recipient_count = len(recipient_rows)
     db.commit()
     db.refresh(db_campaign)
     return db_campaign
 
 
+def bulk_insert_recipients(db: Session, recipient_rows: List[dict]):
+    """Insert recipient rows, using COPY on PostgreSQL for large uploads (no commit)"""
+    if not recipient_rows:
+        return
+    if len(recipient_rows) <= COPY_RECIPIENTS_THRESHOLD or db.get_bind().dialect.name != 'postgresql':
+        db.execute(insert(Recipient), recipient_rows)
+        return
+    
+    # Enums are stored by name; empty custom_data becomes NULL
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in recipient_rows:
+        custom_data = row.get('custom_data')
+        writer.writerow((
+            row['email'],
+            row['name'],
+            orjson.dumps(custom_data).decode() if custom_data is not None else None,
+            row['campaign_id'],
+            row['status'].name,
+        ))
+    buffer.seek(0)
+    
+    # Raw psycopg2 cursor on the session's connection, so COPY joins its transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY recipients (email, name, custom_data, campaign_id, status) "
+            "FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (email, name))",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
 def get_campaign(db: Session, campaign_id: int) -> Optional[Campaign]:
     """Get campaign by ID"""
-    return db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    stmt = lambda_stmt(lambda: select(Campaign).where(Campaign.id == campaign_id))
+    return db.execute(stmt).scalar_one_or_none()
 
 
-def get_campaigns(db: Session, skip: int = 0, limit: int = 100) -> List[Campaign]:
-    """Get all campaigns"""
-    return db.query(Campaign).offset(skip).limit(limit).all()
+def get_campaigns(db: Session, after_id: Optional[int] = None, limit: int = 100, skip: int = 0) -> List[Campaign]:
+    """
+    Get campaigns ordered by id, starting after the after_id keyset cursor;
+    skip is the deprecated OFFSET form, used only when no cursor is given
+    """
+    query = db.query(Campaign)
+    if after_id is not None:
+        query = query.filter(Campaign.id > after_id)
+    query = query.order_by(Campaign.id)
+    if after_id is None and skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 
 def update_campaign_status(db: Session, campaign_id: int, status: CampaignStatus) -> Optional[Campaign]:
@@ -305,30 +458,50 @@ def update_campaign_status(db: Session, campaign_id: int, status: CampaignStatus
 
 
 def get_campaign_stats(db: Session, campaign_id: int) -> schemas.CampaignStats:
-    """Get campaign statistics"""
-    stats = db.query(
-        func.count(Recipient.id).label('total'),
-        func.sum(func.case((Recipient.status == RecipientStatus.SENT, 1), else_=0)).label('sent'),
-        func.sum(func.case((Recipient.status == RecipientStatus.PENDING, 1), else_=0)).label('pending'),
-        func.sum(func.case((Recipient.status == RecipientStatus.FAILED, 1), else_=0)).label('failed')
-    ).filter(Recipient.campaign_id == campaign_id).first()
+    """Get campaign statistics (one GROUP BY status scan)"""
+    counts = dict(db.execute(
+        select(Recipient.status, func.count())
+        .where(Recipient.campaign_id == campaign_id)
+        .group_by(Recipient.status)
+    ).all())
     
     return schemas.CampaignStats(
-        total=stats.total or 0,
-        sent=stats.sent or 0,
-        pending=stats.pending or 0,
-        failed=stats.failed or 0
+        total=sum(counts.values()),
+        sent=counts.get(RecipientStatus.SENT, 0),
+        pending=counts.get(RecipientStatus.PENDING, 0),
+        assigned=counts.get(RecipientStatus.ASSIGNED, 0),
+        sending=counts.get(RecipientStatus.SENDING, 0),
+        failed=counts.get(RecipientStatus.FAILED, 0)
     )
 
 
-def get_campaign_recipients(db: Session, campaign_id: int) -> List[Recipient]:
-    """Get all recipients for a campaign"""
-    return db.query(Recipient).filter(Recipient.campaign_id == campaign_id).all()
+def get_campaign_recipients(db: Session, campaign_id: int) -> Iterable[Recipient]:
+    """Stream all recipients for a campaign (server-side cursor, 1000 rows per fetch)"""
+    return db.query(Recipient).filter(
+        Recipient.campaign_id == campaign_id
+    ).execution_options(stream_results=True).yield_per(1000)
+
+
+def get_campaign_recipients_page(db: Session, campaign_id: int, after_id: Optional[int] = None,
+                                 limit: int = 1000, skip: int = 0) -> List[Recipient]:
+    """
+    Get a page of campaign recipients ordered by id, starting after the after_id
+    keyset cursor; skip is the deprecated OFFSET form, used only when no cursor is given
+    """
+    query = db.query(Recipient).filter(Recipient.campaign_id == campaign_id)
+    if after_id is not None:
+        query = query.filter(Recipient.id > after_id)
+    query = query.order_by(Recipient.id)
+    if after_id is None and skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
 
 
 def update_recipient_status(db: Session, recipient_id: int, status: RecipientStatus, error: str = None):
     """Update recipient status"""
-    recipient = db.query(Recipient).filter(Recipient.id == recipient_id).first()
+    stmt = lambda_stmt(lambda: select(Recipient).where(Recipient.id == recipient_id))
+    recipient = db.execute(stmt).scalar_one_or_none()
     if recipient:
         recipient.status = status
         if error:
@@ -338,12 +511,101 @@ def update_recipient_status(db: Session, recipient_id: int, status: RecipientSta
         db.commit()
 
 
-def get_pending_recipients(db: Session, campaign_id: int, limit: int = 100) -> List[Recipient]:
-    """Get pending recipients for a campaign"""
-    return db.query(Recipient).filter(
+# Recipient statuses tracked by the denormalized counters on Campaign
+CAMPAIGN_COUNTER_COLUMNS = {
+    RecipientStatus.SENT: 'sent_count',
+    RecipientStatus.FAILED: 'failed_count',
+    RecipientStatus.SENDING: 'sending_count'
+}
+
+
+def bulk_update_recipient_status(db: Session, updates: List[tuple]):
+    """Apply (recipient_id, status, error) updates with a single UPDATE ... FROM (VALUES ...) (no commit)"""
+    # Last update wins when a recipient appears more than once
+    latest = {recipient_id: (status, error) for recipient_id, status, error in updates}
+    if not latest:
+        return
+    sent_at = datetime.now(timezone.utc)
+    
+    # Lock the rows and diff old vs new statuses into per-campaign counter deltas
+    previous = db.execute(
+        select(Recipient.id, Recipient.campaign_id, Recipient.status)
+        .where(Recipient.id.in_(list(latest)))
+        .order_by(Recipient.id)
+        .with_for_update()
+    ).all()
+    counter_deltas = {}
+    for row in previous:
+        new_status = latest[row.id][0]
+        if new_status == row.status:
+            continue
+        deltas = counter_deltas.setdefault(row.campaign_id, dict.fromkeys(CAMPAIGN_COUNTER_COLUMNS.values(), 0))
+        if row.status in CAMPAIGN_COUNTER_COLUMNS:
+            deltas[CAMPAIGN_COUNTER_COLUMNS[row.status]] -= 1
+        if new_status in CAMPAIGN_COUNTER_COLUMNS:
+            deltas[CAMPAIGN_COUNTER_COLUMNS[new_status]] += 1
+    
+    # Every outcome, however many distinct errors there are, goes out in one round trip;
+    # a missing error keeps last_error and only sends stamp sent_at
+    if previous:
+        outcomes = values(
+            column('id', Recipient.id.type),
+            column('status', Recipient.status.type),
+            column('error', Recipient.last_error.type),
+            name='outcomes'
+        ).data([(row.id, latest[row.id][0], latest[row.id][1] or None) for row in previous])
+        db.execute(
+            update(Recipient)
+            .where(Recipient.id == outcomes.c.id)
+            .values(
+                status=outcomes.c.status,
+                last_error=func.coalesce(outcomes.c.error, Recipient.last_error),
+                sent_at=case((outcomes.c.status == RecipientStatus.SENT, sent_at), else_=Recipient.sent_at)
+            ),
+            execution_options={'synchronize_session': False}
+        )
+    
+    for campaign_id, deltas in counter_deltas.items():
+        counters = {name: getattr(Campaign, name) + delta for name, delta in deltas.items() if delta}
+        if counters:
+            db.execute(update(Campaign).where(Campaign.id == campaign_id).values(**counters))
+
+
+def get_pending_recipient_ids(db: Session, campaign_id: int, limit: Optional[int] = None) -> Iterable[int]:
+    """Stream pending recipient ids for a campaign (server-side cursor, 1000 ids per fetch)"""
+    stmt = select(Recipient.id).where(
         Recipient.campaign_id == campaign_id,
         Recipient.status == RecipientStatus.PENDING
-    ).limit(limit).all()
+    ).order_by(Recipient.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.execute(stmt.execution_options(yield_per=1000)).scalars()
+
+
+def get_campaign_status(db: Session, campaign_id: int) -> Optional[CampaignStatus]:
+    """Read a campaign's current status from the database, bypassing the identity map"""
+    return db.execute(select(Campaign.status).where(Campaign.id == campaign_id)).scalar_one_or_none()
+
+
+def get_sending_campaign_ids(db: Session, started_before_seconds: int) -> List[int]:
+    """Ids of SENDING campaigns that started sending at least started_before_seconds ago"""
+    cutoff = func.now() - timedelta(seconds=started_before_seconds)
+    return list(db.execute(
+        select(Campaign.id).where(
+            Campaign.status == CampaignStatus.SENDING,
+            or_(Campaign.sending_started_at.is_(None), Campaign.sending_started_at < cutoff)
+        )
+    ).scalars())
+
+
+def has_pending_recipients(db: Session, campaign_id: int) -> bool:
+    """Check whether a campaign still has pending recipients"""
+    return db.query(
+        db.query(Recipient.id).filter(
+            Recipient.campaign_id == campaign_id,
+            Recipient.status == RecipientStatus.PENDING
+        ).exists()
+    ).scalar()
 
 
 def get_active_accounts(db: Session) -> List[Account]:
@@ -378,23 +640,26 @@ def create_users_for_account(db: Session, account_id: int, users_data: List[dict
 
 
 def get_account_users(db: Session, account_id: int) -> List[User]:
-    """Get all users for an account"""
+    """Get all users for an account (empty for a missing account, without a separate lookup)"""
     try:
-        # Verify account exists first
-        account = get_account(db, account_id)
-        if not account:
-            print(f"Account {account_id} not found")
-            return []
-        
-        users = db.query(User).filter(User.account_id == account_id).all()
-        print(f"Retrieved {len(users)} users for account {account_id}")
+        users = db.execute(select(User).where(User.account_id == account_id)).scalars().all()
+        logger.debug(f"Retrieved {len(users)} users for account {account_id}")
         return users
     
     except Exception as e:
-        print(f"Error retrieving users for account {account_id}: {e}")
+        logger.error(f"Error retrieving users for account {account_id}: {e}")
         return []
 
 
+def get_users_for_accounts(db: Session, account_ids: List[int]) -> Dict[int, List[User]]:
+    """Users of several accounts in one SELECT, grouped by account id (every id gets a list)"""
+    users_by_account = {account_id: [] for account_id in account_ids}
+    if account_ids:
+        for user in db.execute(select(User).where(User.account_id.in_(account_ids))).scalars():
+            users_by_account[user.account_id].append(user)
+    return users_by_account
+
+
 def update_user_status(db: Session, user_id: int, status: UserStatus, error: str = None):
     """Update user status"""
     user = db.query(User).filter(User.id == user_id).first()
@@ -405,14 +670,15 @@ def update_user_status(db: Session, user_id: int, status: UserStatus, error: str
         db.commit()
 
 
-def increment_user_sent_count(db: Session, user_id: int):
-    """Increment user's sent count"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if user:
-        user.daily_sent_count += 1
-        user.hourly_sent_count += 1
-        user.last_sent_at = func.now()
-        db.commit()
+def increment_user_sent_count(db: Session, user_id: int, count: int = 1):
+    """Increment user's sent count (no commit, so it joins the caller's status update)"""
+    # Single cached UPDATE instead of SELECT + flush
+    stmt = lambda_stmt(lambda: update(User).where(User.id == user_id).values(
+        daily_sent_count=User.daily_sent_count + count,
+        hourly_sent_count=User.hourly_sent_count + count,
+        last_sent_at=func.now()
+    ))
+    db.execute(stmt)
 
 
 def reset_hourly_counts(db: Session):
@@ -450,26 +716,30 @@ def sync_account_users(db: Session, account_id: int) -> dict:
         if not users_data:
             return {'success': False, 'error': 'No users found or API error'}
         
-        # Delete existing users
-        db.query(User).filter(User.account_id == account_id).delete()
-        
-        # Create new users
-        users = create_users_for_account(db, account_id, users_data)
+        # Upsert users and update sync info in one transaction
+        upsert_account_users(db, account_id, users_data)
+        db.execute(
+            update(Account)
+            .where(Account.id == account_id)
+            .values(user_count=len(users_data), last_sync_at=func.now())
+        )
+        db.commit()
         
         return {
             'success': True,
-            'user_count': len(users),
-            'users': [{'email': u.email, 'name': u.name} for u in users]
+            'user_count': len(users_data),
+            'users': [{'email': u['email'], 'name': u['name']} for u in users_data]
         }
     
     except Exception as e:
+        db.rollback()
         return {'success': False, 'error': str(e)}
 
 
 def validate_account_credentials(credentials_json: str, admin_email: str) -> dict:
     """Validate account credentials and return info"""
     try:
-        credentials_dict = json.loads(credentials_json)
+        credentials_dict = orjson.loads(credentials_json)
         # Import here to avoid circular imports
         from utils.gmail_service import validate_gmail_credentials
         return validate_gmail_credentials(credentials_dict, admin_email)
@@ -478,8 +748,12 @@ def validate_account_credentials(credentials_json: str, admin_email: str) -> dic
 
 
 # Advanced Campaign CRUD operations
-def create_advanced_campaign(db: Session, campaign: schemas.CampaignCreate) -> Campaign:
-    """Create a campaign with advanced features"""
+def create_advanced_campaign(db: Session, campaign: schemas.CampaignCreate,
+                             recipient_lines: Optional[Iterable[str]] = None) -> Campaign:
+    """
+    Create a campaign with advanced features; recipient_lines (e.g. an uploaded
+    file read line by line) replaces campaign.recipients_csv when given
+    """
     db_campaign = Campaign(
         name=campaign.name,
         from_name=campaign.from_name,
@@ -495,26 +769,28 @@ def create_advanced_campaign(db: Session, campaign: schemas.CampaignCreate) -> C
     db.add(db_campaign)
     db.flush()
     
-    # Parse and create recipients with custom data
-    recipients = []
-    for line in campaign.recipients_csv.strip().split('\n'):
+    # Parse recipients with custom data into rows for a single bulk INSERT
+    if recipient_lines is None:
+        recipient_lines = campaign.recipients_csv.strip().split('\n')
+    recipient_rows = []
+    for line in recipient_lines:
         if line.strip():
             parts = line.strip().split(',')
             if len(parts) >= 2:
                 email = parts[0].strip()
                 name = parts[1].strip()
-                custom_data = json.loads(parts[2]) if len(parts) > 2 and parts[2].strip() else None
+                custom_data = orjson.loads(parts[2]) if len(parts) > 2 and parts[2].strip() else None
                 
-                recipient = Recipient(
-                    email=email,
-                    name=name,
-                    custom_data=custom_data,
-                    campaign_id=db_campaign.id,
-                    status=RecipientStatus.PENDING
-                )
-                recipients.append(recipient)
-    
-    db.add_all(recipients)
+                recipient_rows.append({
+                    'email': email,
+                    'name': name,
+                    'custom_data': custom_data,
+                    'campaign_id': db_campaign.id,
+                    'status': RecipientStatus.PENDING
+                })
+    
+    bulk_insert_recipients(db, recipient_rows)
+    db_campaign.recipient_count = len(recipient_rows)
     db.commit()
     db.refresh(db_campaign)
     return db_campaign
@@ -538,8 +814,10 @@ def prepare_campaign_for_sending(db: Session, campaign_id: int, selected_account
         campaign.selected_accounts = selected_accounts
         db.commit()
         
-        # Get recipients
-        recipients = get_campaign_recipients(db, campaign_id)
+        # Get recipient ids only; assignments never need the full rows
+        recipients = db.execute(
+            select(Recipient.id).where(Recipient.campaign_id == campaign_id).order_by(Recipient.id)
+        ).all()
         if not recipients:
             return {'success': False, 'error': 'No recipients found'}
         
@@ -562,11 +840,7 @@ def prepare_campaign_for_sending(db: Session, campaign_id: int, selected_account
         db.query(RecipientAssignment).filter(RecipientAssignment.campaign_id == campaign_id).delete()
         
         # Create optimized assignments
-        assignments = optimizer.create_recipient_assignments(campaign_id, recipients, distribution)
-        optimized_assignments = optimizer.optimize_sending_order(assignments)
-        
-        # Save assignments
-        db.add_all(optimized_assignments)
+        optimizer.create_recipient_assignments(campaign_id, recipients, distribution)
         
         # Update campaign status to ready
         campaign.status = CampaignStatus.READY
@@ -592,30 +866,36 @@ def prepare_campaign_for_sending(db: Session, campaign_id: int, selected_account
 
 def get_advanced_campaign_stats(db: Session, campaign_id: int) -> schemas.CampaignStats:
     """Get advanced campaign statistics"""
-    stats = db.query(
-        func.count(Recipient.id).label('total'),
-        func.sum(func.case((Recipient.status == RecipientStatus.SENT, 1), else_=0)).label('sent'),
-        func.sum(func.case((Recipient.status == RecipientStatus.PENDING, 1), else_=0)).label('pending'),
-        func.sum(func.case((Recipient.status == RecipientStatus.ASSIGNED, 1), else_=0)).label('assigned'),
-        func.sum(func.case((Recipient.status == RecipientStatus.SENDING, 1), else_=0)).label('sending'),
-        func.sum(func.case((Recipient.status == RecipientStatus.FAILED, 1), else_=0)).label('failed')
-    ).filter(Recipient.campaign_id == campaign_id).first()
-    
-    return schemas.CampaignStats(
-        total=stats.total or 0,
-        sent=stats.sent or 0,
-        pending=stats.pending or 0,
-        assigned=stats.assigned or 0,
-        sending=stats.sending or 0,
-        failed=stats.failed or 0
-    )
+    return get_campaign_stats(db, campaign_id)
+
+
+# Sending order matching CampaignOptimizer.optimize_sending_order
+ASSIGNMENT_SENDING_ORDER = (RecipientAssignment.batch_number, RecipientAssignment.user_id, RecipientAssignment.priority)
 
 
 def get_campaign_assignments(db: Session, campaign_id: int) -> List[RecipientAssignment]:
     """Get all assignments for a campaign"""
     return db.query(RecipientAssignment).filter(
         RecipientAssignment.campaign_id == campaign_id
-    ).all()
+    ).order_by(*ASSIGNMENT_SENDING_ORDER).all()
+
+
+def stream_campaign_assignments(db: Session, campaign_id: int, yield_per: int = 1000):
+    """Stream (user_id, recipient_id, email, name) rows of a campaign's assignments in sending order"""
+    return db.execute(
+        select(RecipientAssignment.user_id, Recipient.id, Recipient.email, Recipient.name)
+        .join(Recipient, Recipient.id == RecipientAssignment.recipient_id)
+        .where(RecipientAssignment.campaign_id == campaign_id)
+        .order_by(*ASSIGNMENT_SENDING_ORDER)
+        .execution_options(yield_per=yield_per)
+    )
+
+
+def get_campaign_sending_user_ids(db: Session, campaign_id: int) -> List[int]:
+    """Distinct users with assignments in a campaign"""
+    return list(db.scalars(
+        select(RecipientAssignment.user_id).where(RecipientAssignment.campaign_id == campaign_id).distinct()
+    ))
 
 
 def get_user_assignments(db: Session, user_id: int, campaign_id: int) -> List[RecipientAssignment]:
@@ -623,7 +903,7 @@ def get_user_assignments(db: Session, user_id: int, campaign_id: int) -> List[Re
     return db.query(RecipientAssignment).filter(
         RecipientAssignment.user_id == user_id,
         RecipientAssignment.campaign_id == campaign_id
-    ).all()
+    ).order_by(*ASSIGNMENT_SENDING_ORDER).all()
 
 
 def update_assignment_status(db: Session, assignment_id: int, recipient_status: RecipientStatus):
@@ -639,26 +919,43 @@ def update_assignment_status(db: Session, assignment_id: int, recipient_status:
             db.commit()
 
 
-def get_sending_progress(db: Session, campaign_id: int) -> schemas.SendingProgress:
-    """Get real-time sending progress"""
-    stats = get_advanced_campaign_stats(db, campaign_id)
+def recompute_campaign_counters(db: Session, campaign_id: int) -> Optional[Campaign]:
+    """Reconcile the denormalized campaign counters with the recipients table"""
     campaign = get_campaign(db, campaign_id)
+    if campaign:
+        stats = get_advanced_campaign_stats(db, campaign_id)
+        campaign.recipient_count = stats.total
+        campaign.sent_count = stats.sent
+        campaign.failed_count = stats.failed
+        campaign.sending_count = stats.sending
+        db.commit()
+    return campaign
+
+
+def get_sending_progress(db: Session, campaign_id: int, recompute: bool = False) -> schemas.SendingProgress:
+    """Get real-time sending progress from the campaign counters"""
+    if recompute:
+        campaign = recompute_campaign_counters(db, campaign_id)
+    else:
+        campaign = get_campaign(db, campaign_id)
     
-    progress_percentage = (stats.sent / stats.total * 100) if stats.total > 0 else 0
+    total = campaign.recipient_count if campaign else 0
+    sent = campaign.sent_count if campaign else 0
+    progress_percentage = (sent / total * 100) if total > 0 else 0
     
     # Calculate current send rate (simplified)
     current_send_rate = 0.0
     if campaign and campaign.sending_started_at:
-        elapsed_seconds = (func.now() - campaign.sending_started_at).total_seconds()
+        elapsed_seconds = (datetime.now(timezone.utc) - campaign.sending_started_at).total_seconds()
         if elapsed_seconds > 0:
-            current_send_rate = stats.sent / elapsed_seconds
+            current_send_rate = sent / elapsed_seconds
     
     return schemas.SendingProgress(
         campaign_id=campaign_id,
-        total_emails=stats.total,
-        sent_emails=stats.sent,
-        failed_emails=stats.failed,
-        sending_emails=stats.sending,
+        total_emails=total,
+        sent_emails=sent,
+        failed_emails=campaign.failed_count if campaign else 0,
+        sending_emails=campaign.sending_count if campaign else 0,
         progress_percentage=progress_percentage,
         current_send_rate=current_send_rate,
         errors=[]  # Could be populated with recent errors
@@ -9,23 +9,37 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def create_database_engine():
-    max_retries = 5
-    retry_delay = 5
+    # Poll every half second for up to 30s: services start alongside the
+    # database rather than behind its healthcheck, and connect once it is up
+    max_retries = 60
+    retry_delay = 0.5
     
+    # Size the pool for concurrent senders updating recipient/user rows;
+    # the defaults (5 + 10 overflow) serialize bulk sends behind the pool.
+    engine_kwargs = {
+        "pool_pre_ping": True,
+        "pool_recycle": 300,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_use_lifo": True,
+        "pool_reset_on_return": "rollback",
+        "insertmanyvalues_page_size": 1000,
+        "echo": settings.debug
+    }
+    if settings.database_url.startswith(("postgresql://", "postgresql+psycopg2://")):
+        engine_kwargs["executemany_mode"] = "values_plus_batch"
+    
+    engine = create_engine(settings.database_url, **engine_kwargs)
     for attempt in range(max_retries):
         try:
-            engine = create_engine(
-                settings.database_url,
-                pool_pre_ping=True,
-                pool_recycle=300,
-                echo=settings.debug
-            )
             with engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
             logger.info("Database connection established")
             return engine
         except Exception as e:
-            logger.warning(f"Database connection attempt {attempt + 1} failed: {e}")
+            if attempt % 10 == 0 or attempt == max_retries - 1:
+                logger.warning(f"Database connection attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
                 time.sleep(retry_delay)
             else:
@@ -38,9 +52,9 @@ Base = declarative_base()
 def get_db() -> Session:
     db = None
     try:
+        # Stale connections are caught by pool_pre_ping on checkout, not by
+        # a SELECT 1 round trip on every request
         db = SessionLocal()
-        # Test connection
-        db.execute(text("SELECT 1"))
         yield db
     except Exception as e:
         logger.error(f"Database connection error: {e}")
@@ -1,12 +1,15 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from api.v1.api import api_router
 from database import engine
+from utils.etag import ETagMiddleware
+from utils.gmail_service import close_http_session
 from models import Base
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="Speed-Send API",
     description="High-Performance Gmail API Sender",
@@ -22,12 +25,44 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ETag is read by the frontend cache for If-None-Match; X-Next-Cursor
+    # carries the keyset cursor for the next page of a listing
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+# Conditional GETs: clients revalidating with If-None-Match get an empty 304
+# when nothing changed. Added before GZip so the tag covers the plain body
+app.add_middleware(ETagMiddleware)
+
+# Compress larger responses (e.g. accounts listed with their users) for
+# clients that call the API directly rather than through nginx
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include API routes
 app.include_router(api_router, prefix="/api/v1")
 
 
+@app.on_event("startup")
+async def configure_default_executor():
+    """Bound the pool that run_in_executor(None, ...) uses for sync SQLAlchemy calls"""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix='sync-io')
+    )
+
+
+@app.on_event("startup")
+def create_tables():
+    """Create database tables on startup when AUTO_CREATE_TABLES is set (schema is otherwise managed by Alembic)"""
+    if os.getenv("AUTO_CREATE_TABLES", "false").lower() == "true":
+        Base.metadata.create_all(bind=engine)
+
+
+@app.on_event("shutdown")
+async def close_gmail_http_session():
+    """Close the Gmail REST session's keep-alive connections before the loop stops"""
+    await close_http_session()
+
+
 @app.get("/")
 def read_root():
     return {"message": "Speed-Send API is running"}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum, JSON, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum, JSON, Float, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -46,16 +46,22 @@ class Account(Base):
 
     # Relationships
     campaigns = relationship("Campaign", back_populates="account")
-    users = relationship("User", back_populates="account", cascade="all, delete-orphan")
+    # Never lazy loaded; callers opt in with selectinload(Account.users)
+    users = relationship("User", back_populates="account", cascade="all, delete-orphan",
+                         lazy="raise", passive_deletes=True)
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Conflict target for the workspace user sync UPSERT
+        UniqueConstraint("account_id", "email", name="uq_users_account_id_email"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, nullable=False, index=True)
     name = Column(String, nullable=False)
-    status = Column(SQLEnum(UserStatus), default=UserStatus.ACTIVE)
+    status = Column(SQLEnum(UserStatus, native_enum=False, length=16, create_constraint=True, name='ck_users_status'), default=UserStatus.ACTIVE)
     daily_sent_count = Column(Integer, default=0)
     hourly_sent_count = Column(Integer, default=0)
     last_sent_at = Column(DateTime(timezone=True), nullable=True)
@@ -80,7 +86,12 @@ class Campaign(Base):
     test_email = Column(String, nullable=True)  # Test email address
     selected_accounts = Column(JSON, nullable=True)  # Selected account IDs
     send_rate_per_minute = Column(Integer, default=1000)  # Emails per minute
-    status = Column(SQLEnum(CampaignStatus), default=CampaignStatus.DRAFT)
+    status = Column(SQLEnum(CampaignStatus, native_enum=False, length=16, create_constraint=True, name='ck_campaigns_status'), default=CampaignStatus.DRAFT)
+    # Denormalized recipient counters, kept in sync by the batched status writer
+    recipient_count = Column(Integer, nullable=False, default=0, server_default="0")
+    sent_count = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    sending_count = Column(Integer, nullable=False, default=0, server_default="0")
     preparation_started_at = Column(DateTime(timezone=True), nullable=True)
     preparation_completed_at = Column(DateTime(timezone=True), nullable=True)
     sending_started_at = Column(DateTime(timezone=True), nullable=True)
@@ -103,7 +114,7 @@ class Recipient(Base):
     email = Column(String, nullable=False, index=True)
     name = Column(String, nullable=False)
     custom_data = Column(JSON, nullable=True)  # For personalization data
-    status = Column(SQLEnum(RecipientStatus), default=RecipientStatus.PENDING)
+    status = Column(SQLEnum(RecipientStatus, native_enum=False, length=16, create_constraint=True, name='ck_recipients_status'), default=RecipientStatus.PENDING)
     last_error = Column(Text, nullable=True)
     sent_at = Column(DateTime(timezone=True), nullable=True)
     assigned_at = Column(DateTime(timezone=True), nullable=True)
@@ -113,6 +124,11 @@ class Recipient(Base):
     
     # Relationship
     campaign = relationship("Campaign", back_populates="recipients")
+    
+    __table_args__ = (
+        # Only pending rows are indexed, so the index shrinks as a campaign sends
+        Index('ix_recipients_campaign_pending', 'campaign_id', 'id', postgresql_where=text("status = 'PENDING'")),
+    )
 
 
 class RecipientAssignment(Base):
@@ -130,6 +146,10 @@ class RecipientAssignment(Base):
     recipient = relationship("Recipient")
     user = relationship("User", back_populates="recipient_assignments")
     campaign = relationship("Campaign", back_populates="recipient_assignments")
+    
+    __table_args__ = (
+        Index('ix_recipient_assignments_campaign_user_batch', 'campaign_id', 'user_id', 'batch_number'),
+    )
 
 
 class SendingBatch(Base):
@@ -0,0 +1,37 @@
+"""
+Database setup for the quick migration fix script: clear a stale alembic
+lock, bootstrap the tables and stamp, then test a session round trip
+"""
+import os
+import sys
+
+from sqlalchemy import text
+
+import bootstrap_db
+from database import SessionLocal
+
+LOCK_FILE = "/app/alembic.ini.lock"
+
+
+def main() -> int:
+    # Remove any existing migration locks
+    if os.path.exists(LOCK_FILE):
+        os.remove(LOCK_FILE)
+
+    # A failed stamp is tolerated here, as alembic may not be configured
+    status = bootstrap_db.main()
+    if status not in (0, bootstrap_db.STAMP_FAILED):
+        return status
+
+    try:
+        with SessionLocal() as db:
+            db.execute(text("SELECT 1")).fetchone()
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    print("✅ Database connection test successful")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
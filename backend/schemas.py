@@ -165,6 +165,19 @@ class AccountSync(BaseModel):
     account_id: int
 
 
+class AccountBatchGet(BaseModel):
+    ids: List[int]
+
+
+class AccountBatchDelete(BaseModel):
+    ids: List[int]
+
+
+class AccountBatchDeleteResult(BaseModel):
+    deleted: List[int]
+    not_found: List[int]
+
+
 class AccountValidation(BaseModel):
     name: str
     admin_email: EmailStr
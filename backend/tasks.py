@@ -1,17 +1,22 @@
 import time
-import json
-from celery import Celery
-from sqlalchemy.orm import sessionmaker
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+import logging
+from celery import Celery, group
+from celery.exceptions import Retry
+from celery.signals import task_prerun, worker_process_init
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, sessionmaker
 from googleapiclient.errors import HttpError
 import base64
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import redis
+from email.utils import formataddr
 
 from core.config import settings
 from database import engine
-from models import CampaignStatus, RecipientStatus
+from models import Campaign, CampaignStatus, RecipientStatus
+from utils.gmail_service import (RETRYABLE_STATUSES, build_service, encode_header,
+                                 get_service_account_credentials)
+from utils.rate_limiter import SlidingWindowRateLimiter
+from utils.templating import PlaceholderTemplate
 import crud
 
 # Create Celery app
@@ -24,48 +29,235 @@ celery_app = Celery(
 
 # Configure Celery
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    # msgpack keeps recipient id batches compact on the broker; json is still
+    # accepted so tasks queued before a deploy can drain
+    task_serializer="msgpack",
+    accept_content=["msgpack", "json"],
+    result_serializer="msgpack",
+    result_accept_content=["msgpack", "json"],
+    result_expires=3600,
+    # Quota-deferred batches can wait up to an hour; keep Redis from redelivering them early
+    broker_transport_options={"visibility_timeout": 4 * 3600},
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
     task_time_limit=settings.celery_task_timeout,
     worker_prefetch_multiplier=1,
+    # Send batches and short control tasks run on separate workers, so campaign
+    # dispatch and finalization never wait behind a backlog of Gmail batches
+    task_routes={
+        "tasks.send_batch_task": {"queue": "send"},
+        "tasks.send_email_task": {"queue": "send"},
+        "tasks.send_campaign_task": {"queue": "control"},
+        "tasks.finalize_campaign_task": {"queue": "control"},
+        "tasks.check_stalled_campaigns": {"queue": "control"},
+    },
     worker_max_tasks_per_child=1000,
 )
 
+logger = logging.getLogger(__name__)
+
 # Create database session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Outstanding-send counters live in Redis so completion needs no polling
+redis_client = redis.Redis.from_url(settings.redis_url)
+
+# Hourly send quota per account, enforced across all workers
+hourly_limiter = SlidingWindowRateLimiter(redis_client, window=3600)
+
+
+def pending_key(campaign_id: int) -> str:
+    return f"campaign:{campaign_id}:pending"
+
+
+# Every change to a pending counter pushes its expiry back, so the key vanishes
+# only after this long without a batch finishing. Quota-deferred batches wait
+# at most an hour, so a gone counter means its batches were lost (time limit,
+# OOM, a dead worker) and check_stalled_campaigns takes the campaign over
+PENDING_TTL = 2 * 3600
+
+
+def add_pending(campaign_id: int, count: int):
+    """Count sends onto a campaign's outstanding total and refresh its expiry"""
+    pipe = redis_client.pipeline()
+    pipe.incrby(pending_key(campaign_id), count)
+    pipe.expire(pending_key(campaign_id), PENDING_TTL)
+    pipe.execute()
+
+
+def status_key(campaign_id: int) -> str:
+    return f"campaign:{campaign_id}:status"
+
+
+# Mirrored statuses expire so deleted campaigns leave nothing behind; a miss
+# just costs one status query
+STATUS_TTL = 3600
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_campaign_statuses(session, flush_context):
+    """Note flushed campaign status changes; they are published only if the transaction commits"""
+    for target in session.dirty:
+        if isinstance(target, Campaign) and inspect(target).attrs.status.history.has_changes():
+            session.info.setdefault('campaign_statuses', {})[target.id] = target.status.name
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_campaign_statuses(session):
+    """Mirror committed campaign status changes into Redis so dispatch loops see pauses without querying"""
+    for campaign_id, status in session.info.pop('campaign_statuses', {}).items():
+        try:
+            redis_client.set(status_key(campaign_id), status, ex=STATUS_TTL)
+        except redis.RedisError as error:
+            logger.warning(f"Could not publish status for campaign {campaign_id}: {error}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_campaign_statuses(session):
+    session.info.pop('campaign_statuses', None)
+
+
+def campaign_is_sending(db, campaign_id: int) -> bool:
+    """Check the mirrored campaign status, falling back to the database when it is not cached"""
+    status = redis_client.get(status_key(campaign_id))
+    if status is None:
+        db_status = crud.get_campaign_status(db, campaign_id)
+        if db_status is None:
+            return False
+        status = db_status.name.encode()
+        redis_client.set(status_key(campaign_id), status, ex=STATUS_TTL)
+    return status == CampaignStatus.SENDING.name.encode()
+
+
+def settle_sends(campaign_id: int, count: int):
+    """Count finished sends off a campaign and finalize it once none are outstanding"""
+    if not count:
+        return
+    pipe = redis_client.pipeline()
+    pipe.decrby(pending_key(campaign_id), count)
+    pipe.expire(pending_key(campaign_id), PENDING_TTL)
+    remaining, _ = pipe.execute()
+    if remaining == 0:
+        finalize_campaign_task.delay(campaign_id)
+
 
-def get_gmail_service(credentials_dict: dict, admin_email: str):
-    """Create Gmail service with domain-wide delegation"""
-    credentials = Credentials.from_service_account_info(
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """Drop pooled connections inherited from the parent; each worker child opens its own"""
+    engine.dispose(close=False)
+
+
+# Gmail services per (account id, admin email), reused across tasks in this worker process
+_SERVICE_CACHE = {}
+
+
+def get_gmail_service(account_id: int, credentials_dict: dict, admin_email: str):
+    """Create or reuse a Gmail service with domain-wide delegation"""
+    cache_key = (account_id, admin_email)
+    cached = _SERVICE_CACHE.get(cache_key)
+    # crud.get_account_credentials hands back the same dict until the file changes
+    if cached and cached[0] is credentials_dict:
+        return cached[1]
+    
+    credentials = get_service_account_credentials(
         credentials_dict,
-        scopes=['https://www.googleapis.com/auth/gmail.send']
+        scopes=('https://www.googleapis.com/auth/gmail.send',)
     )
     
     # Delegate to the admin email
     delegated_credentials = credentials.with_subject(admin_email)
     
-    service = build('gmail', 'v1', credentials=delegated_credentials)
+    # Bundled discovery document, parsed once per process
+    service = build_service('gmail', 'v1', delegated_credentials)
+    _SERVICE_CACHE[cache_key] = (credentials_dict, service)
     return service
 
 
-def create_message(sender_email: str, to_email: str, subject: str, html_body: str, sender_name: str = None):
-    """Create a message for an email"""
-    message = MIMEMultipart('alternative')
-    message['to'] = to_email
-    message['from'] = f"{sender_name} <{sender_email}>" if sender_name else sender_email
-    message['subject'] = subject
+# Seconds the first task in a worker child may spend pre-building services;
+# accounts not reached in time are built on first use as before
+WARM_BUDGET = 2.0
+_services_warmed = False
+
+
+@task_prerun.connect
+def warm_gmail_services(**kwargs):
+    """
+    Decrypt credentials and build services for active accounts ahead of the
+    first task in a worker child. Runs before that task rather than in
+    worker_process_init, where a slow warm-up would overrun Celery's
+    worker_proc_alive_timeout and have the child killed and re-forked
+    """
+    global _services_warmed
+    if _services_warmed:
+        return
+    _services_warmed = True
+    
+    deadline = time.monotonic() + WARM_BUDGET
+    db = SessionLocal()
+    try:
+        for account in crud.get_active_accounts(db):
+            if time.monotonic() >= deadline:
+                break
+            try:
+                get_gmail_service(account.id, crud.get_account_credentials(account), account.admin_email)
+            except Exception as error:
+                logger.warning(f"Could not warm Gmail service for account {account.id}: {error}")
+    except Exception as error:
+        logger.warning(f"Could not warm Gmail services: {error}")
+    finally:
+        db.close()
+
+
+class MessageTemplate:
+    """
+    A campaign's raw RFC 5322 message, assembled directly as bytes: headers
+    once per campaign, the base64 body once unless it is personalized
+    """
+    
+    def __init__(self, campaign):
+        sender = formataddr((campaign.from_name, campaign.from_email), charset='utf-8') \
+            if campaign.from_name else campaign.from_email
+        self.headers = (
+            b'From: ' + sender.encode() + b'\r\n'
+            b'Subject: ' + encode_header(campaign.subject) + b'\r\n'
+            b'MIME-Version: 1.0\r\n'
+            b'Content-Type: text/html; charset="utf-8"\r\n'
+            b'Content-Transfer-Encoding: base64\r\n'
+            b'\r\n'
+        )
+        self.body = PlaceholderTemplate(campaign.html_body)
+        self.default_bytes = self._render(campaign.html_body)
+    
+    def _render(self, html_body: str) -> bytes:
+        return self.headers + base64.encodebytes(html_body.encode('utf-8')).replace(b'\n', b'\r\n')
+    
+    def render(self, custom_data: dict = None) -> bytes:
+        """Message bytes without the To header, personalized when the body has placeholders"""
+        if self.body.is_static or not custom_data:
+            return self.default_bytes
+        return self._render(self.body.render(custom_data))
+
+
+# Message templates per campaign id, reused across tasks in this worker process
+_MESSAGE_TEMPLATE_CACHE = {}
+
+
+def build_message_template(campaign) -> MessageTemplate:
+    """Get the campaign's message template, rebuilding it if the campaign was edited"""
+    fields = (campaign.from_email, campaign.from_name, campaign.subject, campaign.html_body)
+    cached = _MESSAGE_TEMPLATE_CACHE.get(campaign.id)
+    if cached and cached[0] == fields:
+        return cached[1]
+    
+    template = MessageTemplate(campaign)
+    _MESSAGE_TEMPLATE_CACHE[campaign.id] = (fields, template)
+    return template
 
-    # Create HTML part
-    html_part = MIMEText(html_body, 'html')
-    message.attach(html_part)
 
-    # Encode message
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+def create_message(template: MessageTemplate, to_email: str, custom_data: dict = None):
+    """Create a message for an email by prefixing the rendered template with its To header"""
+    raw_message = base64.urlsafe_b64encode(b'To: ' + to_email.encode() + b'\r\n' + template.render(custom_data)).decode()
     return {'raw': raw_message}
 
 
@@ -90,16 +282,10 @@ def send_email_task(self, recipient_id: int, campaign_id: int, account_id: int):
         credentials_dict = crud.get_account_credentials(account)
         
         # Create Gmail service
-        service = get_gmail_service(credentials_dict, account.admin_email)
+        service = get_gmail_service(account.id, credentials_dict, account.admin_email)
         
         # Create message
-        message = create_message(
-            sender_email=campaign.from_email,
-            to_email=recipient.email,
-            subject=campaign.subject,
-            html_body=campaign.html_body,
-            sender_name=campaign.from_name
-        )
+        message = create_message(build_message_template(campaign), recipient.email, recipient.custom_data)
         
         # Send email
         result = service.users().messages().send(userId='me', body=message).execute()
@@ -114,7 +300,7 @@ def send_email_task(self, recipient_id: int, campaign_id: int, account_id: int):
         crud.update_recipient_status(db, recipient_id, RecipientStatus.FAILED, error_msg)
         
         # Retry on rate limit errors
-        if error.resp.status in [429, 500, 502, 503, 504]:
+        if error.resp.status in RETRYABLE_STATUSES:
             raise self.retry(countdown=60 * (self.request.retries + 1))
         
         raise Exception(error_msg)
@@ -128,6 +314,98 @@ def send_email_task(self, recipient_id: int, campaign_id: int, account_id: int):
         db.close()
 
 
+# Gmail accepts up to 100 calls per batch request; 50 keeps us clear of per-batch throttling
+SEND_BATCH_SIZE = 50
+# Batches published per group while streaming a campaign
+DISPATCH_GROUP_SIZE = 20
+
+
+@celery_app.task(bind=True, max_retries=3)
+def send_batch_task(self, account_id: int, campaign_id: int, recipient_ids: list):
+    """Send a group of emails through one Gmail batch HTTP request"""
+    db = SessionLocal()
+    
+    try:
+        campaign = crud.get_campaign(db, campaign_id)
+        account = crud.get_account(db, account_id)
+        if not campaign or not account:
+            raise Exception("Campaign or account not found")
+        
+        # Leave recipients pending if the campaign was paused after dispatch
+        if campaign.status != CampaignStatus.SENDING:
+            settle_sends(campaign_id, len(recipient_ids))
+            return f"Campaign {campaign_id} is not sending, skipped {len(recipient_ids)} emails"
+        
+        if not account.active:
+            raise Exception("Account is not active")
+        
+        # Send what the account's hourly quota allows now, requeue the rest for when it frees up
+        granted, retry_after = hourly_limiter.acquire(f"rate:{account_id}:hour", account.hourly_quota, len(recipient_ids))
+        if granted < len(recipient_ids):
+            send_batch_task.apply_async(args=[account_id, campaign_id, recipient_ids[granted:]], countdown=retry_after)
+            recipient_ids = recipient_ids[:granted]
+            if not recipient_ids:
+                return f"Account {account_id} hourly quota reached, requeued batch in {retry_after}s"
+        
+        recipients = db.query(crud.Recipient).filter(crud.Recipient.id.in_(recipient_ids)).all()
+        
+        # One service (and one delegated token) for the whole batch
+        credentials_dict = crud.get_account_credentials(account)
+        service = get_gmail_service(account.id, credentials_dict, account.admin_email)
+        
+        updates = []
+        retry_ids = []
+        
+        def on_done(request_id, response, exception):
+            recipient_id = int(request_id)
+            if exception is None:
+                updates.append((recipient_id, RecipientStatus.SENT, None))
+            elif isinstance(exception, HttpError) and exception.resp.status in RETRYABLE_STATUSES \
+                    and self.request.retries < self.max_retries:
+                retry_ids.append(recipient_id)
+            else:
+                updates.append((recipient_id, RecipientStatus.FAILED, f"Gmail API error: {exception}"))
+        
+        template = build_message_template(campaign)
+        batch = service.new_batch_http_request(callback=on_done)
+        for recipient in recipients:
+            message = create_message(template, recipient.email, recipient.custom_data)
+            batch.add(service.users().messages().send(userId='me', body=message), request_id=str(recipient.id))
+        
+        # End the read transaction so the connection goes back to the pool instead
+        # of idling in transaction for the Gmail round trip
+        db.commit()
+        batch.execute()
+        
+        # Write all results for the batch in one statement
+        crud.bulk_update_recipient_status(db, updates)
+        db.commit()
+        # Everything not going back out is done, including ids whose rows no
+        # longer exist and so got no update; otherwise the counter never drains
+        settle_sends(campaign_id, len(recipient_ids) - len(retry_ids))
+        recipient_ids = retry_ids
+        
+        # Rate limited or transient failures go back out as a smaller batch
+        if retry_ids:
+            raise self.retry(args=[account_id, campaign_id, retry_ids], countdown=60 * (self.request.retries + 1))
+        
+        return f"Sent batch of {len(updates)} emails for campaign {campaign_id}"
+        
+    except Retry:
+        raise
+        
+    except Exception as error:
+        db.rollback()
+        error_msg = f"Failed to send batch: {str(error)}"
+        crud.bulk_update_recipient_status(db, [(rid, RecipientStatus.FAILED, error_msg) for rid in recipient_ids])
+        db.commit()
+        settle_sends(campaign_id, len(recipient_ids))
+        raise Exception(error_msg)
+        
+    finally:
+        db.close()
+
+
 @celery_app.task
 def send_campaign_task(campaign_id: int):
     """Send entire campaign task"""
@@ -143,45 +421,57 @@ def send_campaign_task(campaign_id: int):
         if not accounts:
             raise Exception("No active accounts available")
         
-        # Get pending recipients
-        recipients = crud.get_pending_recipients(db, campaign_id, limit=10000)
+        # Stream pending recipient ids only; no ORM objects, no per-run cap
+        pending_ids = crud.get_pending_recipient_ids(db, campaign_id)
         
-        if not recipients:
-            # No pending recipients, mark campaign as completed
-            crud.update_campaign_status(db, campaign_id, CampaignStatus.COMPLETED)
-            return "Campaign completed - no pending recipients"
+        # Hold the counter above zero until every batch has been counted in
+        add_pending(campaign_id, 1)
         
-        # Distribute recipients across accounts
+        # Group recipients into per-account batches, round-robin across accounts;
+        # send_batch_task paces each account against its hourly quota
         account_index = 0
-        batch_delay = 0
+        queued_count = 0
+        batch_ids = []
+        signatures = []
         
-        for i, recipient in enumerate(recipients):
-            # Check if campaign is still in sending status
-            campaign = crud.get_campaign(db, campaign_id)
-            if campaign.status != CampaignStatus.SENDING:
-                break
+        def dispatch():
+            # One group publishes all batches over a single producer connection
+            nonlocal queued_count
+            count = sum(len(signature.args[2]) for signature in signatures)
+            add_pending(campaign_id, count)
+            group(signatures).apply_async()
+            queued_count += count
+            signatures.clear()
+        
+        for recipient_id in pending_ids:
+            batch_ids.append(recipient_id)
+            if len(batch_ids) < SEND_BATCH_SIZE:
+                continue
             
-            # Round-robin account selection
             account = accounts[account_index % len(accounts)]
             account_index += 1
+            signatures.append(send_batch_task.s(account.id, campaign_id, batch_ids))
+            batch_ids = []
+            if len(signatures) < DISPATCH_GROUP_SIZE:
+                continue
             
-            # Schedule email task with staggered delays for rate limiting
-            send_email_task.apply_async(
-                args=[recipient.id, campaign_id, account.id],
-                countdown=batch_delay
-            )
+            # Check if campaign is still in sending status
+            if not campaign_is_sending(db, campaign_id):
+                signatures.clear()
+                break
             
-            # Add delay every 10 emails to respect rate limits
-            if (i + 1) % 10 == 0:
-                batch_delay += 2  # 2 second delay between batches
-        
-        # Schedule periodic check for campaign completion
-        check_campaign_completion.apply_async(
-            args=[campaign_id],
-            countdown=60  # Check after 1 minute
-        )
+            dispatch()
+        
+        if batch_ids:
+            account = accounts[account_index % len(accounts)]
+            signatures.append(send_batch_task.s(account.id, campaign_id, batch_ids))
+        if signatures:
+            dispatch()
         
-        return f"Queued {len(recipients)} emails for campaign {campaign_id}"
+        # Release the guard; finalizes right away if nothing was queued or all batches already finished
+        settle_sends(campaign_id, 1)
+        
+        return f"Queued {queued_count} emails for campaign {campaign_id}"
         
     except Exception as error:
         crud.update_campaign_status(db, campaign_id, CampaignStatus.FAILED)
@@ -192,32 +482,24 @@ def send_campaign_task(campaign_id: int):
 
 
 @celery_app.task
-def check_campaign_completion(campaign_id: int):
-    """Check if campaign is completed and update status"""
+def finalize_campaign_task(campaign_id: int):
+    """Mark a campaign completed once all of its queued sends have finished"""
     db = SessionLocal()
     
     try:
+        redis_client.delete(pending_key(campaign_id))
+        
         campaign = crud.get_campaign(db, campaign_id)
         if not campaign or campaign.status != CampaignStatus.SENDING:
             return
         
-        # Check if there are any pending recipients
-        pending_recipients = crud.get_pending_recipients(db, campaign_id, limit=1)
-        
-        if not pending_recipients:
-            # No pending recipients, mark as completed
-            crud.update_campaign_status(db, campaign_id, CampaignStatus.COMPLETED)
-            return "Campaign marked as completed"
-        else:
-            # Still has pending recipients, schedule another check
-            check_campaign_completion.apply_async(
-                args=[campaign_id],
-                countdown=60  # Check again in 1 minute
-            )
-            return "Campaign still in progress"
-            
-    except Exception as error:
-        return f"Error checking campaign completion: {str(error)}"
+        # Recipients left pending by a run that was cut short go out in another run
+        if crud.has_pending_recipients(db, campaign_id):
+            send_campaign_task.delay(campaign_id)
+            return "Campaign has more pending recipients, queued next run"
+        
+        crud.update_campaign_status(db, campaign_id, CampaignStatus.COMPLETED)
+        return "Campaign marked as completed"
         
     finally:
         db.close()
@@ -234,14 +516,22 @@ celery_app.conf.beat_schedule = {
 
 @celery_app.task
 def check_stalled_campaigns():
-    """Check for campaigns that might be stalled and restart them"""
+    """Finalize or re-dispatch SENDING campaigns whose pending counter has expired"""
     db = SessionLocal()
     
     try:
-        # This is a placeholder for more sophisticated logic
-        # You could check for campaigns that have been "SENDING" for too long
-        # and have pending recipients that haven't been processed
-        pass
+        # Younger campaigns may still be dispatching, or be sent by a sender
+        # that keeps no counter; an expired counter has not moved for PENDING_TTL
+        stalled = [
+            campaign_id for campaign_id in crud.get_sending_campaign_ids(db, started_before_seconds=PENDING_TTL)
+            if not redis_client.exists(pending_key(campaign_id))
+        ]
+        for campaign_id in stalled:
+            # Completes the campaign, or queues a new run for recipients still pending
+            finalize_campaign_task.delay(campaign_id)
+        if stalled:
+            logger.warning(f"Recovering stalled campaigns {stalled}")
+        return f"Recovered {len(stalled)} stalled campaigns"
         
     finally:
         db.close()
\ No newline at end of file
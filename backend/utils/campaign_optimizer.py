@@ -1,8 +1,9 @@
 import math
+from operator import itemgetter
 from typing import List, Dict, Tuple
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, raiseload, selectinload
 from models import Account, User, Recipient, RecipientAssignment, UserStatus
-import crud
 
 
 class CampaignOptimizer:
@@ -13,19 +14,45 @@ class CampaignOptimizer:
     def __init__(self, db: Session):
         self.db = db
     
+    def _load_active_accounts(self, selected_accounts: List[int]) -> List[Account]:
+        """
+        Load the selected active accounts with their users in two queries,
+        keeping the order the accounts were selected in
+        """
+        accounts = self.db.execute(
+            select(Account)
+            .where(Account.id.in_(selected_accounts), Account.active == True)
+            .options(selectinload(Account.users), raiseload('*'))
+        ).scalars().all()
+        by_id = {account.id: account for account in accounts}
+        return [by_id[account_id] for account_id in dict.fromkeys(selected_accounts) if account_id in by_id]
+    
+    def _load_active_user_rows(self, selected_accounts: List[int]) -> List[Tuple]:
+        """
+        Fetch the sending columns of active users in active selected accounts
+        as plain rows, grouped in the order the accounts were selected in
+        """
+        rows = self.db.execute(
+            select(User.id, User.account_id, User.email, User.daily_sent_count, User.hourly_sent_count)
+            .join(Account, Account.id == User.account_id)
+            .where(
+                User.account_id.in_(selected_accounts),
+                User.status == UserStatus.ACTIVE,
+                Account.active == True
+            )
+            .order_by(User.id)
+        ).all()
+        account_order = {account_id: i for i, account_id in enumerate(dict.fromkeys(selected_accounts))}
+        return sorted(rows, key=lambda row: account_order[row.account_id])
+    
     def calculate_optimal_distribution(self, recipients: List[Recipient], 
                                      selected_accounts: List[int]) -> Dict:
         """
         Calculate optimal distribution of recipients across users
         for maximum sending speed
         """
-        # Get active users from selected accounts
-        active_users = []
-        for account_id in selected_accounts:
-            account = crud.get_account(self.db, account_id)
-            if account and account.active:
-                users = crud.get_account_users(self.db, account_id)
-                active_users.extend([u for u in users if u.status == UserStatus.ACTIVE])
+        # Get active users from selected accounts (columns only, no ORM objects)
+        active_users = self._load_active_user_rows(selected_accounts)
         
         if not active_users:
             raise ValueError("No active users available for sending")
@@ -33,7 +60,7 @@ class CampaignOptimizer:
         total_recipients = len(recipients)
         total_users = len(active_users)
         
-        # Calculate base load per user
+        # Calculate base load per user; the first extra_load users take one more
         base_load = total_recipients // total_users
         extra_load = total_recipients % total_users
         
@@ -41,25 +68,24 @@ class CampaignOptimizer:
         distribution = {}
         user_assignments = {}
         
-        for i, user in enumerate(active_users):
-            # Some users get one extra recipient to handle remainder
-            user_load = base_load + (1 if i < extra_load else 0)
+        for i, (user_id, account_id, email, daily_sent, hourly_sent) in enumerate(active_users):
+            user_load = base_load + (i < extra_load)
             
-            distribution[user.email] = {
-                'user_id': user.id,
-                'account_id': user.account_id,
+            distribution[email] = {
+                'user_id': user_id,
+                'account_id': account_id,
                 'assigned_count': user_load,
-                'daily_sent': user.daily_sent_count,
-                'hourly_sent': user.hourly_sent_count,
-                'available_daily': 2000 - user.daily_sent_count,  # Assuming 2000 daily limit
-                'available_hourly': 250 - user.hourly_sent_count   # Assuming 250 hourly limit
+                'daily_sent': daily_sent,
+                'hourly_sent': hourly_sent,
+                'available_daily': 2000 - daily_sent,  # Assuming 2000 daily limit
+                'available_hourly': 250 - hourly_sent   # Assuming 250 hourly limit
             }
             
-            user_assignments[user.email] = user_load
+            user_assignments[email] = user_load
         
         # Calculate estimated sending time
         # Assuming 25 emails per user can be sent in parallel every 2 seconds
-        max_user_load = max(user_assignments.values()) if user_assignments else 0
+        max_user_load = base_load + (1 if extra_load else 0)
         estimated_time = (max_user_load / 25) * 2  # seconds
         
         return {
@@ -73,11 +99,11 @@ class CampaignOptimizer:
         }
     
     def create_recipient_assignments(self, campaign_id: int, recipients: List[Recipient],
-                                   distribution: Dict) -> List[RecipientAssignment]:
+                                   distribution: Dict, chunk_size: int = 5000) -> int:
         """
-        Create optimized recipient assignments based on distribution plan
+        Bulk insert optimized recipient assignments based on distribution plan
         """
-        assignments = []
+        rows = []
         recipient_index = 0
         
         for user_email, user_info in distribution['distribution'].items():
@@ -87,53 +113,29 @@ class CampaignOptimizer:
             # Assign recipients to this user
             for i in range(assigned_count):
                 if recipient_index < len(recipients):
-                    recipient = recipients[recipient_index]
-                    
-                    assignment = RecipientAssignment(
-                        recipient_id=recipient.id,
-                        user_id=user_id,
-                        campaign_id=campaign_id,
-                        batch_number=i // 25,  # 25 emails per batch
-                        priority=i % 25  # Priority within batch
-                    )
-                    assignments.append(assignment)
+                    rows.append({
+                        'recipient_id': recipients[recipient_index].id,
+                        'user_id': user_id,
+                        'campaign_id': campaign_id,
+                        'batch_number': i // 25,  # 25 emails per batch
+                        'priority': i % 25  # Priority within batch
+                    })
                     recipient_index += 1
         
-        return assignments
+        rows = self.optimize_sending_order(rows)
+        
+        # One executemany per chunk instead of a unit-of-work flush per object
+        for start in range(0, len(rows), chunk_size):
+            self.db.bulk_insert_mappings(RecipientAssignment, rows[start:start + chunk_size])
+        
+        return len(rows)
     
-    def optimize_sending_order(self, assignments: List[RecipientAssignment]) -> List[RecipientAssignment]:
+    def optimize_sending_order(self, assignments: List[Dict]) -> List[Dict]:
         """
         Optimize the order of sending for maximum speed
         """
-        # Group by user and batch
-        user_batches = {}
-        
-        for assignment in assignments:
-            user_id = assignment.user_id
-            batch_num = assignment.batch_number
-            
-            if user_id not in user_batches:
-                user_batches[user_id] = {}
-            
-            if batch_num not in user_batches[user_id]:
-                user_batches[user_id][batch_num] = []
-            
-            user_batches[user_id][batch_num].append(assignment)
-        
-        # Reorder for optimal sending
-        optimized_assignments = []
-        max_batches = max(
-            max(batches.keys()) if batches else 0 
-            for batches in user_batches.values()
-        ) + 1 if user_batches else 0
-        
-        # Process batches in parallel across all users
-        for batch_num in range(max_batches):
-            for user_id in user_batches:
-                if batch_num in user_batches[user_id]:
-                    optimized_assignments.extend(user_batches[user_id][batch_num])
-        
-        return optimized_assignments
+        # Batch 0 of every user first, then batch 1, ...
+        return sorted(assignments, key=itemgetter('batch_number', 'user_id', 'priority'))
     
     def validate_account_capacity(self, selected_accounts: List[int], 
                                 recipient_count: int) -> Dict:
@@ -143,12 +145,8 @@ class CampaignOptimizer:
         total_capacity = 0
         account_details = []
         
-        for account_id in selected_accounts:
-            account = crud.get_account(self.db, account_id)
-            if not account or not account.active:
-                continue
-            
-            users = crud.get_account_users(self.db, account_id)
+        for account in self._load_active_accounts(selected_accounts):
+            users = account.users
             active_users = [u for u in users if u.status == UserStatus.ACTIVE]
             
             # Calculate available capacity
@@ -161,7 +159,7 @@ class CampaignOptimizer:
             
             total_capacity += account_capacity
             account_details.append({
-                'account_id': account_id,
+                'account_id': account.id,
                 'account_name': account.name,
                 'active_users': len(active_users),
                 'total_users': len(users),
@@ -3,15 +3,18 @@ Email sending utilities for SpeedSend with user delegation and load distribution
 """
 import asyncio
 import logging
-from typing import Dict, List, Any
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 import time
-import json
 
-from utils.gmail_service import GmailServiceManager, distribute_recipients_across_users
-from models import Campaign, Recipient, User, Account
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from utils.gmail_service import (GmailServiceManager, distribute_recipients_across_users,
+                                 IO_POOL, CampaignRef, RecipientRef, SenderRef, build_raw_messages, error_summary,
+                                 get_retry_after, is_retryable_error, retry_delay)
+from models import Campaign, Recipient, User, Account, RecipientStatus, UserStatus
 from database import SessionLocal
-from utils.encryption import decrypt_data
+from utils.templating import PlaceholderTemplate
+import crud
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +24,21 @@ class EmailSender:
     Handles email sending with proper user delegation and load distribution
     """
     
+    # Gmail batch requests carry up to 100 calls; 50 stays clear of per-batch throttling
+    BATCH_SIZE = 50
+    # Users sending at once per campaign, to stay inside the project-wide quota
+    MAX_CONCURRENT_USERS = 20
+    # Attempts per message for rate-limited or transient Gmail errors
+    MAX_SEND_ATTEMPTS = 5
+    # Pending recipients fetched, sent and recorded per round
+    RECIPIENT_CHUNK_SIZE = 5000
+    # Status rows written per transaction, and attempts per transaction
+    STATUS_COMMIT_SIZE = 1000
+    STATUS_COMMIT_ATTEMPTS = 3
+    
     def __init__(self):
         self.gmail_manager = GmailServiceManager()
-        self.executor = ThreadPoolExecutor(max_workers=50)
+        self.executor = IO_POOL
     
     async def send_campaign_emails(self, campaign_id: int, selected_account_ids: List[int]) -> Dict:
         """
@@ -42,23 +57,17 @@ class EmailSender:
             campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
             if not campaign:
                 raise ValueError(f"Campaign {campaign_id} not found")
+            # Plain copies: the commits below expire the ORM object, and reading it
+            # while sending would re-SELECT it and leave that transaction idle
+            campaign = CampaignRef(campaign.id, campaign.subject, campaign.from_name,
+                                   campaign.html_body, campaign.custom_headers)
             
-            # Get recipients for this campaign
-            recipients = db.query(Recipient).filter(
-                Recipient.campaign_id == campaign_id,
-                Recipient.status == 'Pending'
-            ).all()
-            
-            if not recipients:
-                return {
-                    'success': True,
-                    'message': 'No pending recipients to send',
-                    'sent_count': 0,
-                    'failed_count': 0
-                }
-            
-            # Get selected accounts and their users
-            accounts = db.query(Account).filter(
+            # Get selected accounts with their active users (one batched IN query)
+            accounts = db.query(Account).options(
+                selectinload(Account.users.and_(User.status == UserStatus.ACTIVE)).load_only(
+                    User.email, User.name, User.status, User.account_id
+                )
+            ).filter(
                 Account.id.in_(selected_account_ids),
                 Account.active == True
             ).all()
@@ -66,73 +75,81 @@ class EmailSender:
             if not accounts:
                 raise ValueError("No active accounts found from selected accounts")
             
-            # Collect all active users from selected accounts
             all_users = []
             account_credentials = {}
             
             for account in accounts:
-                # Decrypt and load credentials
-                credentials_data = decrypt_data(account.credentials_path)
-                credentials_dict = json.loads(credentials_data)
-                account_credentials[account.id] = credentials_dict
+                # Load (cached) decrypted credentials
+                account_credentials[account.id] = crud.get_account_credentials(account)
                 
-                # Get users for this account
-                account_users = db.query(User).filter(
-                    User.account_id == account.id,
-                    User.status == 'Active'
-                ).all()
-                
-                for user in account_users:
-                    all_users.append({
-                        'email': user.email,
-                        'name': user.name,
-                        'status': user.status,
-                        'account_id': account.id,
-                        'daily_sent_count': user.daily_sent_count,
-                        'hourly_sent_count': user.hourly_sent_count
-                    })
+                for user in account.users:
+                    all_users.append(SenderRef(user.email, user.name, user.status.value, account.id))
             
             if not all_users:
                 raise ValueError("No active users found in selected accounts")
             
-            # Convert recipients to proper format
-            recipient_list = []
-            for recipient in recipients:
-                recipient_list.append({
-                    'id': recipient.id,
-                    'email': recipient.email,
-                    'name': recipient.name,
-                    'custom_data': recipient.custom_data or {}
-                })
-            
-            # Distribute recipients across users
-            user_assignments = distribute_recipients_across_users(
-                recipient_list, all_users, campaign_id
-            )
+            user_accounts = {user.email: user.account_id for user in all_users}
+            sent_count = failed_count = total_recipients = 0
+            users_used = set()
+            last_id = 0
             
-            logger.info(f"Distributed {len(recipient_list)} recipients across {len(user_assignments)} users")
-            
-            # Send emails concurrently
-            send_results = await self._send_emails_concurrently(
-                campaign, user_assignments, account_credentials
-            )
-            
-            # Update database with results
-            await self._update_sending_results(db, send_results)
+            # Fetch, distribute, send and record one chunk at a time so large
+            # campaigns never hold every recipient in memory
+            while True:
+                recipient_list = [
+                    RecipientRef(row.id, row.email, row.name, row.custom_data or {})
+                    for row in db.query(
+                        Recipient.id, Recipient.email, Recipient.name, Recipient.custom_data
+                    ).filter(
+                        Recipient.campaign_id == campaign_id,
+                        Recipient.status == RecipientStatus.PENDING,
+                        Recipient.id > last_id
+                    ).order_by(Recipient.id).limit(self.RECIPIENT_CHUNK_SIZE)
+                ]
+                # End the read transaction before the (long) sending phase
+                db.commit()
+                
+                if not recipient_list:
+                    break
+                last_id = recipient_list[-1].id
+                total_recipients += len(recipient_list)
+                
+                # Distribute recipients across users
+                user_assignments = distribute_recipients_across_users(
+                    recipient_list, all_users, campaign_id
+                )
+                users_used.update(user_email for user_email, (start, end) in user_assignments.items() if end > start)
+                
+                logger.info(f"Distributed {len(recipient_list)} recipients across {len(user_assignments)} users")
+                
+                # Send emails concurrently
+                send_results = await self._send_emails_concurrently(
+                    campaign, recipient_list, user_assignments, user_accounts, account_credentials
+                )
+                
+                # Update database with results; each chunk commits on its own
+                await self._update_sending_results(db, send_results)
+                
+                chunk_sent = sum(1 for result in send_results if result.get('success'))
+                sent_count += chunk_sent
+                failed_count += len(send_results) - chunk_sent
             
-            # Calculate final stats
-            sent_count = sum(1 for result in send_results if result.get('success'))
-            failed_count = len(send_results) - sent_count
+            if not total_recipients:
+                return {
+                    'success': True,
+                    'message': 'No pending recipients to send',
+                    'sent_count': 0,
+                    'failed_count': 0
+                }
             
             return {
                 'success': True,
                 'campaign_id': campaign_id,
                 'sent_count': sent_count,
                 'failed_count': failed_count,
-                'total_recipients': len(recipient_list),
-                'users_used': len(user_assignments),
-                'accounts_used': len(accounts),
-                'send_results': send_results
+                'total_recipients': total_recipients,
+                'users_used': len(users_used),
+                'accounts_used': len(accounts)
             }
             
         except Exception as e:
@@ -145,27 +162,33 @@ class EmailSender:
         finally:
             db.close()
     
-    async def _send_emails_concurrently(self, campaign: Campaign, 
-                                      user_assignments: Dict[str, List[Dict]],
+    async def _send_emails_concurrently(self, campaign: CampaignRef, 
+                                      recipients: List[RecipientRef],
+                                      user_assignments: Dict[str, Tuple[int, int]],
+                                      user_accounts: Dict[str, int],
                                       account_credentials: Dict[int, Dict]) -> List[Dict]:
         """
         Send emails concurrently using multiple users
         """
         send_tasks = []
+        # Created per send so it binds to the running event loop
+        user_slots = asyncio.Semaphore(self.MAX_CONCURRENT_USERS)
+        
+        async def send_guarded(user_email, start, end, credentials_dict):
+            async with user_slots:
+                return await self._send_user_emails(campaign, user_email, recipients, credentials_dict, start, end)
         
-        for user_email, recipients in user_assignments.items():
-            if not recipients:
+        for user_email, (start, end) in user_assignments.items():
+            if end <= start:
                 continue
             
             # Find the account for this user
-            user_account_id = recipients[0].get('account_id') if recipients else None
+            user_account_id = user_accounts.get(user_email)
             if user_account_id in account_credentials:
                 credentials_dict = account_credentials[user_account_id]
                 
                 # Create task for this user's recipients
-                task = self._send_user_emails(
-                    campaign, user_email, recipients, credentials_dict
-                )
+                task = send_guarded(user_email, start, end, credentials_dict)
                 send_tasks.append(task)
         
         # Execute all sending tasks concurrently
@@ -187,122 +210,146 @@ class EmailSender:
         
         return []
     
-    async def _send_user_emails(self, campaign: Campaign, user_email: str, 
-                              recipients: List[Dict], credentials_dict: Dict) -> List[Dict]:
+    async def _send_user_emails(self, campaign: CampaignRef, user_email: str, 
+                              recipients: List[RecipientRef], credentials_dict: Dict,
+                              start: int = 0, end: int = None) -> List[Dict]:
         """
-        Send emails for a specific user with rate limiting
+        Send recipients[start:end] for a specific user through Gmail batch requests,
+        paced to the user's quota
         """
+        end = len(recipients) if end is None else end
         results = []
         
         try:
             # Get Gmail service for this user
             service = self.gmail_manager.get_gmail_service(credentials_dict, user_email)
+        except Exception as e:
+            logger.error(f"Failed to initialize sending for user {user_email}: {str(e)}")
+            # Mark all recipients for this user as failed
+            return [self._failed_result(recipients[index], user_email, f"User setup failed: {str(e)}")
+                    for index in range(start, end)]
+        
+        loop = asyncio.get_event_loop()
+        # Parse placeholders once for all of this user's recipients
+        body_template = PlaceholderTemplate(campaign.html_body)
+        
+        for chunk_start in range(start, end, self.BATCH_SIZE):
+            chunk = recipients[chunk_start:min(chunk_start + self.BATCH_SIZE, end)]
+            
+            try:
+                # Headers are serialized once per chunk and only To and the body per
+                # message, which is cheaper than shipping the bodies to another process
+                raws = build_raw_messages(
+                    user_email, campaign.subject, campaign.from_name, campaign.custom_headers,
+                    [(recipient.email, recipient.name, body_template.render(recipient.custom_data))
+                     for recipient in chunk]
+                )
+                messages = {str(recipient.id): {'raw': raw} for recipient, raw in zip(chunk, raws)}
+            except Exception as e:
+                logger.error(f"Failed to build messages for {user_email}: {str(e)}")
+                results.extend(self._failed_result(recipient, user_email, str(e)) for recipient in chunk)
+                continue
             
-            for recipient in recipients:
+            # Rate-limited and transient failures are resent as a smaller follow-up batch
+            pending = chunk
+            for attempt in range(self.MAX_SEND_ATTEMPTS):
+                responses = {}
+                
+                def on_done(request_id, response, exception):
+                    responses[request_id] = (response, exception)
+                
+                # Token buckets pace each send to the user's and the project's quota, so
+                # the next batch goes out as soon as budget allows rather than after a fixed idle
+                await self.gmail_manager.acquire_send_quota(user_email, len(pending))
                 try:
-                    # Create email message
-                    message = self.gmail_manager.create_message(
-                        sender_email=user_email,
-                        to_email=recipient['email'],
-                        to_name=recipient['name'],
-                        subject=campaign.subject,
-                        html_body=self._process_template(campaign.html_body, recipient['custom_data']),
-                        sender_name=campaign.from_name,
-                        custom_headers=campaign.custom_headers
-                    )
-                    
-                    # Send email
-                    sent_message = service.users().messages().send(
-                        userId='me', body={'raw': message}
-                    ).execute()
-                    
-                    results.append({
-                        'success': True,
-                        'recipient_id': recipient['id'],
-                        'recipient_email': recipient['email'],
-                        'sender_user': user_email,
-                        'message_id': sent_message.get('id'),
-                        'sent_at': time.time()
-                    })
-                    
-                    logger.info(f"Email sent to {recipient['email']} via {user_email}")
-                    
-                    # Rate limiting - respect Gmail API limits
-                    await asyncio.sleep(0.1)  # 10 emails per second max per user
+                    batch = service.new_batch_http_request(callback=on_done)
+                    for recipient in pending:
+                        request_id = str(recipient.id)
+                        batch.add(service.users().messages().send(userId='me', body=messages[request_id]),
+                                  request_id=request_id)
                     
+                    # One multipart HTTP request for the whole chunk
+                    await loop.run_in_executor(self.executor, batch.execute)
                 except Exception as e:
-                    logger.error(f"Failed to send email to {recipient['email']} via {user_email}: {str(e)}")
-                    results.append({
-                        'success': False,
-                        'recipient_id': recipient['id'],
-                        'recipient_email': recipient['email'],
-                        'sender_user': user_email,
-                        'error': str(e),
-                        'sent_at': time.time()
-                    })
+                    logger.error(f"Batch send via {user_email} failed: {str(e)}")
+                    results.extend(self._failed_result(recipient, user_email, str(e)) for recipient in pending)
+                    break
+                
+                sent_at = time.time()
+                retry = []
+                retry_after = None
+                for recipient in pending:
+                    response, exception = responses.get(str(recipient.id), (None, 'No response in batch'))
+                    if exception is None:
+                        results.append({
+                            'success': True,
+                            'recipient_id': recipient.id,
+                            'recipient_email': recipient.email,
+                            'sender_user': user_email,
+                            'message_id': response.get('id'),
+                            'sent_at': sent_at
+                        })
+                    elif is_retryable_error(exception) and attempt + 1 < self.MAX_SEND_ATTEMPTS:
+                        retry.append(recipient)
+                        retry_after = max(filter(None, (retry_after, get_retry_after(exception))), default=None)
+                    else:
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Failed to send email to %s via %s: %s", recipient.email, user_email, exception)
+                        results.append(self._failed_result(recipient, user_email, error_summary(exception), sent_at))
+                
+                if not retry:
+                    break
+                pending = retry
+                await asyncio.sleep(retry_delay(attempt, retry_after))
             
-        except Exception as e:
-            logger.error(f"Failed to initialize sending for user {user_email}: {str(e)}")
-            # Mark all recipients for this user as failed
-            for recipient in recipients:
-                results.append({
-                    'success': False,
-                    'recipient_id': recipient['id'],
-                    'recipient_email': recipient['email'],
-                    'sender_user': user_email,
-                    'error': f"User setup failed: {str(e)}",
-                    'sent_at': time.time()
-                })
+            logger.debug("Sent batch of %d emails via %s", len(chunk), user_email)
         
+        sent = sum(1 for result in results if result['success'])
+        logger.info("User %s sent %d/%d emails", user_email, sent, end - start)
         return results
     
-    def _process_template(self, html_body: str, custom_data: Dict) -> str:
-        """
-        Process email template with recipient-specific data
-        
-        Args:
-            html_body: HTML template with {{variable}} placeholders
-            custom_data: Dictionary with variable values
-            
-        Returns:
-            Processed HTML content
-        """
-        if not custom_data:
-            return html_body
-        
-        processed = html_body
-        for key, value in custom_data.items():
-            placeholder = f"{{{{{key}}}}}"
-            processed = processed.replace(placeholder, str(value))
-        
-        return processed
+    @staticmethod
+    def _failed_result(recipient: RecipientRef, user_email: str, error: str, sent_at: float = None) -> Dict:
+        return {
+            'success': False,
+            'recipient_id': recipient.id,
+            'recipient_email': recipient.email,
+            'sender_user': user_email,
+            'error': error,
+            'sent_at': sent_at or time.time()
+        }
     
     async def _update_sending_results(self, db, send_results: List[Dict]):
         """
         Update database with sending results
         """
-        try:
-            for result in send_results:
-                recipient_id = result.get('recipient_id')
-                if recipient_id:
-                    recipient = db.query(Recipient).filter(
-                        Recipient.id == recipient_id
-                    ).first()
-                    
-                    if recipient:
-                        if result.get('success'):
-                            recipient.status = 'Sent'
-                            recipient.sent_at = result.get('sent_at')
-                        else:
-                            recipient.status = 'Failed'
-                            recipient.last_error = result.get('error', 'Unknown error')
-            
-            db.commit()
-            logger.info(f"Updated {len(send_results)} recipient statuses")
-            
-        except Exception as e:
-            logger.error(f"Error updating sending results: {str(e)}")
-            db.rollback()
+        # recipient_id is authoritative; write outcomes in bulk passes
+        updates = [
+            (result['recipient_id'], RecipientStatus.SENT, None) if result.get('success')
+            else (result['recipient_id'], RecipientStatus.FAILED, result.get('error', 'Unknown error'))
+            for result in send_results if result.get('recipient_id')
+        ]
+        
+        # Commit per chunk so row locks are short and the connection is released regularly
+        for start in range(0, len(updates), self.STATUS_COMMIT_SIZE):
+            chunk = updates[start:start + self.STATUS_COMMIT_SIZE]
+            for attempt in range(self.STATUS_COMMIT_ATTEMPTS):
+                try:
+                    crud.bulk_update_recipient_status(db, chunk)
+                    db.commit()
+                    break
+                except SQLAlchemyError as e:
+                    db.rollback()
+                    if attempt == self.STATUS_COMMIT_ATTEMPTS - 1:
+                        logger.error(f"Error updating sending results: {str(e)}")
+                        break
+                    await asyncio.sleep(2 ** attempt)
+                except Exception as e:
+                    logger.error(f"Error updating sending results: {str(e)}")
+                    db.rollback()
+                    break
+        
+        logger.info(f"Updated {len(updates)} recipient statuses")
 
 
 # Global email sender instance
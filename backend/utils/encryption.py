@@ -1,8 +1,11 @@
 import os
 import base64
+import binascii
+from functools import lru_cache
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from core.config import settings
 
 
@@ -21,32 +24,49 @@ def generate_key_from_password(password: str, salt: bytes = None) -> bytes:
     return key
 
 
+# Fixed salt so every process derives the same key from a passphrase
+PASSPHRASE_SALT = b"speedsend-credentials-key"
+
+
+def derive_key_from_passphrase(passphrase: str) -> bytes:
+    """Derive a 32-byte key from a low-entropy passphrase with scrypt"""
+    kdf = Scrypt(salt=PASSPHRASE_SALT, length=32, n=2**14, r=8, p=1)
+    return kdf.derive(passphrase.encode())
+
+
+@lru_cache(maxsize=1)
 def get_encryption_key() -> bytes:
     """Get the encryption key from settings"""
-    # Use the encryption key from settings
-    # In production, this should be a proper base64-encoded key
+    # Deployments should set ENCRYPTION_KEY to a random base64 key of 32 bytes
+    # (openssl rand -base64 32, or Fernet.generate_key()); it is used as is
     encryption_key = settings.encryption_key
-    
-    # If it's not a proper base64 key, derive one
     try:
-        return base64.urlsafe_b64decode(encryption_key + '==')  # Add padding if needed
-    except:
-        # Generate key from the string
-        return generate_key_from_password(encryption_key)
+        key = base64.urlsafe_b64decode(encryption_key + '==')  # Add padding if needed
+    except (binascii.Error, ValueError):
+        key = b''
+    if len(key) >= 32:
+        return key
+    
+    # Only passphrases that aren't a 32-byte key go through a KDF
+    return derive_key_from_passphrase(encryption_key)
+
+
+@lru_cache(maxsize=1)
+def _get_fernet() -> Fernet:
+    """Build the Fernet instance once per process; call _get_fernet.cache_clear()
+    (and get_encryption_key.cache_clear()) if settings.encryption_key changes at runtime"""
+    key = get_encryption_key()
+    return Fernet(base64.urlsafe_b64encode(key[:32]))  # Ensure 32 bytes
 
 
 def encrypt_data(data: str) -> str:
     """Encrypt string data and return base64 encoded result"""
-    key = get_encryption_key()
-    f = Fernet(base64.urlsafe_b64encode(key[:32]))  # Ensure 32 bytes
-    encrypted_data = f.encrypt(data.encode())
+    encrypted_data = _get_fernet().encrypt(data.encode())
     return base64.b64encode(encrypted_data).decode()
 
 
 def decrypt_data(encrypted_data: str) -> str:
     """Decrypt base64 encoded data and return original string"""
-    key = get_encryption_key()
-    f = Fernet(base64.urlsafe_b64encode(key[:32]))  # Ensure 32 bytes
     encrypted_bytes = base64.b64decode(encrypted_data.encode())
-    decrypted_data = f.decrypt(encrypted_bytes)
-    return decrypted_data.decode()
\ No newline at end of file
+    decrypted_data = _get_fernet().decrypt(encrypted_bytes)
+    return decrypted_data.decode()
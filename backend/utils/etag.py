@@ -0,0 +1,63 @@
+"""
+Conditional GET support: weak ETags over response bodies and empty 304s
+for clients that already hold the current representation
+"""
+import hashlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+
+def _opaque(tag: str) -> str:
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+class ETagMiddleware:
+    """
+    Pure ASGI middleware: buffers 200 GET responses, tags them with a hash of
+    the body and answers a matching If-None-Match with 304 and no payload.
+    Install it inside GZipMiddleware so the tag covers the uncompressed body
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start = None
+        chunks = []
+
+        async def buffered_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                await self._send_tagged(start, b"".join(chunks), if_none_match, send)
+
+        await self.app(scope, receive, buffered_send)
+
+    async def _send_tagged(self, start, body: bytes, if_none_match, send):
+        headers = MutableHeaders(raw=start["headers"])
+        if start["status"] == 200 and "etag" not in headers:
+            etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            headers["ETag"] = etag
+            if if_none_match and (
+                if_none_match.strip() == "*"
+                or _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
+            ):
+                del headers["content-length"]
+                await send({**start, "status": 304})
+                await send({"type": "http.response.body", "body": b""})
+                return
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
@@ -1,19 +1,33 @@
 import asyncio
+import atexit
 import aiohttp
 import json
-from typing import List, Dict, Optional
+import orjson
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import HttpError
 import base64
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import re
+from email.header import Header
+from email.utils import formataddr
+from email.parser import BytesParser
+from email import policy as email_policy
 from concurrent.futures import ThreadPoolExecutor
+import os
 import time
+from datetime import timezone
+import random
+import threading
+from contextlib import asynccontextmanager
+from collections import OrderedDict
 import logging
 
 from core.config import settings
 from utils.encryption import decrypt_data
+from utils.rate_limiter import AdaptiveConcurrencyLimit, AsyncTokenBucket
 
 logger = logging.getLogger(__name__)
 
@@ -30,55 +44,344 @@ REQUIRED_SCOPES = [
     'https://www.googleapis.com/auth/admin.directory.domain.readonly'
 ]
 
+GMAIL_SEND_URL = 'https://gmail.googleapis.com/gmail/v1/users/me/messages/send'
+
+GMAIL_BATCH_URL = 'https://gmail.googleapis.com/batch/gmail/v1'
+BATCH_BOUNDARY = 'batch_speedsend'
+# Gmail accepts 100 calls per batch but throttles sends beyond ~50
+GMAIL_BATCH_SIZE = 50
+
+# Gmail responses worth retrying: rate limits and transient backend errors
+RETRYABLE_STATUSES = frozenset((429, 500, 502, 503, 504))
+MAX_RETRY_DELAY = 60
+# Access tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
+
+def is_retryable_error(error) -> bool:
+    """Whether a Gmail API error is a rate limit or transient failure"""
+    return isinstance(error, HttpError) and error.resp.status in RETRYABLE_STATUSES
+
+
+def error_summary(error) -> str:
+    """
+    Short description of a send error; for HttpError only the status and the
+    reason parsed at construction are used, skipping str(error)'s formatting
+    """
+    if isinstance(error, HttpError):
+        return f"HTTP {error.resp.status}: {error.reason}"
+    return str(error)
+
+
+def get_retry_after(error) -> Optional[float]:
+    """Seconds from a Retry-After header, when Gmail sends one"""
+    if isinstance(error, HttpError):
+        retry_after = error.resp.get('retry-after')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return None
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with jitter, or the server's Retry-After when given"""
+    if retry_after is not None:
+        return min(MAX_RETRY_DELAY, retry_after)
+    return min(MAX_RETRY_DELAY, 2 ** attempt + random.uniform(0, 1))
+
+
+def encode_header(value: str) -> bytes:
+    """RFC 2047-encode a header value only when it is not plain ASCII"""
+    if value.isascii():
+        return value.encode()
+    return Header(value, 'utf-8').encode(linesep='\r\n').encode()
+
+
+# Per-recipient placeholders filled in by the message builder itself
+RECIPIENT_PLACEHOLDER_PATTERN = re.compile(r"\{\{(name|email)\}\}")
+
+
+def encode_html_body(html_body: str) -> bytes:
+    """base64 body in 76-column CRLF lines"""
+    return base64.encodebytes(html_body.encode('utf-8')).replace(b'\n', b'\r\n')
+
+
+class RawMessageTemplate:
+    """
+    RFC 5322 message for one sender and subject with every header but To
+    serialized once; per recipient only To and, when the body mentions
+    {{name}} or {{email}}, the body are rendered and encoded
+    """
+    
+    def __init__(self, sender_email: str, subject: str, html_body: str = '',
+                 sender_name: str = None, custom_headers: Dict = None):
+        headers = [
+            b'From: ' + (formataddr((sender_name, sender_email), charset='utf-8') if sender_name else sender_email).encode(),
+            b'Subject: ' + encode_header(subject),
+        ]
+        
+        # Add custom headers for better deliverability
+        if custom_headers:
+            for key, value in custom_headers.items():
+                headers.append(key.encode() + b': ' + encode_header(str(value)))
+        
+        # Default headers for better deliverability
+        headers.append(b'Reply-To: ' + sender_email.encode())
+        headers.append(b'Return-Path: ' + sender_email.encode())
+        headers.append(b'List-Unsubscribe: <mailto:' + sender_email.encode() + b'?subject=unsubscribe>')
+        headers.append(b'MIME-Version: 1.0')
+        headers.append(b'Content-Type: text/html; charset="utf-8"')
+        headers.append(b'Content-Transfer-Encoding: base64')
+        
+        self.headers = b'\r\n'.join(headers) + b'\r\n\r\n'
+        # Split once around {{name}}/{{email}}; rendering is then a single join
+        parts = RECIPIENT_PLACEHOLDER_PATTERN.split(html_body) if '{{' in html_body else [html_body]
+        self.literals = parts[0::2]
+        self.fields = parts[1::2]
+        self.default_body = None if self.fields else encode_html_body(html_body)
+    
+    def render(self, to_email: str, to_name: str, html_body: str = None) -> str:
+        """base64url message for one recipient; html_body overrides the template's body"""
+        return self.render_raw(to_email, to_name, html_body).decode()
+    
+    def render_raw(self, to_email: str, to_name: str, html_body: str = None) -> bytes:
+        """render() as bytes, for callers that write the request body themselves"""
+        values = {'name': to_name or '', 'email': to_email}
+        if html_body is not None:
+            # Personalize content in one pass
+            if '{{' in html_body:
+                html_body = RECIPIENT_PLACEHOLDER_PATTERN.sub(lambda match: values[match.group(1)], html_body)
+            body = encode_html_body(html_body)
+        elif self.default_body is not None:
+            body = self.default_body
+        else:
+            out = [self.literals[0]]
+            for field, literal in zip(self.fields, self.literals[1:]):
+                out.append(values[field])
+                out.append(literal)
+            body = encode_html_body(''.join(out))
+        
+        to_header = b'To: ' + formataddr((to_name, to_email), charset='utf-8').encode() + b'\r\n'
+        return base64.urlsafe_b64encode(to_header + self.headers + body)
+
+
+def build_raw_message(sender_email: str, to_email: str, to_name: str, subject: str,
+                      html_body: str, sender_name: str = None, custom_headers: Dict = None) -> str:
+    """Build the base64url RFC 5322 message as bytes directly"""
+    return RawMessageTemplate(sender_email, subject, html_body, sender_name, custom_headers).render(to_email, to_name)
+
+
+def build_raw_messages(sender_email: str, subject: str, sender_name: Optional[str],
+                       custom_headers: Optional[Dict], recipients: List[tuple]) -> List[str]:
+    """Build raw messages for (to_email, to_name, html_body) tuples sharing one sender"""
+    template = RawMessageTemplate(sender_email, subject, sender_name=sender_name, custom_headers=custom_headers)
+    return [template.render(to_email, to_name, html_body) for to_email, to_name, html_body in recipients]
+
+
+def build_batch_body(messages: List[tuple]) -> bytes:
+    """multipart/mixed body with one messages.send sub-request per (request_id, message);
+    a message's raw may be str or base64url bytes"""
+    parts = []
+    for request_id, message in messages:
+        raw = message['raw']
+        # base64url needs no JSON escaping, so raw bytes are framed directly
+        payload = b'{"raw":"' + raw + b'"}' if isinstance(raw, bytes) else orjson.dumps(message)
+        parts.append(
+            f"--{BATCH_BOUNDARY}\r\n"
+            f"Content-Type: application/http\r\n"
+            f"Content-ID: <item-{request_id}>\r\n\r\n"
+            f"POST /gmail/v1/users/me/messages/send HTTP/1.1\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload + b"\r\n"
+        )
+    parts.append(f"--{BATCH_BOUNDARY}--\r\n".encode())
+    return b"".join(parts)
+
+
+def parse_batch_response(content_type: str, content: bytes):
+    """Yield (request_id, status, headers, body) for each part of a batch response"""
+    envelope = BytesParser(policy=email_policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + content
+    )
+    for part in envelope.iter_parts():
+        # Responses echo the request's Content-ID as <response-item-{id}>
+        request_id = (part['Content-ID'] or '').strip('<>').replace('response-item-', '', 1)
+        http_response = part.get_payload(decode=True) or b''
+        head, _, body = http_response.partition(b'\r\n\r\n')
+        status_line, *header_lines = head.decode(errors='replace').split('\r\n')
+        status = int(status_line.split()[1]) if len(status_line.split()) > 1 else 0
+        headers = dict(line.split(': ', 1) for line in header_lines if ': ' in line)
+        yield request_id, status, headers, body.strip()
+
+
+# Shared by every manager/sender in the process; Gmail calls are I/O bound but
+# threads beyond a few dozen just contend on the GIL and sockets
+IO_POOL = ThreadPoolExecutor(max_workers=min(64, (os.cpu_count() or 4) * 8), thread_name_prefix='gmail-io')
+atexit.register(IO_POOL.shutdown, wait=True)
+
+# Parsed service account credentials keyed by (client_email, private_key_id, scopes);
+# parsing the PEM key is the expensive part, with_subject copies are cheap
+_base_credentials = {}
+_base_credentials_lock = threading.Lock()
+
+
+def get_service_account_credentials(credentials_dict: dict, scopes=REQUIRED_SCOPES) -> Credentials:
+    """Shared service account credentials; call with_subject() for a delegated copy"""
+    cache_key = (credentials_dict.get('client_email'), credentials_dict.get('private_key_id'), tuple(scopes))
+    with _base_credentials_lock:
+        credentials = _base_credentials.get(cache_key)
+    if credentials is None:
+        credentials = Credentials.from_service_account_info(credentials_dict, scopes=list(scopes))
+        with _base_credentials_lock:
+            credentials = _base_credentials.setdefault(cache_key, credentials)
+    return credentials
+
+
+# Bundled discovery documents parsed once per process; gmail.v1 alone is ~300KB of JSON
+_discovery_documents = {}
+
+
+def build_service(service_name: str, version: str, credentials):
+    """build() from a pre-parsed bundled discovery document, skipping the read and json.loads per call"""
+    document = _discovery_documents.get((service_name, version))
+    if document is None:
+        content = discovery_cache.get_static_doc(service_name, version)
+        if content is None:
+            return build(service_name, version, credentials=credentials, cache_discovery=False)
+        document = _discovery_documents.setdefault((service_name, version), json.loads(content))
+    return build_from_document(document, credentials=credentials)
+
+
+def close_service(service):
+    """Close a discovery Resource's HTTP connections"""
+    try:
+        service.close()
+    except Exception as error:
+        logger.debug("Could not close Gmail service: %s", error)
+
+
+# Keep-alive sessions per event loop; a ClientSession only works on the loop it was created on
+_http_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """The running loop's keep-alive session, created on first use or after it was closed"""
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        # Loops that have since closed took their sockets with them; forget their sessions
+        for stale in [other for other in _http_sessions if other.is_closed()]:
+            del _http_sessions[stale]
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=100, ttl_dns_cache=300, keepalive_timeout=75)
+        session = _http_sessions[loop] = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=60),
+            json_serialize=lambda obj: orjson.dumps(obj).decode()
+        )
+    return session
+
+
+async def close_http_session():
+    """Close the running loop's session and its pooled connections; call on shutdown"""
+    session = _http_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
 
 class GmailServiceManager:
+    # Delegated services kept alive; least recently used are dropped beyond this,
+    # and any service is rebuilt after SERVICE_TTL seconds
+    MAX_CACHED_SERVICES = 1000
+    SERVICE_TTL = 1800
+    # Gmail quota units: 250/s per user, 1.2M/min per project; messages.send costs 100
+    USER_QUOTA_UNITS_PER_SECOND = 250
+    PROJECT_QUOTA_UNITS_PER_SECOND = 20000
+    SEND_QUOTA_UNITS = 100
+    
     def __init__(self):
-        self.services = {}  # Cache for Gmail services
-        self.executor = ThreadPoolExecutor(max_workers=100)  # For concurrent API calls
+        self.services = OrderedDict()  # LRU cache: user_email -> (Gmail service, created at)
+        self._services_lock = threading.Lock()
+        self.executor = IO_POOL  # Token refreshes only; sends go through aiohttp
+        self._tokens = {}  # user_email -> (delegated credentials, access token, expires at)
+        self._project_limiter = AsyncTokenBucket(self.PROJECT_QUOTA_UNITS_PER_SECOND)
+        self._user_limiters = {}  # user_email -> AsyncTokenBucket
+        self._slots_loop = None
+        self._global_slots = None
+        self._user_slots = {}  # user_email -> asyncio.Semaphore
+    
+    def _get_access_token(self, credentials_dict: dict, user_email: str) -> str:
+        """Delegated access token for user_email, refreshed shortly before expiry"""
+        cached = self._tokens.get(user_email)
+        if cached and cached[2] - TOKEN_REFRESH_MARGIN > time.time():
+            return cached[1]
+        
+        delegated_credentials = cached[0] if cached else \
+            get_service_account_credentials(credentials_dict).with_subject(user_email)
+        delegated_credentials.refresh(GoogleAuthRequest())
+        
+        expires_at = delegated_credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+        self._tokens[user_email] = (delegated_credentials, delegated_credentials.token, expires_at)
+        return delegated_credentials.token
     
     def get_gmail_service(self, credentials_dict: dict, user_email: str):
         """Create or get cached Gmail service for a user with all required scopes"""
         cache_key = f"{user_email}"
         
-        if cache_key not in self.services:
-            # Validate service account JSON structure
-            required_fields = [
-                'type', 'project_id', 'private_key_id', 'private_key',
-                'client_email', 'client_id', 'auth_uri', 'token_uri'
-            ]
-            
-            missing_fields = [field for field in required_fields if field not in credentials_dict]
-            if missing_fields:
-                raise ValueError(f"Missing required fields in service account JSON: {', '.join(missing_fields)}")
-            
-            if credentials_dict.get('type') != 'service_account':
-                raise ValueError("JSON file must be a service account credential file")
-            
-            # Create credentials with all required scopes
-            credentials = Credentials.from_service_account_info(
-                credentials_dict,
-                scopes=REQUIRED_SCOPES
-            )
-            
-            # Delegate to the specific user email (not admin)
-            delegated_credentials = credentials.with_subject(user_email)
-            service = build('gmail', 'v1', credentials=delegated_credentials, cache_discovery=False)
-            self.services[cache_key] = service
-            
-            logger.info(f"Created Gmail service for user: {user_email}")
+        expired = None
+        with self._services_lock:
+            cached = self.services.get(cache_key)
+            if cached is not None:
+                service, created_at = cached
+                if time.monotonic() - created_at < self.SERVICE_TTL:
+                    self.services.move_to_end(cache_key)
+                    return service
+                expired = self.services.pop(cache_key)[0]
+        if expired is not None:
+            close_service(expired)
+        
+        # Validate service account JSON structure
+        required_fields = [
+            'type', 'project_id', 'private_key_id', 'private_key',
+            'client_email', 'client_id', 'auth_uri', 'token_uri'
+        ]
+        
+        missing_fields = [field for field in required_fields if field not in credentials_dict]
+        if missing_fields:
+            raise ValueError(f"Missing required fields in service account JSON: {', '.join(missing_fields)}")
+        
+        if credentials_dict.get('type') != 'service_account':
+            raise ValueError("JSON file must be a service account credential file")
+        
+        # Create credentials with all required scopes
+        credentials = get_service_account_credentials(credentials_dict)
         
-        return self.services[cache_key]
+        # Delegate to the specific user email (not admin)
+        delegated_credentials = credentials.with_subject(user_email)
+        service = build_service('gmail', 'v1', delegated_credentials)
+        
+        logger.info(f"Created Gmail service for user: {user_email}")
+        
+        evicted = []
+        with self._services_lock:
+            # Another thread may have built it meanwhile; keep the first one
+            kept, _ = self.services.setdefault(cache_key, (service, time.monotonic()))
+            if kept is not service:
+                evicted.append(service)
+            service = kept
+            self.services.move_to_end(cache_key)
+            while len(self.services) > self.MAX_CACHED_SERVICES:
+                evicted.append(self.services.popitem(last=False)[1][0])
+        
+        # Release the dropped services' HTTP connections outside the lock
+        for dropped in evicted:
+            close_service(dropped)
+        return service
     
     def get_admin_directory_service(self, credentials_dict: dict, admin_email: str):
         """Create Admin Directory service for user management"""
-        credentials = Credentials.from_service_account_info(
-            credentials_dict,
-            scopes=REQUIRED_SCOPES
-        )
+        credentials = get_service_account_credentials(credentials_dict)
         
         # Delegate to admin for directory operations
         delegated_credentials = credentials.with_subject(admin_email)
-        service = build('admin', 'directory_v1', credentials=delegated_credentials, cache_discovery=False)
+        service = build_service('admin', 'directory_v1', delegated_credentials)
         
         return service
     
@@ -86,85 +389,232 @@ class GmailServiceManager:
                       subject: str, html_body: str, sender_name: str = None, 
                       custom_headers: Dict = None):
         """Create a message for an email with optimized headers"""
-        message = MIMEMultipart('alternative')
-        message['to'] = f"{to_name} <{to_email}>"
-        message['from'] = f"{sender_name} <{sender_email}>" if sender_name else sender_email
-        message['subject'] = subject
-        
-        # Add custom headers for better deliverability
-        if custom_headers:
-            for key, value in custom_headers.items():
-                message[key] = value
-        
-        # Default headers for better deliverability
-        message['Reply-To'] = sender_email
-        message['Return-Path'] = sender_email
-        message['List-Unsubscribe'] = f"<mailto:{sender_email}?subject=unsubscribe>"
-        
-        # Personalize content
-        personalized_html = html_body.replace("{{name}}", to_name).replace("{{email}}", to_email)
-        
-        # Create HTML part
-        html_part = MIMEText(personalized_html, 'html')
-        message.attach(html_part)
-
-        # Encode message
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        raw_message = build_raw_message(sender_email, to_email, to_name, subject,
+                                        html_body, sender_name, custom_headers)
         return {'raw': raw_message}
     
-    async def send_email_async(self, service, message_data: dict, user_email: str):
-        """Send email asynchronously"""
-        loop = asyncio.get_event_loop()
+    async def _access_token(self, credentials_dict: dict, user_email: str) -> str:
+        cached = self._tokens.get(user_email)
+        if cached and cached[2] - TOKEN_REFRESH_MARGIN > time.time():
+            return cached[1]
+        # Refreshing is a blocking token exchange; keep it off the loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get_access_token, credentials_dict, user_email)
+    
+    async def prewarm_tokens(self, credentials_dict: dict, user_emails: List[str]):
+        """Mint access tokens for all user_emails concurrently before sending starts"""
+        results = await asyncio.gather(
+            *(self._access_token(credentials_dict, user_email) for user_email in user_emails),
+            return_exceptions=True
+        )
+        for user_email, result in zip(user_emails, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not prewarm token for {user_email}: {result}")
+    
+    async def send_email_async(self, credentials_dict: dict, message_data: dict, user_email: str):
+        """Send email over the shared aiohttp session with a cached delegated token"""
+        try:
+            token = await self._access_token(credentials_dict, user_email)
+        except Exception as error:
+            return {'success': False, 'error': str(error), 'user_email': user_email, 'retry': False}
         
-        def send_email_sync():
-            try:
-                result = service.users().messages().send(userId='me', body=message_data).execute()
-                return {'success': True, 'message_id': result.get('id'), 'user_email': user_email}
-            except HttpError as error:
-                return {'success': False, 'error': str(error), 'user_email': user_email, 'retry': error.resp.status in [429, 500, 502, 503, 504]}
-            except Exception as error:
-                return {'success': False, 'error': str(error), 'user_email': user_email, 'retry': False}
+        try:
+            session = get_http_session()
+            async with self._in_flight(user_email), session.post(
+                GMAIL_SEND_URL, json=message_data, headers={'Authorization': f'Bearer {token}'}
+            ) as response:
+                self._report(response.status in RETRYABLE_STATUSES)
+                if response.status == 200:
+                    result = await response.json()
+                    return {'success': True, 'message_id': result.get('id'), 'user_email': user_email}
+                
+                retry_after = response.headers.get('Retry-After')
+                return {
+                    'success': False,
+                    'error': f"HTTP {response.status}: {await response.text()}",
+                    'user_email': user_email,
+                    'retry': response.status in RETRYABLE_STATUSES,
+                    'retry_after': float(retry_after) if retry_after and retry_after.isdigit() else None
+                }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            return {'success': False, 'error': str(error), 'user_email': user_email, 'retry': True}
+        except Exception as error:
+            return {'success': False, 'error': str(error), 'user_email': user_email, 'retry': False}
+    
+    async def _send_with_retry(self, credentials_dict: dict, message_data: dict, user_email: str,
+                               max_attempts: int = 5):
+        """Send email, retrying rate limits and transient errors with backoff"""
+        for attempt in range(max_attempts):
+            result = await self.send_email_async(credentials_dict, message_data, user_email)
+            if result['success'] or not result.get('retry') or attempt == max_attempts - 1:
+                return result
+            await asyncio.sleep(retry_delay(attempt, result.get('retry_after')))
+    
+    async def send_batch_http(self, credentials_dict: dict, user_email: str,
+                              messages: List[tuple]) -> Dict[str, Dict]:
+        """
+        Send (request_id, message) pairs as one multipart/mixed Gmail batch
+        request; returns a send_email_async-style result per request id
+        """
+        def failed(error: str, retry: bool, retry_after: Optional[float] = None) -> Dict[str, Dict]:
+            return {request_id: {'success': False, 'error': error, 'user_email': user_email,
+                                 'retry': retry, 'retry_after': retry_after}
+                    for request_id, _ in messages}
+        
+        try:
+            token = await self._access_token(credentials_dict, user_email)
+        except Exception as error:
+            return failed(str(error), False)
         
-        return await loop.run_in_executor(self.executor, send_email_sync)
+        try:
+            session = get_http_session()
+            async with self._in_flight(user_email), session.post(GMAIL_BATCH_URL, data=build_batch_body(messages), headers={
+                'Authorization': f'Bearer {token}',
+                'Content-Type': f'multipart/mixed; boundary={BATCH_BOUNDARY}'
+            }) as response:
+                content = await response.read()
+                if response.status != 200:
+                    self._report(response.status in RETRYABLE_STATUSES)
+                    retry_after = response.headers.get('Retry-After')
+                    return failed(f"HTTP {response.status}: {content.decode(errors='replace')}",
+                                  response.status in RETRYABLE_STATUSES,
+                                  float(retry_after) if retry_after and retry_after.isdigit() else None)
+                content_type = response.headers['Content-Type']
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            return failed(str(error), True)
+        except Exception as error:
+            return failed(str(error), False)
+        
+        results = failed('No response in batch', True)
+        throttled = False
+        for request_id, status, headers, body in parse_batch_response(content_type, content):
+            if request_id not in results:
+                continue
+            throttled = throttled or status in RETRYABLE_STATUSES
+            if status == 200:
+                results[request_id] = {'success': True, 'message_id': orjson.loads(body).get('id'),
+                                       'user_email': user_email}
+            else:
+                retry_after = headers.get('Retry-After')
+                results[request_id] = {
+                    'success': False,
+                    'error': f"HTTP {status}: {body.decode(errors='replace')}",
+                    'user_email': user_email,
+                    'retry': status in RETRYABLE_STATUSES,
+                    'retry_after': float(retry_after) if retry_after and retry_after.isdigit() else None
+                }
+        self._report(throttled)
+        return results
+    
+    async def _send_batch_with_retry(self, credentials_dict: dict, user_email: str,
+                                     messages: List[tuple], max_attempts: int = 5) -> Dict[str, Dict]:
+        """Send a batch, resending only rate-limited or transiently failed items with backoff"""
+        results = {}
+        pending = messages
+        for attempt in range(max_attempts):
+            await self.acquire_send_quota(user_email, len(pending))
+            batch_results = await self.send_batch_http(credentials_dict, user_email, pending)
+            results.update(batch_results)
+            retry = [(request_id, message) for request_id, message in pending
+                     if not batch_results[request_id]['success'] and batch_results[request_id].get('retry')]
+            if not retry or attempt == max_attempts - 1:
+                break
+            pending = retry
+            retry_after = max(filter(None, (batch_results[request_id].get('retry_after') for request_id, _ in retry)),
+                              default=None)
+            await asyncio.sleep(retry_delay(attempt, retry_after))
+        return results
+    
+    @asynccontextmanager
+    async def _in_flight(self, user_email: str):
+        """
+        Hold one of the process-wide and one of the user's in-flight request
+        slots; shared by every caller so concurrent sends can't multiply them.
+        The process-wide limit adapts to what callers report via _report()
+        """
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            # asyncio semaphores belong to one event loop
+            self._slots_loop = loop
+            self._global_slots = AdaptiveConcurrencyLimit(settings.gmail_max_in_flight)
+            self._user_slots = {}
+        user_slots = self._user_slots.get(user_email)
+        if user_slots is None:
+            user_slots = self._user_slots[user_email] = asyncio.Semaphore(settings.gmail_user_max_in_flight)
+        # User slot first, so requests queued behind a busy user don't pin global slots
+        async with user_slots, self._global_slots:
+            yield
+    
+    def _report(self, throttled: bool):
+        """Feed a response outcome to the adaptive process-wide limit"""
+        if self._global_slots is not None:
+            if throttled:
+                self._global_slots.on_throttled()
+            else:
+                self._global_slots.on_success()
+    
+    async def acquire_send_quota(self, user_email: str, count: int):
+        """Wait until count messages.send calls fit the user's and the project's quota"""
+        units = count * self.SEND_QUOTA_UNITS
+        await self._project_limiter.acquire(units)
+        await self._user_limiter(user_email).acquire(units)
+    
+    def _user_limiter(self, user_email: str) -> AsyncTokenBucket:
+        limiter = self._user_limiters.get(user_email)
+        if limiter is None:
+            # Burst of one full batch, so a user's first batch is not held back
+            limiter = self._user_limiters[user_email] = AsyncTokenBucket(
+                self.USER_QUOTA_UNITS_PER_SECOND, GMAIL_BATCH_SIZE * self.SEND_QUOTA_UNITS
+            )
+        return limiter
     
     async def send_batch_emails(self, batch_data: List[Dict], credentials_dict: dict, 
-                               custom_headers: Dict = None, max_concurrent: int = 50):
+                               custom_headers: Dict = None):
         """Send multiple emails concurrently with rate limiting"""
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
-        async def send_single_email(email_data):
-            async with semaphore:
-                service = self.get_gmail_service(credentials_dict, email_data['user_email'])
-                message = self.create_message(
-                    sender_email=email_data['from_email'],
-                    to_email=email_data['to_email'],
-                    to_name=email_data['to_name'],
-                    subject=email_data['subject'],
-                    html_body=email_data['html_body'],
-                    sender_name=email_data['from_name'],
-                    custom_headers=custom_headers
+        # Emails of one campaign share sender, subject and body; serialize those once
+        templates = {}
+        
+        def message_for(email_data):
+            template_key = (email_data['from_email'], email_data['from_name'],
+                            email_data['subject'], email_data['html_body'])
+            template = templates.get(template_key)
+            if template is None:
+                template = templates[template_key] = RawMessageTemplate(
+                    email_data['from_email'], email_data['subject'], email_data['html_body'],
+                    email_data['from_name'], custom_headers
                 )
-                
-                result = await self.send_email_async(service, message, email_data['user_email'])
-                result['recipient_id'] = email_data['recipient_id']
-                return result
+            return {'raw': template.render_raw(email_data['to_email'], email_data['to_name'])}
         
-        # Create tasks for all emails
-        tasks = [send_single_email(email_data) for email_data in batch_data]
+        async def send_user_batch(user_email, chunk):
+            messages = [(str(index), message_for(email_data)) for index, email_data in enumerate(chunk)]
+            try:
+                batch_results = await self._send_batch_with_retry(credentials_dict, user_email, messages)
+            except Exception as error:
+                batch_results = {request_id: {'success': False, 'error': str(error), 'user_email': user_email}
+                                 for request_id, _ in messages}
+            results = []
+            for request_id, _ in messages:
+                result = batch_results[request_id]
+                result['recipient_id'] = chunk[int(request_id)]['recipient_id']
+                results.append(result)
+            return results
+        
+        # One multipart batch request per GMAIL_BATCH_SIZE emails of a user
+        by_user = {}
+        for email_data in batch_data:
+            by_user.setdefault(email_data['user_email'], []).append(email_data)
+        # Concurrency is capped by the shared in-flight limits and pacing by the token buckets;
+        # cancelling the caller cancels every batch still in flight
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(send_user_batch(user_email, emails[start:start + GMAIL_BATCH_SIZE]))
+                for user_email, emails in by_user.items()
+                for start in range(0, len(emails), GMAIL_BATCH_SIZE)
+            ]
         
-        # Send emails in batches to avoid overwhelming the API
         results = []
-        batch_size = 25  # Process 25 emails at a time
-        
-        for i in range(0, len(tasks), batch_size):
-            batch_tasks = tasks[i:i + batch_size]
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-            results.extend(batch_results)
-            
-            # Small delay between batches to respect rate limits
-            if i + batch_size < len(tasks):
-                await asyncio.sleep(0.1)  # 100ms delay
-        
+        for task in tasks:
+            results.extend(task.result())
         return results
 
 
@@ -175,14 +625,14 @@ gmail_service_manager = GmailServiceManager()
 async def get_workspace_users(credentials_dict: dict, admin_email: str) -> List[Dict]:
     """Get all users from Google Workspace using Directory API"""
     try:
-        credentials = Credentials.from_service_account_info(
+        credentials = get_service_account_credentials(
             credentials_dict,
-            scopes=['https://www.googleapis.com/auth/admin.directory.user.readonly']
+            scopes=('https://www.googleapis.com/auth/admin.directory.user.readonly',)
         )
         
         # Delegate to the admin email
         delegated_credentials = credentials.with_subject(admin_email)
-        service = build('admin', 'directory_v1', credentials=delegated_credentials, cache_discovery=False)
+        service = build_service('admin', 'directory_v1', delegated_credentials)
         
         users = []
         page_token = None
@@ -240,35 +690,30 @@ def validate_gmail_credentials(credentials_dict: dict, admin_email: str) -> Dict
             }
         
         # Create credentials with all required scopes
-        credentials = Credentials.from_service_account_info(
-            credentials_dict,
-            scopes=REQUIRED_SCOPES
-        )
+        credentials = get_service_account_credentials(credentials_dict)
         
         # Test Gmail API access with admin delegation
         delegated_credentials = credentials.with_subject(admin_email)
-        gmail_service = build('gmail', 'v1', credentials=delegated_credentials, cache_discovery=False)
+        gmail_service = build_service('gmail', 'v1', delegated_credentials)
         
         # Test Gmail profile access
         profile = gmail_service.users().getProfile(userId='me').execute()
         
         # Test Admin Directory access for user management
-        admin_service = build('admin', 'directory_v1', credentials=delegated_credentials, cache_discovery=False)
+        admin_service = build_service('admin', 'directory_v1', delegated_credentials)
         domain = admin_email.split('@')[1]
         
-        # Test domain access to verify admin privileges
+        # Test domain access to verify admin privileges; the first page doubles as the check
         try:
-            users_result = admin_service.users().list(domain=domain, maxResults=1).execute()
-            user_count = users_result.get('users', [])
-            
-            # Get total user count for the domain
+            # Get total user count for the domain, fetching only ids
             total_users = 0
             page_token = None
             while True:
                 users_result = admin_service.users().list(
                     domain=domain,
                     maxResults=500,
-                    pageToken=page_token
+                    pageToken=page_token,
+                    fields='nextPageToken,users(id)'
                 ).execute()
                 users = users_result.get('users', [])
                 total_users += len(users)
@@ -308,24 +753,50 @@ def validate_gmail_credentials(credentials_dict: dict, admin_email: str) -> Dict
         }
 
 
-def distribute_recipients_across_users(recipients: List[Dict], users: List[Dict], 
-                                     campaign_id: int) -> Dict[str, List[Dict]]:
+class RecipientRef(NamedTuple):
+    """Recipient fields needed for sending"""
+    id: int
+    email: str
+    name: str
+    custom_data: dict
+
+
+class CampaignRef(NamedTuple):
+    """Campaign fields needed for sending, detached from the ORM session"""
+    id: int
+    subject: str
+    from_name: Optional[str]
+    html_body: str
+    custom_headers: Optional[dict]
+
+
+class SenderRef(NamedTuple):
+    """Workspace user that recipients are distributed to"""
+    email: str
+    name: str
+    status: str
+    account_id: int
+
+
+def distribute_recipients_across_users(recipients: List[RecipientRef], users: List[SenderRef], 
+                                     campaign_id: int) -> Dict[str, Tuple[int, int]]:
     """
     Distribute recipients equally across selected users for sending
     
     Args:
-        recipients: List of recipient dictionaries with email, name, custom_data
-        users: List of user dictionaries with email, name, status
+        recipients: Recipients to send to
+        users: Candidate sending users with their status value
         campaign_id: Campaign ID for tracking
     
     Returns:
-        Dictionary mapping user emails to their assigned recipients
+        Dictionary mapping user emails to (start, end) offsets of their
+        recipients, so callers slice lazily instead of holding per-user copies
     """
     if not recipients or not users:
         return {}
     
     # Filter active users only
-    active_users = [user for user in users if user.get('status') == 'Active']
+    active_users = [user for user in users if user.status == 'Active']
     
     if not active_users:
         logger.warning(f"No active users available for campaign {campaign_id}")
@@ -341,7 +812,7 @@ def distribute_recipients_across_users(recipients: List[Dict], users: List[Dict]
     recipient_index = 0
     
     for i, user in enumerate(active_users):
-        user_email = user['email']
+        user_email = user.email
         
         # Calculate how many recipients this user gets
         recipients_for_user = base_recipients_per_user
@@ -349,11 +820,10 @@ def distribute_recipients_across_users(recipients: List[Dict], users: List[Dict]
             recipients_for_user += 1
         
         # Assign recipients to this user
-        user_recipients = recipients[recipient_index:recipient_index + recipients_for_user]
-        distribution[user_email] = user_recipients
+        distribution[user_email] = (recipient_index, recipient_index + recipients_for_user)
         recipient_index += recipients_for_user
         
-        logger.info(f"Assigned {len(user_recipients)} recipients to user {user_email}")
+        logger.debug("Assigned %d recipients to user %s", recipients_for_user, user_email)
     
     return distribution
 
@@ -370,14 +840,11 @@ def validate_user_sending_capability(credentials_dict: dict, user_email: str) ->
         Dictionary with validation result
     """
     try:
-        credentials = Credentials.from_service_account_info(
-            credentials_dict,
-            scopes=REQUIRED_SCOPES
-        )
+        credentials = get_service_account_credentials(credentials_dict)
         
         # Delegate to the specific user
         delegated_credentials = credentials.with_subject(user_email)
-        service = build('gmail', 'v1', credentials=delegated_credentials, cache_discovery=False)
+        service = build_service('gmail', 'v1', delegated_credentials)
         
         # Test access by getting the user's Gmail profile
         profile = service.users().getProfile(userId='me').execute()
@@ -0,0 +1,7 @@
+from fastapi import Response
+
+
+def set_next_cursor(response: Response, items: list, limit: int):
+    """Expose the keyset cursor for the next page in the X-Next-Cursor header"""
+    if items and len(items) >= limit:
+        response.headers['X-Next-Cursor'] = str(items[-1].id)
@@ -0,0 +1,157 @@
+"""
+Sliding-window send quotas shared by all workers through Redis, and
+in-process token buckets and concurrency limits for asyncio senders
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Tuple
+
+import redis
+
+# KEYS[1] window sorted set, KEYS[2] member sequence
+# ARGV: now, window seconds, limit, requested count
+# Returns {granted, retry_after_seconds}
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local granted = math.max(0, math.min(requested, limit - redis.call('ZCARD', KEYS[1])))
+
+if granted > 0 then
+    local last = redis.call('INCRBY', KEYS[2], granted)
+    for seq = last - granted + 1, last do
+        redis.call('ZADD', KEYS[1], now, seq)
+    end
+    redis.call('EXPIRE', KEYS[1], window)
+    redis.call('EXPIRE', KEYS[2], window)
+end
+
+local retry_after = 0
+if granted < requested then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    if oldest[2] then
+        retry_after = math.max(1, math.ceil(tonumber(oldest[2]) + window - now))
+    else
+        retry_after = window
+    end
+end
+
+return {granted, retry_after}
+"""
+
+
+class SlidingWindowRateLimiter:
+    """
+    Atomic per-key sliding-window quota; checking, trimming and recording
+    sends happen in one Lua call so concurrent workers never overshoot
+    """
+
+    def __init__(self, redis_client: redis.Redis, window: int = 3600):
+        self.redis = redis_client
+        self.window = window
+        self._script = redis_client.register_script(SLIDING_WINDOW_SCRIPT)  # runs via EVALSHA
+
+    def acquire(self, key: str, limit: int, count: int = 1) -> Tuple[int, int]:
+        """
+        Reserve up to count sends under limit; returns (granted, retry_after)
+        where retry_after is the wait in seconds before the rest may be sent
+        """
+        granted, retry_after = self._script(
+            keys=[key, f"{key}:seq"],
+            args=[time.time(), self.window, limit, count]
+        )
+        return int(granted), int(retry_after)
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket for coroutines in one process; each acquire reserves its
+    tokens immediately (the balance may go negative) and sleeps off the debt,
+    so waiters are served in arrival order without a lock
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self, tokens: float = 1):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= tokens
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    AIMD in-flight limit for coroutines on one event loop: the limit halves
+    (at most once per interval) when callers report throttling and grows
+    additively while they report successes
+    """
+
+    def __init__(self, maximum: int, minimum: int = 10, increase: int = 5, interval: float = 0.5):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.increase = increase
+        self.interval = interval
+        self.limit = maximum
+        self._in_flight = 0
+        self._waiters = deque()
+        self._last_change = time.monotonic()
+
+    async def __aenter__(self):
+        while self._in_flight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                self._discard(waiter)
+                # Woken, then cancelled before it ran: pass the wakeup on, as
+                # asyncio.Semaphore does, or the next waiter sleeps forever
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            self._discard(waiter)
+        self._in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        self._in_flight -= 1
+        self._wake()
+
+    def _discard(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+    
+    def _wake(self):
+        free = self.limit - self._in_flight
+        for waiter in list(self._waiters):
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def on_throttled(self):
+        """Multiplicative decrease after a 429/5xx"""
+        now = time.monotonic()
+        if now - self._last_change >= self.interval:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._last_change = now
+
+    def on_success(self):
+        """Additive increase, at most once per interval"""
+        now = time.monotonic()
+        if self.limit < self.maximum and now - self._last_change >= self.interval:
+            self.limit = min(self.maximum, self.limit + self.increase)
+            self._last_change = now
+            self._wake()
@@ -0,0 +1,64 @@
+"""
+{{variable}} personalization templates, parsed once and rendered per recipient
+"""
+import re
+from typing import Dict, Optional, Tuple
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{(.*?)\}\}")
+
+
+class PlaceholderTemplate:
+    """
+    Pre-split template: rendering is a single join over literal segments and
+    looked-up values rather than one str.replace pass per custom_data key
+    """
+
+    # Bodies memoized per distinct set of substituted values (e.g. one segment)
+    MEMO_SIZE = 1024
+    # Lookups after which memoization is dropped if almost nothing repeats
+    MEMO_PROBE = 256
+
+    def __init__(self, text: str):
+        # Bodies without '{{' skip the regex entirely
+        parts = PLACEHOLDER_PATTERN.split(text) if '{{' in text else [text]
+        self.text = text
+        self.literals = parts[0::2]
+        self.keys = parts[1::2]
+        self._memo: Optional[Dict[Tuple[str, ...], str]] = {}
+        self._lookups = 0
+        self._hits = 0
+
+    @property
+    def is_static(self) -> bool:
+        """True when there is nothing to personalize"""
+        return not self.keys
+
+    def render(self, data: Optional[Dict]) -> str:
+        """Substitute known keys; unknown placeholders are left as written"""
+        if not self.keys or not data:
+            return self.text
+
+        values = tuple(str(data[key]) if key in data else f"{{{{{key}}}}}" for key in self.keys)
+        if self._memo is None:
+            return self._join(values)
+
+        self._lookups += 1
+        rendered = self._memo.get(values)
+        if rendered is not None:
+            self._hits += 1
+            return rendered
+
+        rendered = self._join(values)
+        if self._lookups >= self.MEMO_PROBE and self._hits * 10 < self._lookups:
+            # Personalization is effectively unique per recipient
+            self._memo = None
+        elif len(self._memo) < self.MEMO_SIZE:
+            self._memo[values] = rendered
+        return rendered
+
+    def _join(self, values: Tuple[str, ...]) -> str:
+        out = [self.literals[0]]
+        for value, literal in zip(values, self.literals[1:]):
+            out.append(value)
+            out.append(literal)
+        return "".join(out)
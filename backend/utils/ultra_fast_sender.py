@@ -1,24 +1,41 @@
 import asyncio
 import time
-from typing import List, Dict
+from collections import defaultdict
+from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
 
-from models import Campaign, RecipientAssignment, Recipient, User, CampaignStatus, RecipientStatus
-from utils.gmail_service import gmail_service_manager
+from models import User, CampaignStatus, RecipientStatus
+from database import SessionLocal
+from utils.gmail_service import GMAIL_BATCH_SIZE, gmail_service_manager
 import crud
 
 
+class CampaignStopped(Exception):
+    """Raised inside the sending task group to cancel in-flight batches on stop"""
+
+
 class UltraFastSender:
     """
     Ultra-fast email sender optimized for sending 17k emails in under 20 seconds
     """
     
+    # Coroutines sending batches, and recipients buffered between the DB stream and them
+    SENDER_WORKERS = 50
+    QUEUE_SIZE = 2000
+    
     def __init__(self, db: Session, campaign_id: int):
         self.db = db
         self.campaign_id = campaign_id
         self.campaign = crud.get_campaign(db, campaign_id)
+        # Read once: every batch commit expires self.campaign, and reading it
+        # again would re-SELECT the row per batch
+        self.message_fields = {
+            'from_email': self.campaign.from_email,
+            'from_name': self.campaign.from_name,
+            'subject': self.campaign.subject,
+            'html_body': self.campaign.html_body,
+        } if self.campaign else {}
+        self.custom_headers = self.campaign.custom_headers if self.campaign else None
         self.stats = {
             'sent': 0,
             'failed': 0,
@@ -26,6 +43,7 @@ class UltraFastSender:
             'end_time': None
         }
         self.stop_sending = False
+        self._sender_contexts = {}  # user_id -> (user email, credentials) or None
         
     async def send_campaign_ultra_fast(self) -> Dict:
         """
@@ -43,51 +61,72 @@ class UltraFastSender:
             
             self.stats['start_time'] = time.time()
             
-            # Get all assignments grouped by user
-            assignments = crud.get_campaign_assignments(self.db, self.campaign_id)
-            if not assignments:
+            user_ids = crud.get_campaign_sending_user_ids(self.db, self.campaign_id)
+            if not user_ids:
                 return {'success': False, 'error': 'No assignments found'}
             
-            # Group assignments by user
-            user_assignments = {}
-            for assignment in assignments:
-                user_id = assignment.user_id
-                if user_id not in user_assignments:
-                    user_assignments[user_id] = []
-                user_assignments[user_id].append(assignment)
-            
-            # Create sending tasks for each user
-            sending_tasks = []
-            for user_id, user_assignment_list in user_assignments.items():
-                task = self.send_user_batch(user_id, user_assignment_list)
-                sending_tasks.append(task)
-            
-            # Execute all sending tasks concurrently
-            results = await asyncio.gather(*sending_tasks, return_exceptions=True)
+            # Token exchanges would otherwise serialize at the start of every user's batch
+            await self.prewarm_tokens(user_ids)
             
-            # Process results
-            total_sent = 0
-            total_failed = 0
+            # Assignments stream from the database into a bounded queue of
+            # per-user batches, so memory stays O(queue size) not O(recipients)
+            queue = asyncio.Queue(maxsize=self.QUEUE_SIZE // GMAIL_BATCH_SIZE)
+            totals = {'sent': 0, 'failed': 0}
             
-            for result in results:
-                if isinstance(result, dict):
-                    total_sent += result.get('sent', 0)
-                    total_failed += result.get('failed', 0)
-                else:
-                    print(f"Task error: {result}")
-                    total_failed += 1
+            async def produce():
+                stream_db = SessionLocal()
+                try:
+                    pending = defaultdict(list)
+                    for user_id, recipient_id, email, name in crud.stream_campaign_assignments(
+                        stream_db, self.campaign_id
+                    ):
+                        if self.stop_sending:
+                            raise CampaignStopped()
+                        pending[user_id].append((recipient_id, email, name))
+                        if len(pending[user_id]) == GMAIL_BATCH_SIZE:
+                            await queue.put((user_id, pending.pop(user_id)))
+                    for user_id, recipients in pending.items():
+                        await queue.put((user_id, recipients))
+                finally:
+                    stream_db.close()
+                # A failing or stopped producer cancels the consumers through the task group
+                for _ in range(self.SENDER_WORKERS):
+                    await queue.put(None)
+            
+            async def consume():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    if self.stop_sending:
+                        raise CampaignStopped()
+                    result = await self.send_user_batch(*item)
+                    totals['sent'] += result.get('sent', 0)
+                    totals['failed'] += result.get('failed', 0)
+            
+            # Raising CampaignStopped in any member cancels the rest within one loop tick
+            # rather than letting queued batches drain
+            try:
+                async with asyncio.TaskGroup() as group:
+                    group.create_task(produce())
+                    for _ in range(self.SENDER_WORKERS):
+                        group.create_task(consume())
+            except* CampaignStopped:
+                pass
+            total_sent = totals['sent']
+            total_failed = totals['failed']
             
             self.stats['end_time'] = time.time()
             self.stats['sent'] = total_sent
             self.stats['failed'] = total_failed
             
-            # Update campaign status
-            if total_failed == 0:
-                self.campaign.status = CampaignStatus.COMPLETED
-            else:
-                self.campaign.status = CampaignStatus.FAILED if total_sent == 0 else CampaignStatus.COMPLETED
-            
-            self.campaign.sending_completed_at = crud.func.now()
+            # Update campaign status; a stopped campaign stays paused
+            if not self.stop_sending:
+                if total_failed == 0:
+                    self.campaign.status = CampaignStatus.COMPLETED
+                else:
+                    self.campaign.status = CampaignStatus.FAILED if total_sent == 0 else CampaignStatus.COMPLETED
+                self.campaign.sending_completed_at = crud.func.now()
             self.db.commit()
             
             elapsed_time = self.stats['end_time'] - self.stats['start_time']
@@ -107,202 +146,103 @@ class UltraFastSender:
             self.db.commit()
             return {'success': False, 'error': str(e)}
     
-    async def send_user_batch(self, user_id: int, assignments: List[RecipientAssignment]) -> Dict:
+    async def prewarm_tokens(self, user_ids: List[int]):
+        """Mint the delegated access token of every sending user in parallel"""
+        emails_by_account = defaultdict(list)
+        for email, account_id in self.db.query(User.email, User.account_id).filter(User.id.in_(user_ids)):
+            emails_by_account[account_id].append(email)
+        
+        prewarms = []
+        for account_id, emails in emails_by_account.items():
+            account = crud.get_account(self.db, account_id)
+            if account:
+                credentials_dict = crud.get_account_credentials(account)
+                prewarms.append(gmail_service_manager.prewarm_tokens(credentials_dict, emails))
+        await asyncio.gather(*prewarms)
+    
+    def _sender_context(self, user_id: int) -> Optional[tuple]:
+        """(user email, credentials) for a sending user, loaded once per send"""
+        if user_id not in self._sender_contexts:
+            user = self.db.query(User).filter(User.id == user_id).first()
+            account = crud.get_account(self.db, user.account_id) if user else None
+            self._sender_contexts[user_id] = (user.email, crud.get_account_credentials(account)) \
+                if account else None
+        return self._sender_contexts[user_id]
+    
+    async def send_user_batch(self, user_id: int, recipients: List[tuple]) -> Dict:
         """
-        Send all emails assigned to a specific user using maximum concurrency
+        Send one batch of (recipient_id, email, name) assigned to a specific user
         """
         try:
-            # Get user and account info
-            user = self.db.query(User).filter(User.id == user_id).first()
-            if not user:
-                return {'sent': 0, 'failed': len(assignments), 'error': 'User not found'}
-            
-            account = crud.get_account(self.db, user.account_id)
-            if not account:
-                return {'sent': 0, 'failed': len(assignments), 'error': 'Account not found'}
-            
-            # Get account credentials
-            credentials_dict = crud.get_account_credentials(account)
+            sender = self._sender_context(user_id)
+            if not sender:
+                crud.bulk_update_recipient_status(
+                    self.db, [(recipient_id, RecipientStatus.FAILED, 'User or account not found')
+                              for recipient_id, _, _ in recipients]
+                )
+                self.db.commit()
+                return {'sent': 0, 'failed': len(recipients), 'error': 'User or account not found'}
+            user_email, credentials_dict = sender
             
             # Prepare email data for batch sending
-            email_batch = []
-            for assignment in assignments:
-                recipient = self.db.query(Recipient).filter(Recipient.id == assignment.recipient_id).first()
-                if recipient:
-                    email_data = {
-                        'recipient_id': recipient.id,
-                        'assignment_id': assignment.id,
-                        'user_email': user.email,
-                        'from_email': self.campaign.from_email,
-                        'from_name': self.campaign.from_name,
-                        'to_email': recipient.email,
-                        'to_name': recipient.name,
-                        'subject': self.campaign.subject,
-                        'html_body': self.campaign.html_body,
-                    }
-                    email_batch.append(email_data)
+            email_batch = [
+                {
+                    'recipient_id': recipient_id,
+                    'user_email': user_email,
+                    'to_email': email,
+                    'to_name': name,
+                    **self.message_fields,
+                }
+                for recipient_id, email, name in recipients
+            ]
             
-            # Send batch with maximum concurrency (100 concurrent requests per user)
+            # Send batch; concurrency is bounded by the manager's shared in-flight limits
             results = await gmail_service_manager.send_batch_emails(
                 email_batch, 
                 credentials_dict, 
-                custom_headers=self.campaign.custom_headers,
-                max_concurrent=100  # Very high concurrency for speed
+                custom_headers=self.custom_headers
             )
             
-            # Process results and update database
-            sent_count = 0
-            failed_count = 0
-            
+            # Process results and update database in bulk
+            updates = []
+            user_error = None
             for result in results:
-                try:
-                    recipient_id = result.get('recipient_id')
-                    if result.get('success'):
-                        crud.update_recipient_status(self.db, recipient_id, RecipientStatus.SENT)
-                        crud.increment_user_sent_count(self.db, user_id)
-                        sent_count += 1
-                    else:
-                        error_msg = result.get('error', 'Unknown error')
-                        crud.update_recipient_status(self.db, recipient_id, RecipientStatus.FAILED, error_msg)
-                        failed_count += 1
-                        
-                        # Update user status if needed
-                        if not result.get('retry', False):
-                            crud.update_user_status(self.db, user_id, crud.UserStatus.ERROR, error_msg)
-                except Exception as e:
-                    print(f"Error processing result: {e}")
-                    failed_count += 1
+                if result.get('success'):
+                    updates.append((result['recipient_id'], RecipientStatus.SENT, None))
+                else:
+                    error_msg = result.get('error', 'Unknown error')
+                    updates.append((result['recipient_id'], RecipientStatus.FAILED, error_msg))
+                    if not result.get('retry', False):
+                        user_error = error_msg
+            
+            sent_count = sum(1 for _, status, _ in updates if status == RecipientStatus.SENT)
+            failed_count = len(updates) - sent_count
+            
+            # Statuses and the user's sent counts land in one transaction
+            crud.bulk_update_recipient_status(self.db, updates)
+            if sent_count:
+                crud.increment_user_sent_count(self.db, user_id, sent_count)
+            self.db.commit()
+            
+            # Update user status if needed
+            if user_error:
+                crud.update_user_status(self.db, user_id, crud.UserStatus.ERROR, user_error)
             
             return {'sent': sent_count, 'failed': failed_count}
             
         except Exception as e:
             print(f"Error in send_user_batch: {e}")
-            # Mark all assignments as failed
-            for assignment in assignments:
-                crud.update_recipient_status(self.db, assignment.recipient_id, RecipientStatus.FAILED, str(e))
+            self.db.rollback()
+            # Mark the whole batch as failed
+            crud.bulk_update_recipient_status(
+                self.db, [(recipient_id, RecipientStatus.FAILED, str(e)) for recipient_id, _, _ in recipients]
+            )
+            self.db.commit()
             
-            return {'sent': 0, 'failed': len(assignments), 'error': str(e)}
+            return {'sent': 0, 'failed': len(recipients), 'error': str(e)}
     
     def stop_campaign(self):
         """Stop the campaign sending"""
         self.stop_sending = True
         self.campaign.status = CampaignStatus.PAUSED
         self.db.commit()
-
-
-# Threaded sender for maximum performance
-class ThreadedUltraFastSender:
-    """
-    Alternative implementation using threading for even higher performance
-    """
-    
-    def __init__(self, db: Session, campaign_id: int):
-        self.db = db
-        self.campaign_id = campaign_id
-        self.campaign = crud.get_campaign(db, campaign_id)
-        self.stats = {'sent': 0, 'failed': 0}
-        self.lock = threading.Lock()
-    
-    def send_campaign_threaded(self, max_workers: int = 200) -> Dict:
-        """
-        Send campaign using ThreadPoolExecutor for maximum speed
-        """
-        if not self.campaign or self.campaign.status != CampaignStatus.READY:
-            return {'success': False, 'error': 'Campaign not ready for sending'}
-        
-        start_time = time.time()
-        
-        try:
-            # Update campaign status
-            self.campaign.status = CampaignStatus.SENDING
-            self.campaign.sending_started_at = crud.func.now()
-            self.db.commit()
-            
-            # Get all assignments
-            assignments = crud.get_campaign_assignments(self.db, self.campaign_id)
-            
-            # Create thread pool for maximum concurrency
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Submit all email sending tasks
-                future_to_assignment = {
-                    executor.submit(self.send_single_email_threaded, assignment): assignment 
-                    for assignment in assignments
-                }
-                
-                # Process completed tasks
-                for future in as_completed(future_to_assignment):
-                    assignment = future_to_assignment[future]
-                    try:
-                        result = future.result()
-                        with self.lock:
-                            if result['success']:
-                                self.stats['sent'] += 1
-                            else:
-                                self.stats['failed'] += 1
-                    except Exception as e:
-                        print(f"Email sending error: {e}")
-                        with self.lock:
-                            self.stats['failed'] += 1
-            
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            
-            # Update campaign status
-            self.campaign.status = CampaignStatus.COMPLETED
-            self.campaign.sending_completed_at = crud.func.now()
-            self.db.commit()
-            
-            return {
-                'success': True,
-                'total_sent': self.stats['sent'],
-                'total_failed': self.stats['failed'],
-                'elapsed_time': elapsed_time,
-                'emails_per_second': self.stats['sent'] / elapsed_time if elapsed_time > 0 else 0
-            }
-            
-        except Exception as e:
-            self.campaign.status = CampaignStatus.FAILED
-            self.db.commit()
-            return {'success': False, 'error': str(e)}
-    
-    def send_single_email_threaded(self, assignment: RecipientAssignment) -> Dict:
-        """
-        Send a single email in a thread
-        """
-        try:
-            # Get required data
-            recipient = self.db.query(Recipient).filter(Recipient.id == assignment.recipient_id).first()
-            user = self.db.query(User).filter(User.id == assignment.user_id).first()
-            account = crud.get_account(self.db, user.account_id)
-            
-            if not all([recipient, user, account]):
-                return {'success': False, 'error': 'Missing data'}
-            
-            # Get credentials and create service
-            credentials_dict = crud.get_account_credentials(account)
-            service = gmail_service_manager.get_gmail_service(credentials_dict, user.email)
-            
-            # Create and send message
-            message = gmail_service_manager.create_message(
-                sender_email=self.campaign.from_email,
-                to_email=recipient.email,
-                to_name=recipient.name,
-                subject=self.campaign.subject,
-                html_body=self.campaign.html_body,
-                sender_name=self.campaign.from_name,
-                custom_headers=self.campaign.custom_headers
-            )
-            
-            # Send email
-            result = service.users().messages().send(userId='me', body=message).execute()
-            
-            # Update database
-            crud.update_recipient_status(self.db, recipient.id, RecipientStatus.SENT)
-            crud.increment_user_sent_count(self.db, user.id)
-            
-            return {'success': True, 'message_id': result.get('id')}
-            
-        except Exception as e:
-            # Update recipient as failed
-            crud.update_recipient_status(self.db, assignment.recipient_id, RecipientStatus.FAILED, str(e))
-            return {'success': False, 'error': str(e)}
\ No newline at end of file
@@ -582,7 +582,7 @@ start_services() {
     
     # Build and start workers
     log "Starting Celery workers..."
-    docker-compose up -d celery_worker celery_beat
+    docker-compose up -d celery_worker celery_control_worker celery_beat
     
     # Build and start frontend
     log "Building and starting frontend..."
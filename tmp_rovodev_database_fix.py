@@ -5,23 +5,47 @@ Creates proper Alembic setup and fixes migration issues
 """
 
 import os
+import re
+import sys
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+TOP_LEVEL_VOLUMES = re.compile(rb"^volumes:[ \t]*(?:#[^\n]*)?\r?$", re.MULTILINE)
+
+def report(message):
+    """print() for steps running on worker threads; one write per line, so lines never interleave"""
+    sys.stdout.write(message + "\n")
+
+def write_executable(path, content):
+    """
+    Write a script created with mode 0o755 (less the umask) by the open
+    itself rather than a write followed by chmod; only a file left by an
+    earlier run gets a chmod, since creation mode bits do not apply to it
+    """
+    data = content.encode('utf-8')
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o755)
+    except FileExistsError:
+        fd = os.open(path, os.O_WRONLY | os.O_TRUNC)
+        os.fchmod(fd, 0o755)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
 def fix_docker_compose():
     """Add database initialization to docker-compose"""
     compose_file = Path("docker-compose.yml")
     
-    if not compose_file.exists():
-        print("❌ docker-compose.yml not found!")
+    # Byte-level check: the common re-run case (already patched) never decodes
+    try:
+        raw = compose_file.read_bytes()
+    except FileNotFoundError:
+        report("❌ docker-compose.yml not found!")
         return False
     
-    with open(compose_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
     # Add database initialization service
-    if "init-db:" not in content:
-        db_init_service = '''
+    if b"init-db:" not in raw:
+        db_init_service = b'''
   init-db:
     build: ./backend
     container_name: speedsend_init_db
@@ -29,28 +53,27 @@ def fix_docker_compose():
       - .env
     volumes:
       - ./backend:/app
+    # Started with db, not behind its healthcheck; database.py retries the connection
     depends_on:
-      db:
-        condition: service_healthy
-    command: >
-      sh -c "cd /app && 
-             python -c 'from database import engine, Base; Base.metadata.create_all(bind=engine); print(\"Database tables created\")' &&
-             alembic stamp head &&
-             echo 'Database initialized successfully'"
+      - db
+    working_dir: /app
+    # Tables and alembic stamp in one interpreter (backend/bootstrap_db.py)
+    command: ["python", "-m", "bootstrap_db"]
     restart: "no"
+    # Only with --profile migrate, so a plain `up` does not re-run the bootstrap
+    profiles: ["migrate"]
 '''
         
-        # Insert before volumes section
-        volumes_index = content.find("volumes:")
-        if volumes_index != -1:
-            content = content[:volumes_index] + db_init_service + "\n" + content[volumes_index:]
-        else:
-            content = content + db_init_service + "\nvolumes:\n  postgres_data:"
+        # Insert before the top-level volumes section in one pass; the anchored
+        # pattern skips service volumes lists and "volumes:" inside values
+        raw, inserted = TOP_LEVEL_VOLUMES.subn(
+            lambda match: db_init_service.lstrip(b"\n") + b"\n" + match.group(), raw, count=1)
+        if not inserted:
+            raw = raw + db_init_service + b"\nvolumes:\n  postgres_data:"
         
-        with open(compose_file, 'w', encoding='utf-8') as f:
-            f.write(content)
+        compose_file.write_bytes(raw)
         
-        print("✅ Added database initialization service")
+        report("✅ Added database initialization service")
     
     return True
 
@@ -61,13 +84,20 @@ def create_startup_script():
 
 echo "🚀 Starting Speed-Send Application..."
 
-# Function to check if database is ready
+# Function to wait for the database and count its tables
+# One exec into the db container: polling happens inside it, so there is no
+# docker exec per attempt and no second exec for the table count
 wait_for_db() {
     echo "⏳ Waiting for database to be ready..."
-    until docker-compose exec -T db pg_isready -U ${POSTGRES_USER:-speedsend_user} -d ${POSTGRES_DB:-speedsend_db} > /dev/null 2>&1; do
-        sleep 2
-        echo "Still waiting for database..."
-    done
+    TABLE_COUNT=$(docker-compose exec -T db sh -s <<'SH' | tail -n1
+until pg_isready -q -U "$POSTGRES_USER" -d "$POSTGRES_DB"; do
+    echo "Still waiting for database..." >&2
+    sleep 1
+done
+psql -U "$POSTGRES_USER" -d "$POSTGRES_DB" -v ON_ERROR_STOP=1 -tA -c "SELECT count(*) FROM information_schema.tables WHERE table_schema = 'public';"
+SH
+)
+    TABLE_COUNT=${TABLE_COUNT:-0}
     echo "✅ Database is ready!"
 }
 
@@ -75,33 +105,23 @@ wait_for_db() {
 init_database() {
     echo "🔧 Initializing database..."
     
-    # Check if tables already exist
-    TABLE_COUNT=$(docker-compose exec -T db psql -U ${POSTGRES_USER:-speedsend_user} -d ${POSTGRES_DB:-speedsend_db} -t -c "SELECT count(*) FROM information_schema.tables WHERE table_schema = 'public';" 2>/dev/null || echo "0")
-    
-    if [ "$TABLE_COUNT" -gt 0 ]; then
+    # TABLE_COUNT was read by wait_for_db
+    if [ "$TABLE_COUNT" -gt 0 ] 2>/dev/null; then
         echo "✅ Database tables already exist (found $TABLE_COUNT tables)"
         return 0
     fi
     
     echo "📝 Creating database tables..."
     
-    # Create tables using SQLAlchemy models
-    docker-compose exec -T backend python -c "
-from database import engine, Base
-from models import *
-try:
-    Base.metadata.create_all(bind=engine)
-    print('✅ Database tables created successfully')
-except Exception as e:
-    print(f'❌ Error creating tables: {e}')
-    exit(1)
-"
+    # Create tables and mark alembic as current with the init-db service
+    # (backend/bootstrap_db.py); exit status 2 means only the stamp failed.
+    # init-db is in the migrate profile, so it runs here on first bring-up only
+    # and later `docker-compose up -d` starts skip it
+    docker-compose --profile migrate run --rm -T init-db
+    BOOTSTRAP_STATUS=$?
     
-    if [ $? -eq 0 ]; then
+    if [ $BOOTSTRAP_STATUS -eq 0 ] || [ $BOOTSTRAP_STATUS -eq 2 ]; then
         echo "✅ Database initialization completed"
-        
-        # Mark alembic as current
-        docker-compose exec -T backend alembic stamp head 2>/dev/null || echo "Note: Alembic stamp failed, but tables were created"
     else
         echo "❌ Database initialization failed"
         return 1
@@ -134,20 +154,16 @@ main() {
     echo "🚀 Starting all services..."
     docker-compose up -d
     
+    # API, database and Redis probes run concurrently every 0.25s; up to 60 seconds
     echo "⏳ Waiting for all services to be ready..."
-    sleep 20
+    python3 tmp_rovodev_wait.py
+    SERVICES_READY=$?
     
     # Check service status
     echo "📊 Service Status:"
     docker-compose ps
     
-    # Test API health
-    echo "🔍 Testing API health..."
-    sleep 10
-    
-    API_HEALTH=$(curl -s -o /dev/null -w "%{http_code}" http://localhost:8000/api/v1/health 2>/dev/null || echo "000")
-    
-    if [ "$API_HEALTH" = "200" ]; then
+    if [ "$SERVICES_READY" -eq 0 ]; then
         echo "✅ API is healthy and responding!"
         echo ""
         echo "🎉 Speed-Send is ready!"
@@ -155,7 +171,7 @@ main() {
         echo "   Backend API: http://localhost:8000/docs"
         echo "   Health Check: http://localhost:8000/api/v1/health"
     else
-        echo "⚠️  API health check failed (HTTP $API_HEALTH)"
+        echo "⚠️  Services did not become ready"
         echo "📋 Checking logs..."
         docker-compose logs --tail=20 backend
     fi
@@ -165,11 +181,73 @@ main() {
 main "$@"
 '''
     
-    with open("tmp_rovodev_start.sh", 'w') as f:
-        f.write(startup_content)
+    write_executable("tmp_rovodev_start.sh", startup_content)
+    report("✅ Created database startup script")
+
+def create_readiness_script():
+    """Create the readiness probe driver used by the startup script"""
+    wait_content = '''#!/usr/bin/env python3
+"""
+Readiness wait for Speed-Send: each tick runs the API, database and Redis
+probes concurrently instead of one blocking command after another
+"""
+import asyncio
+import sys
+import time
+import urllib.request
+
+HEALTH_URL = "http://localhost:8000/api/v1/health"
+TIMEOUT = 60
+INTERVAL = 0.25
+
+PROBES = {
+    "database": ["docker-compose", "exec", "-T", "db", "sh", "-c",
+                 'pg_isready -q -U "$POSTGRES_USER" -d "$POSTGRES_DB"'],
+    "redis": ["docker-compose", "exec", "-T", "redis", "redis-cli", "ping"],
+}
+
+async def probe(command):
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+    except FileNotFoundError:
+        return False
+    return await process.wait() == 0
+
+def api_healthy():
+    try:
+        with urllib.request.urlopen(HEALTH_URL, timeout=2) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+async def wait_until_ready():
+    pending = ["api", *PROBES]
+    deadline = time.monotonic() + TIMEOUT
+    while True:
+        # Services that are ready drop out; the rest are probed together
+        results = await asyncio.gather(*(
+            asyncio.to_thread(api_healthy) if name == "api" else probe(PROBES[name])
+            for name in pending
+        ))
+        for name, ready in zip(pending, results):
+            if ready:
+                print(f"✅ {name} is ready")
+        pending = [name for name, ready in zip(pending, results) if not ready]
+        if not pending:
+            return True
+        if time.monotonic() >= deadline:
+            print(f"⚠️  Not ready after {TIMEOUT}s: {', '.join(pending)}")
+            return False
+        await asyncio.sleep(INTERVAL)
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(wait_until_ready()) else 1)
+'''
     
-    os.chmod("tmp_rovodev_start.sh", 0o755)
-    print("✅ Created database startup script")
+    Path("tmp_rovodev_wait.py").write_text(wait_content, encoding='utf-8')
+    report("✅ Created readiness probe script")
 
 def create_quick_fix_script():
     """Create a quick migration fix script"""
@@ -181,46 +259,22 @@ echo "🔧 Quick Database Migration Fix"
 # Stop all services
 docker-compose down
 
-# Remove any existing migration locks
-docker-compose run --rm backend rm -f /app/alembic.ini.lock 2>/dev/null || true
-
 # Start database only
 docker-compose up -d db redis
 
-# Wait for database
+# Wait for database; the readiness loop runs inside the db container
 echo "Waiting for database..."
-sleep 15
+docker-compose exec -T db sh -c 'until pg_isready -q -U "$POSTGRES_USER" -d "$POSTGRES_DB"; do sleep 0.25; done'
 
-# Create tables directly using Python models
+# Lock cleanup, table creation, alembic stamp and connection test run in one
+# container from the quick_fix_db module, whose bytecode is cached after the
+# first run rather than a heredoc recompiled every time
 echo "Creating database tables..."
-docker-compose run --rm backend python -c "
-from database import engine, Base
-from models import *
-import sys
-
-try:
-    # Create all tables
-    Base.metadata.create_all(bind=engine)
-    print('✅ Database tables created successfully')
-    
-    # Test database connection
-    from database import SessionLocal
-    db = SessionLocal()
-    result = db.execute('SELECT 1').fetchone()
-    db.close()
-    print('✅ Database connection test successful')
-    
-except Exception as e:
-    print(f'❌ Error: {e}')
-    sys.exit(1)
-"
+docker-compose run --rm -T backend python -m quick_fix_db
 
 if [ $? -eq 0 ]; then
     echo "✅ Database setup completed successfully"
     
-    # Mark alembic as current (suppress errors if alembic isn't configured properly)
-    docker-compose run --rm backend alembic stamp head 2>/dev/null || echo "Note: Alembic stamp skipped"
-    
     # Start all services
     echo "Starting all services..."
     docker-compose up -d
@@ -232,19 +286,18 @@ else
 fi
 '''
     
-    with open("tmp_rovodev_quick_fix.sh", 'w') as f:
-        f.write(quick_fix_content)
-    
-    os.chmod("tmp_rovodev_quick_fix.sh", 0o755)
-    print("✅ Created quick migration fix script")
+    write_executable("tmp_rovodev_quick_fix.sh", quick_fix_content)
+    report("✅ Created quick migration fix script")
 
 def main():
     print("🔧 Database Migration Fix for Speed-Send")
     print("=" * 45)
     
-    fix_docker_compose()
-    create_startup_script()
-    create_quick_fix_script()
+    # Each step writes a different file, so they run side by side
+    steps = [fix_docker_compose, create_startup_script, create_readiness_script, create_quick_fix_script]
+    with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        for future in [executor.submit(step) for step in steps]:
+            future.result()
     
     print("\n📋 Migration Issues Fixed!")
     print("\n🚀 Run one of these scripts:")
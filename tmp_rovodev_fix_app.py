@@ -6,22 +6,91 @@ Addresses critical issues with account retrieval and deletion
 
 import os
 import sys
+import ast
 import json
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+def report(message):
+    """print() for steps running on worker threads; one write per line, so lines never interleave"""
+    sys.stdout.write(message + "\n")
+
+def write_executable(path, content):
+    """
+    Write a script created with mode 0o755 (less the umask) by the open
+    itself rather than a write followed by chmod; only a file left by an
+    earlier run gets a chmod, since creation mode bits do not apply to it
+    """
+    data = content.encode('utf-8')
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o755)
+    except FileExistsError:
+        fd = os.open(path, os.O_WRONLY | os.O_TRUNC)
+        os.fchmod(fd, 0o755)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+def replace_functions(path, fixes):
+    """
+    Apply {name: (old_source, new_source)} to top-level functions in one parse
+    and one write; old_source may be a tuple of known old versions. A function
+    is replaced when its AST matches one of them, so whitespace drift does not
+    defeat the patch, already-fixed or since-changed code is left alone, and
+    the rest of the file (comments included) is kept
+    """
+    content = path.read_text(encoding='utf-8')
+    lines = content.splitlines(keepends=True)
+    spans = []
+    for node in ast.parse(content).body:
+        if isinstance(node, ast.FunctionDef) and node.name in fixes:
+            old_sources, new_source = fixes[node.name]
+            if isinstance(old_sources, str):
+                old_sources = (old_sources,)
+            if any(ast.dump(node) == ast.dump(ast.parse(old).body[0]) for old in old_sources):
+                start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+                spans.append((start - 1, node.end_lineno, new_source))
+    
+    # Bottom-up, so earlier line numbers stay valid
+    for start, end, new_source in sorted(spans, reverse=True):
+        lines[start:end] = [new_source + '\n']
+    
+    if spans:
+        path.write_text(''.join(lines), encoding='utf-8')
+    return len(spans)
+
+def enable_pool_pre_ping(path):
+    """
+    Add pool_pre_ping=True, pool_recycle=1800 to create_engine() calls that
+    set neither and take no **kwargs (those are left to their own dict)
+    """
+    content = path.read_text(encoding='utf-8')
+    lines = content.splitlines(keepends=True)
+    ends = []
+    for node in ast.walk(ast.parse(content)):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id == 'create_engine'):
+            names = {keyword.arg for keyword in node.keywords}
+            if node.args and None not in names and not names & {'pool_pre_ping', 'pool_recycle'}:
+                # Insert after the last argument, so a trailing comma or a
+                # closing parenthesis on its own line stays valid
+                last = max(node.args + node.keywords, key=lambda arg: (arg.end_lineno, arg.end_col_offset))
+                ends.append((last.end_lineno - 1, last.end_col_offset))
+    
+    # Bottom-up and right to left, so earlier offsets stay valid; the offsets
+    # are UTF-8 byte columns, so splice on the encoded line
+    for row, col in sorted(ends, reverse=True):
+        line = lines[row].encode('utf-8')
+        lines[row] = (line[:col] + b', pool_pre_ping=True, pool_recycle=1800' + line[col:]).decode('utf-8')
+    
+    if ends:
+        path.write_text(''.join(lines), encoding='utf-8')
+    return len(ends)
+
 def fix_crud_operations():
     """Fix CRUD operations for account management"""
     crud_file = Path("backend/crud.py")
     
-    if not crud_file.exists():
-        print("❌ crud.py not found!")
-        return False
-    
-    # Read the current file
-    with open(crud_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
     # Fix delete_account function
     old_delete = '''def delete_account(db: Session, account_id: int) -> bool:
     """Delete account and its credentials file"""
@@ -50,11 +119,12 @@ def fix_crud_operations():
         except Exception as e:
             print(f"Warning: Could not delete credentials file: {e}")
         
-        # Delete all related users first (cascade should handle this, but being explicit)
-        db.query(User).filter(User.account_id == account_id).delete()
-        
-        # Delete the account
-        db.delete(db_account)
+        # Delete all related users first, then the account: one bulk DELETE each,
+        # without evaluating or loading the matching rows in the session
+        db.execute(delete(User).where(User.account_id == account_id),
+                   execution_options={'synchronize_session': False})
+        db.execute(delete(Account).where(Account.id == account_id),
+                   execution_options={'synchronize_session': False})
         db.commit()
         
         print(f"Successfully deleted account {account_id}")
@@ -71,14 +141,8 @@ def fix_crud_operations():
     return db.query(User).filter(User.account_id == account_id).all()'''
     
     new_users = '''def get_account_users(db: Session, account_id: int) -> List[User]:
-    """Get all users for an account"""
+    """Get all users for an account (empty for a missing account, without a separate lookup)"""
     try:
-        # Verify account exists first
-        account = get_account(db, account_id)
-        if not account:
-            print(f"Account {account_id} not found")
-            return []
-        
         users = db.query(User).filter(User.account_id == account_id).all()
         print(f"Retrieved {len(users)} users for account {account_id}")
         return users
@@ -87,43 +151,38 @@ def fix_crud_operations():
         print(f"Error retrieving users for account {account_id}: {e}")
         return []'''
     
-    # Apply fixes
-    content = content.replace(old_delete, new_delete)
-    content = content.replace(old_users, new_users)
-    
-    # Write back to file
-    with open(crud_file, 'w', encoding='utf-8') as f:
-        f.write(content)
+    # Apply fixes; a missing file surfaces from the single read, no exists() check first
+    try:
+        replaced = replace_functions(crud_file, {'delete_account': (old_delete, new_delete),
+                                                 'get_account_users': (old_users, new_users)})
+    except FileNotFoundError:
+        report("❌ crud.py not found!")
+        return False
     
-    print("✅ Fixed CRUD operations")
+    if replaced:
+        report("✅ Fixed CRUD operations")
+    else:
+        report("✅ CRUD operations already fixed")
     return True
 
 def fix_database_connection():
     """Add better error handling for database connections"""
     db_file = Path("backend/database.py")
     
-    if not db_file.exists():
-        print("❌ database.py not found!")
-        return False
-    
-    with open(db_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
     # Add better error handling
-    if "def get_db() -> Session:" in content:
-        old_get_db = '''def get_db() -> Session:
+    old_get_db = '''def get_db() -> Session:
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()'''
-        
-        new_get_db = '''def get_db() -> Session:
+    
+    new_get_db = '''def get_db() -> Session:
     db = None
     try:
+        # Stale connections are caught by pool_pre_ping on checkout, not by
+        # a SELECT 1 round trip on every request
         db = SessionLocal()
-        # Test connection
-        db.execute(text("SELECT 1"))
         yield db
     except Exception as e:
         logger.error(f"Database connection error: {e}")
@@ -133,13 +192,27 @@ def fix_database_connection():
     finally:
         if db:
             db.close()'''
-        
-        content = content.replace(old_get_db, new_get_db)
-        
-        with open(db_file, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        print("✅ Fixed database connection handling")
+    
+    # Earlier revisions of this fix probed the connection on every request
+    probing_get_db = new_get_db.replace(
+        "        # Stale connections are caught by pool_pre_ping on checkout, not by\n"
+        "        # a SELECT 1 round trip on every request\n"
+        "        db = SessionLocal()\n",
+        "        db = SessionLocal()\n"
+        "        # Test connection\n"
+        "        db.execute(text(\"SELECT 1\"))\n")
+    
+    try:
+        replaced = replace_functions(db_file, {'get_db': ((old_get_db, probing_get_db), new_get_db)})
+        pinged = enable_pool_pre_ping(db_file)
+    except FileNotFoundError:
+        report("❌ database.py not found!")
+        return False
+    
+    if replaced:
+        report("✅ Fixed database connection handling")
+    if pinged:
+        report("✅ Enabled pool_pre_ping on the database engine")
     
     return True
 
@@ -176,17 +249,20 @@ if ! command -v docker-compose &> /dev/null; then
     sudo chmod +x /usr/local/bin/docker-compose
 fi
 
-# Clean up any existing containers
-echo "Cleaning up existing containers..."
-sudo docker system prune -f
+# Pruning discards the build cache and base layers the next build needs,
+# so it only runs when asked for: ./tmp_rovodev_ubuntu_fix.sh --prune
+if [ "${1:-}" = "--prune" ]; then
+    echo "Cleaning up existing containers..."
+    sudo docker system prune -f
+fi
 
-# Build and start services
+# Build and start services (unchanged layers come from the build cache)
 echo "Building and starting services..."
 sudo docker-compose up --build -d
 
-# Wait for database
+# Wait for database; the readiness loop runs inside the db container
 echo "Waiting for database to be ready..."
-sleep 30
+sudo docker-compose exec -T db sh -c 'until pg_isready -q -U "$POSTGRES_USER" -d "$POSTGRES_DB"; do sleep 0.25; done'
 
 # Run database migrations
 echo "Running database migrations..."
@@ -195,11 +271,8 @@ sudo docker-compose exec backend alembic upgrade head
 echo "✅ Fix completed! Check status with: sudo docker-compose ps"
 '''
     
-    with open("tmp_rovodev_ubuntu_fix.sh", 'w') as f:
-        f.write(script_content)
-    
-    os.chmod("tmp_rovodev_ubuntu_fix.sh", 0o755)
-    print("✅ Created Ubuntu deployment fix script")
+    write_executable("tmp_rovodev_ubuntu_fix.sh", script_content)
+    report("✅ Created Ubuntu deployment fix script")
 
 def create_account_test_script():
     """Create a test script for account operations"""
@@ -207,14 +280,30 @@ def create_account_test_script():
 """
 Test script for account operations
 """
+import atexit
+import sys
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 API_BASE = "http://localhost:8000/api/v1"
 
+# (connect, read) seconds, so a wedged backend fails the check instead of hanging it
+TIMEOUT = (2, 10)
+
+# One keep-alive connection pool for every call instead of a new TCP connection per request;
+# idempotent calls are retried on gateway errors while the backend is still starting
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])))
+atexit.register(SESSION.close)
+
 def test_api_health():
     try:
-        response = requests.get(f"{API_BASE}/health")
+        response = SESSION.get(f"{API_BASE}/health", timeout=TIMEOUT)
         print(f"API Health: {response.status_code}")
         return response.status_code == 200
     except Exception as e:
@@ -223,7 +312,7 @@ def test_api_health():
 
 def test_get_accounts():
     try:
-        response = requests.get(f"{API_BASE}/accounts")
+        response = SESSION.get(f"{API_BASE}/accounts", timeout=TIMEOUT)
         print(f"Get Accounts: {response.status_code}")
         if response.status_code == 200:
             accounts = response.json()
@@ -237,13 +326,26 @@ def test_get_accounts():
 
 def test_delete_account(account_id):
     try:
-        response = requests.delete(f"{API_BASE}/accounts/{account_id}")
+        response = SESSION.delete(f"{API_BASE}/accounts/{account_id}", timeout=TIMEOUT)
         print(f"Delete Account {account_id}: {response.status_code}")
         return response.status_code == 204
     except Exception as e:
         print(f"Delete Account Failed: {e}")
         return False
 
+def test_delete_accounts(account_ids):
+    """One batch-delete request; older backends without it get concurrent per-id deletes"""
+    try:
+        response = SESSION.post(f"{API_BASE}/accounts/batch-delete", json={"ids": list(account_ids)}, timeout=TIMEOUT)
+        if response.status_code not in (404, 405):
+            print(f"Batch Delete Accounts: {response.status_code}")
+            return response.status_code == 200
+    except Exception as e:
+        print(f"Batch Delete Accounts Failed: {e}")
+        return False
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return all(executor.map(test_delete_account, account_ids))
+
 if __name__ == "__main__":
     print("🧪 Testing Speed-Send API...")
     
@@ -254,26 +356,33 @@ if __name__ == "__main__":
             print("\\n📊 Account Details:")
             for acc in accounts:
                 print(f"  - {acc.get('name')} (ID: {acc.get('id')}) - Users: {acc.get('user_count', 0)}")
+
+            # --cleanup deletes every listed account in one batch request
+            if "--cleanup" in sys.argv[1:]:
+                if test_delete_accounts([acc.get('id') for acc in accounts]):
+                    print("🧹 Deleted all listed accounts")
+                else:
+                    print("❌ Account cleanup failed")
         else:
             print("No accounts found or API error")
     else:
         print("❌ API is not responding. Check if services are running.")
 '''
     
-    with open("tmp_rovodev_test_api.py", 'w') as f:
-        f.write(test_content)
+    write_executable("tmp_rovodev_test_api.py", test_content)
     
-    print("✅ Created API test script")
+    report("✅ Created API test script")
 
 def main():
     print("🚀 Speed-Send Emergency Fix Script")
     print("=" * 50)
     
-    # Apply fixes
-    fix_crud_operations()
-    fix_database_connection()
-    create_deployment_fix_script()
-    create_account_test_script()
+    # Apply fixes; each touches a different file, so they run side by side
+    fixes = [fix_crud_operations, fix_database_connection,
+             create_deployment_fix_script, create_account_test_script]
+    with ThreadPoolExecutor(max_workers=len(fixes)) as executor:
+        for future in [executor.submit(fix) for fix in fixes]:
+            future.result()
     
     print("\n📋 Next Steps:")
     print("1. For Ubuntu Server deployment:")
@@ -5,18 +5,45 @@ Fixes API calls and error handling in React components
 """
 
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+def report(message):
+    """print() for steps running on worker threads; one write per line, so lines never interleave"""
+    sys.stdout.write(message + "\n")
+
+def write_if_changed(path, content):
+    """
+    Atomically replace path with content unless it already holds exactly
+    that; returns False when the write was skipped. Leaving an identical
+    file untouched keeps its mtime, so Vite's watcher does not rebuild
+    """
+    data = content.encode('utf-8')
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    # Write a sibling and rename over the target so the bundler never
+    # reads a half-written source
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return True
+
 def fix_api_service():
     """Fix the API service to handle errors properly"""
     api_file = Path("services/api.ts")
     
     if not api_file.exists():
-        print("❌ api.ts not found!")
+        report("❌ api.ts not found!")
         return False
     
     # Create improved API service
-    new_api_content = '''const API_BASE_URL = 'http://localhost:8000/api/v1';
+    new_api_content = '''import { createLimiter } from '../utils/limit';
+
+const API_BASE_URL = 'http://localhost:8000/api/v1';
 
 class ApiError extends Error {
   constructor(public status: number, public message: string, public data?: any) {
@@ -25,129 +52,528 @@ class ApiError extends Error {
   }
 }
 
+type CacheEntry = { body: unknown; expires: number; etag?: string; lastModified?: string };
+
+// A parsed body with the status and headers the cache needs (304, ETag, Cache-Control)
+type Sent<T> = { body: T; status: number; headers: Headers };
+
+// A GET fetch shared by identical calls; it is aborted once every caller has given up
+type InflightFetch = { promise: Promise<Sent<unknown>>; controller: AbortController; waiters: number };
+
+// GET cache lifetime (ms) by path; paths not listed are always fetched
+const CACHE_TTLS: [RegExp, number][] = [
+  [/^\/health$/, 5_000],
+  [/^\/accounts$/, 10_000],
+  [/^\/accounts\/\d+$/, 10_000],
+  [/^\/accounts\/\d+\/users$/, 30_000],
+  [/^\/campaigns$/, 10_000],
+];
+const CACHE_MAX_ENTRIES = 256;
+
+// Built once rather than per call. Connection and Accept-Encoding are
+// forbidden request headers in browsers, which already keep connections
+// alive and advertise gzip/br; the backend compresses larger responses
+const DEFAULT_HEADERS: Record<string, string> = {
+  'Content-Type': 'application/json',
+  Accept: 'application/json',
+};
+
+// Shared request templates; frozen because every call passes the same object
+const GET: RequestInit = Object.freeze({ method: 'GET' });
+const POST: RequestInit = Object.freeze({ method: 'POST' });
+const DELETE: RequestInit = Object.freeze({ method: 'DELETE' });
+
+// Endpoint builders in one place; the fixed list URLs are built once
+const ACCOUNTS_WITH_USERS = '/accounts?include_users=true';
+const ACCOUNTS_WITHOUT_USERS = '/accounts?include_users=false';
+const urls = {
+  account: (id: number) => `/accounts/${id}`,
+  accountUsers: (id: number) => `/accounts/${id}/users`,
+  accountSync: (id: number) => `/accounts/${id}/sync`,
+  campaign: (id: number) => `/campaigns/${id}`,
+  campaignSend: (id: number) => `/campaigns/${id}/send`,
+  campaignPause: (id: number) => `/campaigns/${id}/pause`,
+};
+
+// Shared health poll: steady interval, doubling up to the cap while the API is down
+const HEALTH_INTERVAL_MS = 5_000;
+const HEALTH_MAX_INTERVAL_MS = 60_000;
+
+// Per-attempt limits: reads should be quick, uploads and mutations get longer
+const READ_TIMEOUT_MS = 10_000;
+const WRITE_TIMEOUT_MS = 30_000;
+// Verbs safe to repeat after a network error, timeout or 5xx; never on a 4xx
+const IDEMPOTENT_METHODS = new Set(['GET', 'HEAD', 'PUT', 'DELETE']);
+const MAX_ATTEMPTS = 3;
+const RETRY_BASE_MS = 1_000;
+const RETRY_MAX_MS = 8_000;
+
+// Campaign starts each fan out into many sends server-side; keep a few at a time
+const startCampaignLimiter = createLimiter(3);
+// POSTs that only read, so they leave the cache alone
+const READ_ONLY_POSTS = new Set(['/accounts/batch']);
+
+function cacheTtl(endpoint: string): number {
+  const path = endpoint.split('?')[0];
+  const tier = CACHE_TTLS.find(([pattern]) => pattern.test(path));
+  return tier ? tier[1] : 0;
+}
+
+// Lifetime from the response's Cache-Control, when it sets one: undefined
+// falls back to CACHE_TTLS, null means the body must not be stored
+function responseTtl(headers: Headers): number | null | undefined {
+  const cacheControl = headers.get('cache-control');
+  if (!cacheControl) {
+    return undefined;
+  }
+  if (/no-store/i.test(cacheControl)) {
+    return null;
+  }
+  if (/no-cache/i.test(cacheControl)) {
+    return 0; // Kept, but revalidated on every use
+  }
+  const maxAge = /max-age=(\d+)/i.exec(cacheControl);
+  return maxAge ? Number(maxAge[1]) * 1000 : undefined;
+}
+
+function isRetryable(error: unknown): boolean {
+  return error instanceof ApiError && (error.status === 0 || error.status >= 500);
+}
+
+// Full jitter: anywhere up to the capped exponential step, so clients that
+// failed together do not all come back together
+function retryDelay(attempt: number): Promise<void> {
+  const ms = Math.random() * Math.min(RETRY_BASE_MS * 2 ** attempt, RETRY_MAX_MS);
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+// First path segment, e.g. "accounts" for /accounts/3/users?x=1
+function resourceOf(endpoint: string): string {
+  return endpoint.split(/[/?]/)[1];
+}
+
 class ApiService {
-  private async request<T>(endpoint: string, options: RequestInit = {}): Promise<T> {
+  // endpoint -> GET body; Map insertion order doubles as LRU order (oldest first).
+  // Expired entries stay until evicted so they can be served while offline
+  private cache = new Map<string, CacheEntry>();
+  // endpoint -> GET fetch in progress, shared by identical concurrent calls
+  private inflight = new Map<string, InflightFetch>();
+  // One /health poll for every subscriber, paused while the tab is hidden
+  private healthSubscribers = new Set<(health: HealthStatus) => void>();
+  private healthTimer: ReturnType<typeof setTimeout> | null = null;
+  private healthDelay = HEALTH_INTERVAL_MS;
+  private healthPolling = false;
+
+  private async request<T>(endpoint: string, options: RequestInit = GET): Promise<T> {
+    const method = (options.method ?? 'GET').toUpperCase();
+    if (method === 'POST' && READ_ONLY_POSTS.has(endpoint)) {
+      return (await this.send<T>(endpoint, options)).body;
+    }
+    if (method !== 'GET') {
+      try {
+        return (await this.send<T>(endpoint, options)).body;
+      } finally {
+        // A mutation may have landed even if the response never arrived
+        this.invalidate(resourceOf(endpoint));
+      }
+    }
+
+    const ttl = cacheTtl(endpoint);
+    if (!ttl) {
+      return (await this.sendShared<T>(endpoint, options)).body;
+    }
+
+    const cached = this.cache.get(endpoint);
+    if (cached && cached.expires > Date.now()) {
+      this.remember(endpoint, cached);
+      return structuredClone(cached.body) as T;
+    }
+
+    // Past its TTL, revalidate: an unchanged resource comes back as an empty 304
+    const conditional: Record<string, string> = {};
+    if (cached?.etag) {
+      conditional['If-None-Match'] = cached.etag;
+    }
+    if (cached?.lastModified) {
+      conditional['If-Modified-Since'] = cached.lastModified;
+    }
+
+    try {
+      const sent = await this.sendShared<T>(endpoint, {
+        ...options,
+        headers: { ...(options.headers as Record<string, string> | undefined), ...conditional },
+      });
+      const lifetime = responseTtl(sent.headers);
+
+      if (sent.status === 304) {
+        if (!cached) {
+          // Joined a revalidation whose cached copy has since been evicted
+          return (await this.send<T>(endpoint, options)).body;
+        }
+        this.remember(endpoint, { ...cached, expires: Date.now() + (lifetime ?? ttl) });
+        return structuredClone(cached.body) as T;
+      }
+
+      if (lifetime === null) {
+        this.cache.delete(endpoint);
+      } else {
+        this.remember(endpoint, {
+          body: structuredClone(sent.body),
+          expires: Date.now() + (lifetime ?? ttl),
+          etag: sent.headers.get('etag') ?? undefined,
+          lastModified: sent.headers.get('last-modified') ?? undefined,
+        });
+      }
+      return sent.body;
+    } catch (error) {
+      if (cached && error instanceof ApiError && error.status === 0) {
+        // Stale-while-error: the server is unreachable, so serve the expired copy
+        const stale = structuredClone(cached.body) as T;
+        if (stale && typeof stale === 'object') {
+          (stale as { stale?: boolean }).stale = true;
+        }
+        return stale;
+      }
+      throw error;
+    }
+  }
+
+  private remember(endpoint: string, entry: CacheEntry) {
+    this.cache.delete(endpoint);
+    this.cache.set(endpoint, entry);
+    if (this.cache.size > CACHE_MAX_ENTRIES) {
+      this.cache.delete(this.cache.keys().next().value as string);
+    }
+  }
+
+  private invalidate(resource: string) {
+    for (const key of [...this.cache.keys()]) {
+      if (resourceOf(key) === resource) {
+        this.cache.delete(key);
+      }
+    }
+    // GETs issued after the mutation must not join a fetch started before it
+    for (const key of [...this.inflight.keys()]) {
+      if (resourceOf(key) === resource) {
+        this.inflight.delete(key);
+      }
+    }
+  }
+
+  private sendShared<T>(endpoint: string, options: RequestInit): Promise<Sent<T>> {
+    // The caller's signal only detaches that caller; the shared fetch has its own
+    const { signal, ...fetchOptions } = options;
+    let shared = this.inflight.get(endpoint);
+    if (!shared) {
+      const controller = new AbortController();
+      const promise = this.send<T>(endpoint, { ...fetchOptions, signal: controller.signal }).finally(() => {
+        if (this.inflight.get(endpoint)?.controller === controller) {
+          this.inflight.delete(endpoint);
+        }
+      });
+      shared = { promise, controller, waiters: 0 };
+      this.inflight.set(endpoint, shared);
+    }
+    const fetching = shared;
+    fetching.waiters++;
+
+    return new Promise<Sent<T>>((resolve, reject) => {
+      let settled = false;
+      const settle = (finish: () => void) => {
+        if (!settled) {
+          settled = true;
+          fetching.waiters--;
+          signal?.removeEventListener('abort', onAbort);
+          finish();
+        }
+      };
+      const onAbort = () => settle(() => {
+        if (fetching.waiters === 0) {
+          fetching.controller.abort();
+        }
+        reject(signal?.reason ?? new DOMException('Aborted', 'AbortError'));
+      });
+
+      if (signal?.aborted) {
+        onAbort();
+        return;
+      }
+      signal?.addEventListener('abort', onAbort);
+      fetching.promise.then(
+        // Each caller gets its own copy, so nobody mutates a shared response
+        (sent) => settle(() => resolve({ ...sent, body: structuredClone(sent.body) as T })),
+        (error) => settle(() => reject(error)),
+      );
+    });
+  }
+
+  private async send<T>(endpoint: string, options: RequestInit): Promise<Sent<T>> {
+    const method = (options.method ?? 'GET').toUpperCase();
+    const attempts = IDEMPOTENT_METHODS.has(method) ? MAX_ATTEMPTS : 1;
+    const timeoutMs = method === 'GET' || method === 'HEAD' ? READ_TIMEOUT_MS : WRITE_TIMEOUT_MS;
+    
+    for (let attempt = 0; ; attempt++) {
+      try {
+        return await this.sendOnce<T>(endpoint, options, timeoutMs);
+      } catch (error) {
+        if (attempt + 1 >= attempts || !isRetryable(error) || options.signal?.aborted) {
+          throw error;
+        }
+        await retryDelay(attempt);
+      }
+    }
+  }
+
+  private async sendOnce<T>(endpoint: string, options: RequestInit, timeoutMs: number): Promise<Sent<T>> {
     const url = `${API_BASE_URL}${endpoint}`;
+    const { headers, signal, ...init } = options;
+    
+    // Each attempt gets its own deadline; the caller's signal still aborts it
+    const controller = new AbortController();
+    const timer = setTimeout(
+      () => controller.abort(new DOMException('Request timed out', 'TimeoutError')),
+      timeoutMs,
+    );
+    const onAbort = () => controller.abort(signal?.reason);
+    if (signal?.aborted) {
+      onAbort();
+    }
+    signal?.addEventListener('abort', onAbort);
     
     try {
       const response = await fetch(url, {
+        ...init,
+        signal: controller.signal,
         headers: {
-          'Content-Type': 'application/json',
-          ...options.headers,
+          // FormData needs the browser's multipart Content-Type and boundary
+          ...(init.body instanceof FormData ? { Accept: DEFAULT_HEADERS.Accept } : DEFAULT_HEADERS),
+          ...(headers as Record<string, string> | undefined),
         },
-        ...options,
       });
       
+      if (response.status === 304) {
+        return { body: undefined as T, status: 304, headers: response.headers };
+      }
+      
+      // The body can only be read once: take it as text, then parse
       if (!response.ok) {
+        const raw = await response.text();
         let errorMessage = `HTTP ${response.status}`;
         try {
-          const errorData = await response.json();
-          errorMessage = errorData.detail || errorData.message || errorMessage;
+          const errorData = JSON.parse(raw);
+          errorMessage = errorData.detail ?? errorData.message ?? errorMessage;
         } catch {
-          errorMessage = await response.text() || errorMessage;
+          errorMessage = raw || errorMessage;
         }
-        throw new ApiError(response.status, errorMessage);
+        throw new ApiError(response.status, errorMessage, raw);
       }
       
+      const sent = { status: response.status, headers: response.headers };
+      
       // Handle 204 No Content responses
       if (response.status === 204) {
-        return {} as T;
+        return { ...sent, body: {} as T };
       }
       
+      const raw = await response.text();
       const contentType = response.headers.get('content-type');
       if (contentType && contentType.includes('application/json')) {
-        return response.json();
+        return { ...sent, body: JSON.parse(raw) };
       }
       
-      return response.text() as unknown as T;
+      return { ...sent, body: raw as unknown as T };
     } catch (error) {
-      if (error instanceof ApiError) {
+      // Aborts are the caller's doing, not a server or network failure
+      if (error instanceof ApiError || (error instanceof DOMException && error.name === 'AbortError')) {
         throw error;
       }
       
+      if (error instanceof DOMException && error.name === 'TimeoutError') {
+        throw new ApiError(0, `Request timed out after ${timeoutMs / 1000}s`);
+      }
+      
       if (error instanceof TypeError && error.message.includes('fetch')) {
         throw new ApiError(0, 'Network error: Unable to connect to server');
       }
       
       throw new ApiError(0, `Request failed: ${error instanceof Error ? error.message : String(error)}`);
+    } finally {
+      clearTimeout(timer);
+      signal?.removeEventListener('abort', onAbort);
     }
   }
 
   // Health check
   async checkHealth(): Promise<{ status: string }> {
-    return this.request('/health');
+    return this.request('/health', GET);
+  }
+
+  // Shared, backoff-scheduled health updates; returns the unsubscribe function
+  subscribeHealth(callback: (health: HealthStatus) => void): () => void {
+    this.healthSubscribers.add(callback);
+    if (this.healthSubscribers.size === 1) {
+      document.addEventListener('visibilitychange', this.onVisibilityChange);
+      this.scheduleHealthPoll(0);
+    }
+    return () => {
+      this.healthSubscribers.delete(callback);
+      if (this.healthSubscribers.size === 0) {
+        document.removeEventListener('visibilitychange', this.onVisibilityChange);
+        this.clearHealthTimer();
+      }
+    };
+  }
+
+  private onVisibilityChange = () => {
+    if (document.hidden) {
+      this.clearHealthTimer();
+    } else {
+      this.scheduleHealthPoll(0);
+    }
+  };
+
+  private clearHealthTimer() {
+    if (this.healthTimer !== null) {
+      clearTimeout(this.healthTimer);
+      this.healthTimer = null;
+    }
+  }
+
+  private scheduleHealthPoll(delay: number) {
+    this.clearHealthTimer();
+    if (!document.hidden && this.healthSubscribers.size > 0) {
+      this.healthTimer = setTimeout(() => this.pollHealth(), delay);
+    }
+  }
+
+  private async pollHealth() {
+    this.healthTimer = null;
+    if (this.healthPolling) {
+      return; // The poll in progress reschedules itself
+    }
+    this.healthPolling = true;
+
+    let health: HealthStatus;
+    try {
+      const result = await this.checkHealth();
+      // A stale cached copy means the API could not be reached
+      if ((result as { stale?: boolean }).stale) {
+        throw new ApiError(0, 'API unreachable');
+      }
+      this.healthDelay = HEALTH_INTERVAL_MS;
+      health = { ...result, ok: true };
+    } catch {
+      this.healthDelay = Math.min(this.healthDelay * 2, HEALTH_MAX_INTERVAL_MS);
+      health = { status: 'down', ok: false };
+    } finally {
+      this.healthPolling = false;
+    }
+
+    this.healthSubscribers.forEach((callback) => callback(health));
+    this.scheduleHealthPoll(this.healthDelay);
   }
 
   // Account operations
-  async getAccounts(includeUsers: boolean = true): Promise<Account[]> {
-    return this.request(`/accounts?include_users=${includeUsers}`);
+  async getAccounts(includeUsers: boolean = true, options: { signal?: AbortSignal } = {}): Promise<Account[]> {
+    const endpoint = includeUsers ? ACCOUNTS_WITH_USERS : ACCOUNTS_WITHOUT_USERS;
+    return this.request(endpoint, options.signal ? { signal: options.signal } : GET);
   }
 
   async getAccount(id: number): Promise<Account> {
-    return this.request(`/accounts/${id}`);
+    return this.request(urls.account(id), GET);
+  }
+
+  // Several accounts with their users in one round trip; unknown ids are omitted
+  async getAccountsBatch(ids: number[]): Promise<Account[]> {
+    return this.request('/accounts/batch', {
+      method: 'POST',
+      body: JSON.stringify({ ids }),
+    });
   }
 
   async createAccount(formData: FormData): Promise<Account> {
     return this.request('/accounts', {
       method: 'POST',
       body: formData,
-      headers: {}, // Let browser set Content-Type for FormData
     });
   }
 
   async updateAccount(id: number, data: { active?: boolean }): Promise<Account> {
-    return this.request(`/accounts/${id}`, {
+    return this.request(urls.account(id), {
       method: 'PATCH',
       body: JSON.stringify(data),
     });
   }
 
   async deleteAccount(id: number): Promise<void> {
-    return this.request(`/accounts/${id}`, {
-      method: 'DELETE',
-    });
+    return this.request(urls.account(id), DELETE);
   }
 
   async syncAccountUsers(id: number): Promise<{ success: boolean; user_count: number; error?: string }> {
-    return this.request(`/accounts/${id}/sync`, {
-      method: 'POST',
-    });
+    return this.request(urls.accountSync(id), POST);
   }
 
   async getAccountUsers(id: number): Promise<User[]> {
-    return this.request(`/accounts/${id}/users`);
+    return this.request(urls.accountUsers(id), GET);
   }
 
   // Campaign operations
   async getCampaigns(): Promise<Campaign[]> {
-    return this.request('/campaigns');
+    return this.request('/campaigns', GET);
   }
 
   async getCampaign(id: number): Promise<Campaign> {
-    return this.request(`/campaigns/${id}`);
+    return this.request(urls.campaign(id), GET);
   }
 
+  // Multipart, so the recipients file streams from its Blob instead of
+  // being read into a JS string and then copied again into a JSON body
   async createCampaign(data: CreateCampaignRequest): Promise<Campaign> {
-    return this.request('/campaigns', {
+    const formData = new FormData();
+    formData.append('name', data.name);
+    formData.append('from_name', data.from_name);
+    formData.append('from_email', data.from_email);
+    formData.append('subject', data.subject);
+    formData.append('html_body', data.html_body);
+    // append() takes a filename only with a Blob; pasted CSV text is wrapped
+    const recipients = typeof data.recipients_csv === 'string'
+      ? new Blob([data.recipients_csv], { type: 'text/csv' })
+      : data.recipients_csv;
+    formData.append('recipients_csv', recipients, 'recipients.csv');
+    // Structured options travel as JSON-encoded form fields
+    if (data.custom_headers) {
+      formData.append('custom_headers', JSON.stringify(data.custom_headers));
+    }
+    if (data.selected_accounts) {
+      formData.append('selected_accounts', JSON.stringify(data.selected_accounts));
+    }
+    if (data.test_email) {
+      formData.append('test_email', data.test_email);
+    }
+    if (data.send_rate_per_minute !== undefined) {
+      formData.append('send_rate_per_minute', String(data.send_rate_per_minute));
+    }
+    return this.request('/campaigns/upload', {
       method: 'POST',
-      body: JSON.stringify(data),
+      body: formData,
     });
   }
 
   async startCampaign(id: number): Promise<void> {
-    return this.request(`/campaigns/${id}/send`, {
-      method: 'POST',
-    });
+    return startCampaignLimiter(() => this.request(urls.campaignSend(id), POST));
   }
 
   async pauseCampaign(id: number): Promise<void> {
-    return this.request(`/campaigns/${id}/pause`, {
-      method: 'POST',
-    });
+    return this.request(urls.campaignPause(id), POST);
   }
 }
 
 // Types
+export interface HealthStatus {
+  status: string;
+  ok: boolean;
+}
+
 export interface Account {
   id: number;
   name: string;
@@ -195,7 +621,11 @@ export interface CreateCampaignRequest {
   from_email: string;
   subject: string;
   html_body: string;
-  recipients_csv: string;
+  recipients_csv: string | Blob; // CSV text, or e.g. the File from an <input type="file">
+  custom_headers?: Record<string, string>;
+  test_email?: string;
+  selected_accounts?: number[];
+  send_rate_per_minute?: number;
 }
 
 export { ApiError };
@@ -203,10 +633,11 @@ export const api = new ApiService();
 export default api;
 '''
     
-    with open(api_file, 'w', encoding='utf-8') as f:
-        f.write(new_api_content)
+    if not write_if_changed(api_file, new_api_content):
+        report("✅ API service already up to date")
+        return True
     
-    print("✅ Fixed API service with proper error handling")
+    report("✅ Fixed API service with proper error handling")
     return True
 
 def fix_accounts_view():
@@ -214,11 +645,11 @@ def fix_accounts_view():
     accounts_file = Path("components/views/AccountsView.tsx")
     
     if not accounts_file.exists():
-        print("❌ AccountsView.tsx not found!")
+        report("❌ AccountsView.tsx not found!")
         return False
     
     # Create improved AccountsView
-    new_accounts_content = '''import React, { useState, useEffect } from 'react';
+    new_accounts_content = '''import React, { useState, useEffect, useRef, useMemo } from 'react';
 import { api, Account, User, ApiError } from '../../services/api';
 import { useToast } from '../../contexts/ToastContext';
 import Button from '../ui/Button';
@@ -227,14 +658,155 @@ import Badge from '../ui/Badge';
 import Dialog from '../ui/Dialog';
 import Input from '../ui/Input';
 import { TrashIcon, UsersIcon, PlusIcon } from '../icons';
+import { createLimiter } from '../../utils/limit';
+import { debug } from '../../utils/debug';
 
-const AccountsView: React.FC = () => {
-  const [accounts, setAccounts] = useState<Account[]>([]);
-  const [loading, setLoading] = useState(true);
-  const [error, setError] = useState<string | null>(null);
-  const [showAddDialog, setShowAddDialog] = useState(false);
-  const [selectedAccount, setSelectedAccount] = useState<Account | null>(null);
-  const [showUsersDialog, setShowUsersDialog] = useState(false);
+// Per-account fetches within this window go out as one /accounts/batch request
+const BATCH_WINDOW_MS = 20;
+
+// Quiet period after the last account action before the list is re-fetched
+const REVALIDATE_DELAY_MS = 5000;
+
+// Each sync walks a Workspace directory server-side; cap how many run and start at once
+const syncLimiter = createLimiter(3, { count: 10, intervalMs: 1000 });
+
+// Built once per tab: each toLocaleDateString call repeats the locale lookup
+const SYNC_DATE_FORMAT = new Intl.DateTimeFormat(undefined, { dateStyle: 'medium' });
+// last_sync_at -> label; a timestamp is parsed and formatted once, not per render
+const syncLabels = new Map<string, string>();
+const SYNC_LABELS_MAX = 1024;
+
+function syncLabel(lastSyncAt: string): string {
+  let label = syncLabels.get(lastSyncAt);
+  if (label === undefined) {
+    if (syncLabels.size >= SYNC_LABELS_MAX) {
+      syncLabels.clear();
+    }
+    label = SYNC_DATE_FORMAT.format(new Date(lastSyncAt));
+    syncLabels.set(lastSyncAt, label);
+  }
+  return label;
+}
+
+// Accounts keyed by id in server order, so one account is found and replaced
+// without scanning the list or rebuilding every other row's object
+type AccountMap = Map<number, Account>;
+
+function toAccountMap(accounts: Account[]): AccountMap {
+  return new Map(accounts.map((account) => [account.id, account]));
+}
+
+// Copy-on-write: a new Map for React, the other Account objects shared
+function withAccount(accounts: AccountMap, id: number, update: (account: Account) => Account): AccountMap {
+  const current = accounts.get(id);
+  if (!current) {
+    return accounts;
+  }
+  return new Map(accounts).set(id, update(current));
+}
+
+type AccountWaiter = {
+  resolve: (account: Account | undefined) => void;
+  reject: (error: unknown) => void;
+};
+
+interface AccountRowProps {
+  account: Account;
+  onShowUsers: (account: Account) => void;
+  onSync: (accountId: number) => void;
+  onToggleActive: (accountId: number, currentActive: boolean) => void;
+  onDelete: (accountId: number, accountName: string) => void;
+}
+
+// Off-screen rows skip layout and paint until scrolled near; until first
+// rendered they hold a 160px placeholder so the scrollbar stays stable
+const ROW_STYLE: React.CSSProperties = { contentVisibility: 'auto', containIntrinsicSize: 'auto 160px' };
+
+// Re-renders only when a displayed field changes. The handlers only use their
+// arguments and state setters, so an older render's handlers stay correct
+const AccountRow = React.memo(
+  ({ account, onShowUsers, onSync, onToggleActive, onDelete }: AccountRowProps) => (
+    <div style={ROW_STYLE}>
+      <Card className="p-6">
+        <div className="flex justify-between items-start">
+          <div className="flex-1">
+            <div className="flex items-center space-x-3 mb-2">
+              <h3 className="text-lg font-semibold">{account.name}</h3>
+              <Badge variant={account.active ? 'success' : 'secondary'}>
+                {account.active ? 'Active' : 'Inactive'}
+              </Badge>
+            </div>
+          
+            <p className="text-gray-600 mb-2">
+              <strong>Admin Email:</strong> {account.admin_email}
+            </p>
+          
+            <div className="flex items-center space-x-4 text-sm text-gray-500">
+              <span>👥 {account.user_count} users</span>
+              <span>📧 {account.daily_quota}/day quota</span>
+              <span>⏰ {account.hourly_quota}/hour quota</span>
+              {account.last_sync_at && (
+                <span>🔄 Last sync: {syncLabel(account.last_sync_at)}</span>
+              )}
+            </div>
+          </div>
+        
+          <div className="flex space-x-2 ml-4">
+            <Button
+              size="sm"
+              variant="outline"
+              onClick={() => onShowUsers(account)}
+              className="flex items-center space-x-1"
+            >
+              <UsersIcon className="w-4 h-4" />
+              <span>Users</span>
+            </Button>
+          
+            <Button
+              size="sm"
+              variant="outline"
+              onClick={() => onSync(account.id)}
+            >
+              Sync
+            </Button>
+          
+            <Button
+              size="sm"
+              variant={account.active ? "outline" : "primary"}
+              onClick={() => onToggleActive(account.id, account.active)}
+            >
+              {account.active ? 'Deactivate' : 'Activate'}
+            </Button>
+          
+            <Button
+              size="sm"
+              variant="destructive"
+              onClick={() => onDelete(account.id, account.name)}
+              className="flex items-center space-x-1"
+            >
+              <TrashIcon className="w-4 h-4" />
+            </Button>
+          </div>
+        </div>
+      </Card>
+    </div>
+  ),
+  (prev, next) =>
+    prev.account.id === next.account.id &&
+    prev.account.name === next.account.name &&
+    prev.account.admin_email === next.account.admin_email &&
+    prev.account.active === next.account.active &&
+    prev.account.user_count === next.account.user_count &&
+    prev.account.daily_quota === next.account.daily_quota &&
+    prev.account.hourly_quota === next.account.hourly_quota &&
+    prev.account.last_sync_at === next.account.last_sync_at,
+);
+
+// Owns the form state, so typing re-renders only the form, not the accounts list
+const AddAccountForm: React.FC<{ onCreated: (account: Account) => void; onCancel: () => void }> = ({
+  onCreated,
+  onCancel,
+}) => {
   const { showToast } = useToast();
 
   // Add account form state
@@ -244,34 +816,6 @@ const AccountsView: React.FC = () => {
     json_file: null as File | null
   });
 
-  useEffect(() => {
-    loadAccounts();
-  }, []);
-
-  const loadAccounts = async () => {
-    try {
-      setLoading(true);
-      setError(null);
-      console.log('Loading accounts...');
-      
-      const accountsData = await api.getAccounts(true);
-      console.log('Loaded accounts:', accountsData);
-      
-      setAccounts(accountsData);
-      showToast('Accounts loaded successfully', 'success');
-    } catch (error) {
-      console.error('Error loading accounts:', error);
-      const errorMessage = error instanceof ApiError 
-        ? error.message 
-        : 'Failed to load accounts. Please check if the server is running.';
-      
-      setError(errorMessage);
-      showToast(errorMessage, 'error');
-    } finally {
-      setLoading(false);
-    }
-  };
-
   const handleAddAccount = async () => {
     if (!addForm.name || !addForm.admin_email || !addForm.json_file) {
       showToast('Please fill all fields and select a JSON file', 'error');
@@ -284,15 +828,14 @@ const AccountsView: React.FC = () => {
       formData.append('admin_email', addForm.admin_email);
       formData.append('json_file', addForm.json_file);
 
-      console.log('Creating account...');
-      await api.createAccount(formData);
+      debug('Creating account...');
+      const created = await api.createAccount(formData);
       
       showToast('Account created successfully!', 'success');
-      setShowAddDialog(false);
       setAddForm({ name: '', admin_email: '', json_file: null });
-      loadAccounts(); // Reload accounts
+      onCreated(created);
     } catch (error) {
-      console.error('Error creating account:', error);
+      console.error('Error creating account:', error instanceof Error ? error.message : error);
       const errorMessage = error instanceof ApiError 
         ? error.message 
         : 'Failed to create account';
@@ -301,19 +844,245 @@ const AccountsView: React.FC = () => {
     }
   };
 
+  return (
+    <div className="space-y-4">
+      <h2 className="text-xl font-bold">Add New Account</h2>
+      
+      <div>
+        <label className="block text-sm font-medium mb-1">Account Name</label>
+        <Input
+          value={addForm.name}
+          onChange={(e) => setAddForm({ ...addForm, name: e.target.value })}
+          placeholder="e.g., Marketing Account"
+        />
+      </div>
+      
+      <div>
+        <label className="block text-sm font-medium mb-1">Admin Email</label>
+        <Input
+          type="email"
+          value={addForm.admin_email}
+          onChange={(e) => setAddForm({ ...addForm, admin_email: e.target.value })}
+          placeholder="admin@yourdomain.com"
+        />
+      </div>
+      
+      <div>
+        <label className="block text-sm font-medium mb-1">Service Account JSON</label>
+        <input
+          type="file"
+          accept=".json"
+          onChange={(e) => setAddForm({ ...addForm, json_file: e.target.files?.[0] || null })}
+          className="w-full"
+        />
+      </div>
+      
+      <div className="flex space-x-2 pt-4">
+        <Button onClick={handleAddAccount} className="flex-1">
+          Add Account
+        </Button>
+        <Button variant="outline" onClick={onCancel}>
+          Cancel
+        </Button>
+      </div>
+    </div>
+  );
+};
+
+const NO_USERS: User[] = [];
+
+// Re-renders only when the account's users array is replaced (i.e. re-fetched),
+// not on dialog toggles or other parent state changes
+const UserList = React.memo(({ users }: { users: User[] }) => (
+  <>
+    {users.length > 0 ? (
+      <div className="max-h-96 overflow-y-auto space-y-2">
+        {users.map((user) => (
+          <div key={user.id} className="border rounded p-3">
+            <div className="flex justify-between items-center">
+              <div>
+                <p className="font-medium">{user.name}</p>
+                <p className="text-sm text-gray-600">{user.email}</p>
+              </div>
+              <Badge variant={user.status === 'Active' ? 'success' : 'secondary'}>
+                {user.status}
+              </Badge>
+            </div>
+            <div className="text-xs text-gray-500 mt-1">
+              Daily: {user.daily_sent_count} | Hourly: {user.hourly_sent_count}
+            </div>
+          </div>
+        ))}
+      </div>
+    ) : (
+      <p className="text-gray-500 text-center py-4">
+        No users found. Try syncing the account.
+      </p>
+    )}
+  </>
+));
+
+const AccountsView: React.FC = () => {
+  const [accounts, setAccounts] = useState<AccountMap>(() => new Map());
+  const accountList = useMemo(() => Array.from(accounts.values()), [accounts]);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState<string | null>(null);
+  const [showAddDialog, setShowAddDialog] = useState(false);
+  const [selectedAccount, setSelectedAccount] = useState<Account | null>(null);
+  const [showUsersDialog, setShowUsersDialog] = useState(false);
+  const { showToast } = useToast();
+
+  // Account id -> callers waiting on the next batch flush
+  const pendingFetches = useRef(new Map<number, AccountWaiter[]>());
+  const flushTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+  const revalidateTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+  // The running loadAccounts request, aborted when superseded or on unmount
+  const loadController = useRef<AbortController | null>(null);
+
+  useEffect(() => {
+    loadAccounts();
+    return () => {
+      loadController.current?.abort();
+      if (revalidateTimer.current !== null) {
+        clearTimeout(revalidateTimer.current);
+      }
+    };
+  }, []);
+
+  const flushAccountFetches = async () => {
+    flushTimer.current = null;
+    const waiting = pendingFetches.current;
+    pendingFetches.current = new Map();
+
+    try {
+      const fetched = await api.getAccountsBatch([...waiting.keys()]);
+      const byId = new Map(fetched.map((account) => [account.id, account]));
+      waiting.forEach((waiters, id) => waiters.forEach(({ resolve }) => resolve(byId.get(id))));
+    } catch (error) {
+      waiting.forEach((waiters) => waiters.forEach(({ reject }) => reject(error)));
+    }
+  };
+
+  // Fresh copy of one account with its users; resolves undefined if it no longer exists
+  const fetchAccount = (id: number): Promise<Account | undefined> =>
+    new Promise((resolve, reject) => {
+      const waiters = pendingFetches.current.get(id) ?? [];
+      waiters.push({ resolve, reject });
+      pendingFetches.current.set(id, waiters);
+      if (flushTimer.current === null) {
+        flushTimer.current = setTimeout(flushAccountFetches, BATCH_WINDOW_MS);
+      }
+    });
+
+  const replaceAccount = (account: Account) => {
+    setAccounts((current) => withAccount(current, account.id, () => account));
+  };
+
+  const patchAccount = (id: number, patch: Partial<Account>) => {
+    setAccounts((current) => withAccount(current, id, (account) => ({ ...account, ...patch })));
+  };
+
+  // Mutations patch local state; the server copy is re-fetched once actions
+  // have been quiet for REVALIDATE_DELAY_MS, without the loading screen
+  const scheduleRevalidate = () => {
+    if (revalidateTimer.current !== null) {
+      clearTimeout(revalidateTimer.current);
+    }
+    revalidateTimer.current = setTimeout(async () => {
+      revalidateTimer.current = null;
+      try {
+        setAccounts(toAccountMap(await api.getAccounts(true)));
+      } catch (error) {
+        console.error('Error revalidating accounts:', error instanceof Error ? error.message : error);
+      }
+    }, REVALIDATE_DELAY_MS);
+  };
+
+  // Apply the change right away and undo it if the request fails
+  const mutateOptimistically = async (
+    apply: (accounts: AccountMap) => AccountMap,
+    revert: (accounts: AccountMap) => AccountMap,
+    mutation: () => Promise<unknown>,
+  ) => {
+    setAccounts(apply);
+    try {
+      await mutation();
+    } catch (error) {
+      setAccounts(revert);
+      throw error;
+    } finally {
+      scheduleRevalidate();
+    }
+  };
+
+  const loadAccounts = async () => {
+    loadController.current?.abort();
+    const controller = new AbortController();
+    loadController.current = controller;
+
+    try {
+      setLoading(true);
+      setError(null);
+      debug('Loading accounts...');
+      
+      const accountsData = await api.getAccounts(true, { signal: controller.signal });
+      debug(`Loaded ${accountsData.length} accounts`);
+      
+      setAccounts(toAccountMap(accountsData));
+      showToast('Accounts loaded successfully', 'success');
+    } catch (error) {
+      if (controller.signal.aborted) {
+        return; // Superseded by a newer load, or the view unmounted
+      }
+      console.error('Error loading accounts:', error instanceof Error ? error.message : error);
+      const errorMessage = error instanceof ApiError 
+        ? error.message 
+        : 'Failed to load accounts. Please check if the server is running.';
+      
+      setError(errorMessage);
+      showToast(errorMessage, 'error');
+    } finally {
+      if (loadController.current === controller) {
+        setLoading(false);
+      }
+    }
+  };
+
+  const handleAccountCreated = (created: Account) => {
+    setShowAddDialog(false);
+    setAccounts((current) => new Map(current).set(created.id, { ...created, users: [] }));
+    scheduleRevalidate();
+  };
+
   const handleDeleteAccount = async (accountId: number, accountName: string) => {
     if (!confirm(`Are you sure you want to delete account "${accountName}"? This action cannot be undone.`)) {
       return;
     }
 
+    // Taken from the state being patched, not this render's accounts
+    let removed: Account | undefined;
     try {
-      console.log(`Deleting account ${accountId}...`);
-      await api.deleteAccount(accountId);
+      debug(`Deleting account ${accountId}...`);
+      await mutateOptimistically(
+        (current) => {
+          removed = current.get(accountId);
+          if (!removed) {
+            return current;
+          }
+          const next = new Map(current);
+          next.delete(accountId);
+          return next;
+        },
+        (current) =>
+          removed && !current.has(accountId)
+            ? new Map([...current, [accountId, removed] as const].sort(([a], [b]) => a - b))
+            : current,
+        () => api.deleteAccount(accountId),
+      );
       
       showToast('Account deleted successfully!', 'success');
-      loadAccounts(); // Reload accounts
     } catch (error) {
-      console.error('Error deleting account:', error);
+      console.error('Error deleting account:', error instanceof Error ? error.message : error);
       const errorMessage = error instanceof ApiError 
         ? error.message 
         : 'Failed to delete account';
@@ -324,17 +1093,19 @@ const AccountsView: React.FC = () => {
 
   const handleSyncUsers = async (accountId: number) => {
     try {
-      console.log(`Syncing users for account ${accountId}...`);
-      const result = await api.syncAccountUsers(accountId);
+      debug(`Syncing users for account ${accountId}...`);
+      const result = await syncLimiter(() => api.syncAccountUsers(accountId));
       
       if (result.success) {
         showToast(`Successfully synced ${result.user_count} users!`, 'success');
-        loadAccounts(); // Reload to see updated user counts
+        // The synced users themselves arrive with the background revalidation
+        patchAccount(accountId, { user_count: result.user_count, last_sync_at: new Date().toISOString() });
+        scheduleRevalidate();
       } else {
         showToast(`Sync failed: ${result.error}`, 'error');
       }
     } catch (error) {
-      console.error('Error syncing users:', error);
+      console.error('Error syncing users:', error instanceof Error ? error.message : error);
       const errorMessage = error instanceof ApiError 
         ? error.message 
         : 'Failed to sync users';
@@ -345,13 +1116,16 @@ const AccountsView: React.FC = () => {
 
   const handleToggleActive = async (accountId: number, currentActive: boolean) => {
     try {
-      console.log(`Toggling account ${accountId} active status...`);
-      await api.updateAccount(accountId, { active: !currentActive });
+      debug(`Toggling account ${accountId} active status...`);
+      await mutateOptimistically(
+        (current) => withAccount(current, accountId, (a) => ({ ...a, active: !currentActive })),
+        (current) => withAccount(current, accountId, (a) => ({ ...a, active: currentActive })),
+        () => api.updateAccount(accountId, { active: !currentActive }),
+      );
       
       showToast(`Account ${!currentActive ? 'activated' : 'deactivated'}!`, 'success');
-      loadAccounts(); // Reload accounts
     } catch (error) {
-      console.error('Error updating account:', error);
+      console.error('Error updating account:', error instanceof Error ? error.message : error);
       const errorMessage = error instanceof ApiError 
         ? error.message 
         : 'Failed to update account';
@@ -360,9 +1134,20 @@ const AccountsView: React.FC = () => {
     }
   };
 
-  const showUsersDetails = (account: Account) => {
+  const showUsersDetails = async (account: Account) => {
     setSelectedAccount(account);
     setShowUsersDialog(true);
+
+    // Show the listed users right away, then swap in the current ones
+    try {
+      const fresh = await fetchAccount(account.id);
+      if (fresh) {
+        replaceAccount(fresh);
+        setSelectedAccount((current) => (current?.id === fresh.id ? fresh : current));
+      }
+    } catch (error) {
+      console.error('Error refreshing account users:', error instanceof Error ? error.message : error);
+    }
   };
 
   if (loading) {
@@ -392,7 +1177,7 @@ const AccountsView: React.FC = () => {
         </Button>
       </div>
 
-      {accounts.length === 0 ? (
+      {accountList.length === 0 ? (
         <Card className="text-center py-8">
           <div className="text-gray-500">
             <p className="text-lg mb-2">No accounts found</p>
@@ -401,116 +1186,22 @@ const AccountsView: React.FC = () => {
         </Card>
       ) : (
         <div className="grid gap-4">
-          {accounts.map((account) => (
-            <Card key={account.id} className="p-6">
-              <div className="flex justify-between items-start">
-                <div className="flex-1">
-                  <div className="flex items-center space-x-3 mb-2">
-                    <h3 className="text-lg font-semibold">{account.name}</h3>
-                    <Badge variant={account.active ? 'success' : 'secondary'}>
-                      {account.active ? 'Active' : 'Inactive'}
-                    </Badge>
-                  </div>
-                  
-                  <p className="text-gray-600 mb-2">
-                    <strong>Admin Email:</strong> {account.admin_email}
-                  </p>
-                  
-                  <div className="flex items-center space-x-4 text-sm text-gray-500">
-                    <span>👥 {account.user_count} users</span>
-                    <span>📧 {account.daily_quota}/day quota</span>
-                    <span>⏰ {account.hourly_quota}/hour quota</span>
-                    {account.last_sync_at && (
-                      <span>🔄 Last sync: {new Date(account.last_sync_at).toLocaleDateString()}</span>
-                    )}
-                  </div>
-                </div>
-                
-                <div className="flex space-x-2 ml-4">
-                  <Button
-                    size="sm"
-                    variant="outline"
-                    onClick={() => showUsersDetails(account)}
-                    className="flex items-center space-x-1"
-                  >
-                    <UsersIcon className="w-4 h-4" />
-                    <span>Users</span>
-                  </Button>
-                  
-                  <Button
-                    size="sm"
-                    variant="outline"
-                    onClick={() => handleSyncUsers(account.id)}
-                  >
-                    Sync
-                  </Button>
-                  
-                  <Button
-                    size="sm"
-                    variant={account.active ? "outline" : "primary"}
-                    onClick={() => handleToggleActive(account.id, account.active)}
-                  >
-                    {account.active ? 'Deactivate' : 'Activate'}
-                  </Button>
-                  
-                  <Button
-                    size="sm"
-                    variant="destructive"
-                    onClick={() => handleDeleteAccount(account.id, account.name)}
-                    className="flex items-center space-x-1"
-                  >
-                    <TrashIcon className="w-4 h-4" />
-                  </Button>
-                </div>
-              </div>
-            </Card>
+          {accountList.map((account) => (
+            <AccountRow
+              key={account.id}
+              account={account}
+              onShowUsers={showUsersDetails}
+              onSync={handleSyncUsers}
+              onToggleActive={handleToggleActive}
+              onDelete={handleDeleteAccount}
+            />
           ))}
         </div>
       )}
 
       {/* Add Account Dialog */}
       <Dialog isOpen={showAddDialog} onClose={() => setShowAddDialog(false)}>
-        <div className="space-y-4">
-          <h2 className="text-xl font-bold">Add New Account</h2>
-          
-          <div>
-            <label className="block text-sm font-medium mb-1">Account Name</label>
-            <Input
-              value={addForm.name}
-              onChange={(e) => setAddForm({ ...addForm, name: e.target.value })}
-              placeholder="e.g., Marketing Account"
-            />
-          </div>
-          
-          <div>
-            <label className="block text-sm font-medium mb-1">Admin Email</label>
-            <Input
-              type="email"
-              value={addForm.admin_email}
-              onChange={(e) => setAddForm({ ...addForm, admin_email: e.target.value })}
-              placeholder="admin@yourdomain.com"
-            />
-          </div>
-          
-          <div>
-            <label className="block text-sm font-medium mb-1">Service Account JSON</label>
-            <input
-              type="file"
-              accept=".json"
-              onChange={(e) => setAddForm({ ...addForm, json_file: e.target.files?.[0] || null })}
-              className="w-full"
-            />
-          </div>
-          
-          <div className="flex space-x-2 pt-4">
-            <Button onClick={handleAddAccount} className="flex-1">
-              Add Account
-            </Button>
-            <Button variant="outline" onClick={() => setShowAddDialog(false)}>
-              Cancel
-            </Button>
-          </div>
-        </div>
+        <AddAccountForm onCreated={handleAccountCreated} onCancel={() => setShowAddDialog(false)} />
       </Dialog>
 
       {/* Users Dialog */}
@@ -520,30 +1211,7 @@ const AccountsView: React.FC = () => {
             Users for {selectedAccount?.name}
           </h2>
           
-          {selectedAccount?.users && selectedAccount.users.length > 0 ? (
-            <div className="max-h-96 overflow-y-auto space-y-2">
-              {selectedAccount.users.map((user) => (
-                <div key={user.id} className="border rounded p-3">
-                  <div className="flex justify-between items-center">
-                    <div>
-                      <p className="font-medium">{user.name}</p>
-                      <p className="text-sm text-gray-600">{user.email}</p>
-                    </div>
-                    <Badge variant={user.status === 'Active' ? 'success' : 'secondary'}>
-                      {user.status}
-                    </Badge>
-                  </div>
-                  <div className="text-xs text-gray-500 mt-1">
-                    Daily: {user.daily_sent_count} | Hourly: {user.hourly_sent_count}
-                  </div>
-                </div>
-              ))}
-            </div>
-          ) : (
-            <p className="text-gray-500 text-center py-4">
-              No users found. Try syncing the account.
-            </p>
-          )}
+          <UserList users={selectedAccount?.users ?? NO_USERS} />
           
           <Button variant="outline" onClick={() => setShowUsersDialog(false)} className="w-full">
             Close
@@ -557,18 +1225,21 @@ const AccountsView: React.FC = () => {
 export default AccountsView;
 '''
     
-    with open(accounts_file, 'w', encoding='utf-8') as f:
-        f.write(new_accounts_content)
+    if not write_if_changed(accounts_file, new_accounts_content):
+        report("✅ AccountsView already up to date")
+        return True
     
-    print("✅ Fixed AccountsView with proper error handling and user experience")
+    report("✅ Fixed AccountsView with proper error handling and user experience")
     return True
 
 def main():
     print("🎨 Frontend Fixes for Speed-Send")
     print("=" * 40)
     
-    fix_api_service()
-    fix_accounts_view()
+    # The two fixers write different files, so run them side by side
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for fixer in [pool.submit(fix_api_service), pool.submit(fix_accounts_view)]:
+            fixer.result()
     
     print("\n✅ Frontend fixes applied!")
     print("\nWhat was fixed:")
@@ -2,14 +2,30 @@
 """
 Test script for account operations
 """
+import atexit
+import sys
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 API_BASE = "http://localhost:8000/api/v1"
 
+# (connect, read) seconds, so a wedged backend fails the check instead of hanging it
+TIMEOUT = (2, 10)
+
+# One keep-alive connection pool for every call instead of a new TCP connection per request;
+# idempotent calls are retried on gateway errors while the backend is still starting
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])))
+atexit.register(SESSION.close)
+
 def test_api_health():
     try:
-        response = requests.get(f"{API_BASE}/health")
+        response = SESSION.get(f"{API_BASE}/health", timeout=TIMEOUT)
         print(f"API Health: {response.status_code}")
         return response.status_code == 200
     except Exception as e:
@@ -18,7 +34,7 @@ def test_api_health():
 
 def test_get_accounts():
     try:
-        response = requests.get(f"{API_BASE}/accounts")
+        response = SESSION.get(f"{API_BASE}/accounts", timeout=TIMEOUT)
         print(f"Get Accounts: {response.status_code}")
         if response.status_code == 200:
             accounts = response.json()
@@ -32,13 +48,26 @@ def test_get_accounts():
 
 def test_delete_account(account_id):
     try:
-        response = requests.delete(f"{API_BASE}/accounts/{account_id}")
+        response = SESSION.delete(f"{API_BASE}/accounts/{account_id}", timeout=TIMEOUT)
         print(f"Delete Account {account_id}: {response.status_code}")
         return response.status_code == 204
     except Exception as e:
         print(f"Delete Account Failed: {e}")
         return False
 
+def test_delete_accounts(account_ids):
+    """One batch-delete request; older backends without it get concurrent per-id deletes"""
+    try:
+        response = SESSION.post(f"{API_BASE}/accounts/batch-delete", json={"ids": list(account_ids)}, timeout=TIMEOUT)
+        if response.status_code not in (404, 405):
+            print(f"Batch Delete Accounts: {response.status_code}")
+            return response.status_code == 200
+    except Exception as e:
+        print(f"Batch Delete Accounts Failed: {e}")
+        return False
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return all(executor.map(test_delete_account, account_ids))
+
 if __name__ == "__main__":
     print("🧪 Testing Speed-Send API...")
     
@@ -49,6 +78,13 @@ if __name__ == "__main__":
             print("\n📊 Account Details:")
             for acc in accounts:
                 print(f"  - {acc.get('name')} (ID: {acc.get('id')}) - Users: {acc.get('user_count', 0)}")
+
+            # --cleanup deletes every listed account in one batch request
+            if "--cleanup" in sys.argv[1:]:
+                if test_delete_accounts([acc.get('id') for acc in accounts]):
+                    print("🧹 Deleted all listed accounts")
+                else:
+                    print("❌ Account cleanup failed")
         else:
             print("No accounts found or API error")
     else:
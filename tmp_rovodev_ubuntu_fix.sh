@@ -29,17 +29,20 @@ if ! command -v docker-compose &> /dev/null; then
     sudo chmod +x /usr/local/bin/docker-compose
 fi
 
-# Clean up any existing containers
-echo "Cleaning up existing containers..."
-sudo docker system prune -f
+# Pruning discards the build cache and base layers the next build needs,
+# so it only runs when asked for: ./tmp_rovodev_ubuntu_fix.sh --prune
+if [ "${1:-}" = "--prune" ]; then
+    echo "Cleaning up existing containers..."
+    sudo docker system prune -f
+fi
 
-# Build and start services
+# Build and start services (unchanged layers come from the build cache)
 echo "Building and starting services..."
 sudo docker-compose up --build -d
 
-# Wait for database
+# Wait for database; the readiness loop runs inside the db container
 echo "Waiting for database to be ready..."
-sleep 30
+sudo docker-compose exec -T db sh -c 'until pg_isready -q -U "$POSTGRES_USER" -d "$POSTGRES_DB"; do sleep 0.25; done'
 
 # Run database migrations
 echo "Running database migrations..."
@@ -0,0 +1,4 @@
+// Development-only breadcrumbs: a no-op in production builds, so request
+// payloads are neither formatted nor retained by an open DevTools console
+export const debug: (...args: unknown[]) => void =
+  process.env.NODE_ENV === 'production' ? () => {} : console.log.bind(console);
@@ -0,0 +1,55 @@
+// Concurrency and rate limiting for fan-out over accounts, users and campaigns
+
+export interface RateWindow {
+  count: number;
+  intervalMs: number;
+}
+
+export type Limiter = <T>(task: () => Promise<T>) => Promise<T>;
+
+// Runs at most maxConcurrent tasks at once, in FIFO order; with perInterval,
+// also starts at most perInterval.count tasks in any sliding intervalMs window
+export function createLimiter(maxConcurrent: number, perInterval?: RateWindow): Limiter {
+  const queue: (() => void)[] = [];
+  const starts: number[] = []; // start times within the window, oldest first
+  let active = 0;
+  let timer: ReturnType<typeof setTimeout> | null = null;
+
+  const drain = () => {
+    while (queue.length > 0 && active < maxConcurrent) {
+      if (perInterval) {
+        const now = Date.now();
+        while (starts.length > 0 && starts[0] <= now - perInterval.intervalMs) {
+          starts.shift();
+        }
+        if (starts.length >= perInterval.count) {
+          // Window full: resume when its oldest start falls out of it
+          if (timer === null) {
+            timer = setTimeout(() => {
+              timer = null;
+              drain();
+            }, starts[0] + perInterval.intervalMs - now);
+          }
+          return;
+        }
+        starts.push(now);
+      }
+      active++;
+      queue.shift()!();
+    }
+  };
+
+  return <T>(task: () => Promise<T>): Promise<T> =>
+    new Promise<T>((resolve, reject) => {
+      queue.push(() => {
+        Promise.resolve()
+          .then(task)
+          .then(resolve, reject)
+          .finally(() => {
+            active--;
+            drain();
+          });
+      });
+      drain();
+    });
+}
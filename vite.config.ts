@@ -17,6 +17,12 @@ export default defineConfig(({ mode }) => {
         }
       },
       plugins: [react()],
+      esbuild: {
+        // Production bundles lose console.log breadcrumbs and debugger statements;
+        // console.error is kept
+        pure: mode === 'production' ? ['console.log'] : [],
+        drop: mode === 'production' ? ['debugger'] : [],
+      },
       define: {
         'process.env.API_KEY': JSON.stringify(env.GEMINI_API_KEY),
         'process.env.GEMINI_API_KEY': JSON.stringify(env.GEMINI_API_KEY)